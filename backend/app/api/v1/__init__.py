@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from app.api.v1 import stores, orders, analytics, optimization
+from app.api.v1 import stores, orders, analytics, optimization, tiles
 
 router = APIRouter()
 
@@ -8,3 +8,4 @@ router.include_router(stores.router, prefix="/stores", tags=["stores"])
 router.include_router(orders.router, prefix="/orders", tags=["orders"])
 router.include_router(analytics.router, prefix="/analytics", tags=["analytics"])
 router.include_router(optimization.router, prefix="/optimization", tags=["optimization"])
+router.include_router(tiles.router, prefix="/tiles", tags=["tiles"])
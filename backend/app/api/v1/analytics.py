@@ -1,6 +1,19 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from pydantic import BaseModel
 from typing import List, Dict, Any
+from datetime import date, datetime
+
+from app.core.cache import bump_data_version, cached
+from app.core.compression import compress, negotiate_encoding
+from app.services.coverage import analyze_coverage
+from app.services.demand_cube import refresh_cube
+from app.services.heatmap import (
+    JSON_MEDIA_TYPE,
+    build_heatmap,
+    build_heatmap_binary,
+    negotiate_format,
+)
+from app.services.isochrones import get_isochrones, refresh_isochrones
 
 router = APIRouter()
 
@@ -9,6 +22,10 @@ class HeatmapData(BaseModel):
     latitude: float
     longitude: float
     intensity: float
+    h3_index: str | None = None
+    orders_count: int | None = None
+    total_order_value: float | None = None
+    peak_hour: int | None = None
 
 
 class HeatmapResponse(BaseModel):
@@ -18,33 +35,122 @@ class HeatmapResponse(BaseModel):
 
 @router.get("/heatmap", response_model=HeatmapResponse)
 async def get_demand_heatmap(
-    start_date: str | None = None,
-    end_date: str | None = None,
+    request: Request,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
     resolution: str = "high",
+    format: str | None = None,
+):
+    """
+    Generate demand heatmap from order data
+
+    JSON by default. Clients sending `Accept: application/vnd.apache.arrow.stream`
+    or `application/vnd.smartblink.heatmap` (or `format=arrow|packed`) get packed
+    columns instead, compressed per Accept-Encoding.
+    """
+    try:
+        media_type = negotiate_format(request.headers.get("accept"), format)
+        if media_type == JSON_MEDIA_TYPE:
+            return await cached(
+                "heatmap",
+                {"start_date": start_date, "end_date": end_date, "resolution": resolution},
+                lambda: build_heatmap(start_date, end_date, resolution),
+            )
+
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+
+        # Always compressed when negotiated so cached bodies match Content-Encoding
+        async def encoded_body() -> bytes:
+            body, _ = compress(
+                await build_heatmap_binary(media_type, start_date, end_date, resolution),
+                encoding,
+                min_bytes=0,
+            )
+            return body
+
+        body = await cached(
+            "heatmap",
+            {
+                "start_date": start_date,
+                "end_date": end_date,
+                "resolution": resolution,
+                "media_type": media_type,
+                "encoding": encoding,
+            },
+            encoded_body,
+            binary=True,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+@router.post("/demand-cube/refresh")
+async def refresh_demand_cube(
+    start_date: date | None = None,
+    end_date: date | None = None,
 ):
-    """Generate demand heatmap from order data"""
-    # TODO: Implement heatmap generation
-    # - Aggregate orders by location
-    # - Apply spatial clustering
-    # - Return grid of demand intensity
-    return {
-        "data": [],
-        "metadata": {
-            "resolution": resolution,
-            "total_orders": 0,
-        }
-    }
+    """Rebuild demand cube day slices (all days when no range is given)"""
+    result = await refresh_cube(start_date, end_date)
+    await bump_data_version()
+    return result
 
 
 @router.get("/coverage")
-async def get_coverage_analysis():
-    """Analyze current store coverage"""
-    # TODO: Calculate coverage metrics
-    # - % of area covered within X minutes
-    # - % of orders served within target time
-    # - Average delivery distance/time
-    return {
-        "coverage_percentage": 0,
-        "avg_delivery_time_minutes": 0,
-        "stores_count": 0,
-    }
+async def get_coverage_analysis(
+    thresholds: List[int] | None = Query(default=None, description="Delivery-time thresholds in minutes"),
+    max_delivery_time_minutes: int = Query(default=10, gt=0),
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    resolution: str = "medium",
+    use_isochrones: bool = False,
+):
+    """
+    Analyze current store coverage
+
+    - % of orders and % of demand area within each threshold
+    - Average, median and p90 delivery time to the nearest store
+    """
+    if thresholds and min(thresholds) <= 0:
+        raise HTTPException(status_code=400, detail="Thresholds must be positive minutes")
+    try:
+        return await cached(
+            "coverage",
+            {
+                "thresholds": thresholds,
+                "max_delivery_time_minutes": max_delivery_time_minutes,
+                "start_date": start_date,
+                "end_date": end_date,
+                "resolution": resolution,
+                "use_isochrones": use_isochrones,
+            },
+            lambda: analyze_coverage(
+                thresholds, max_delivery_time_minutes, start_date, end_date, resolution, use_isochrones,
+            ),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/isochrones")
+async def get_store_isochrones(
+    store_id: int | None = None,
+    time_minutes: int | None = None,
+):
+    """Cached store isochrones as GeoJSON for map overlays"""
+    return await get_isochrones(store_id, time_minutes)
+
+
+@router.post("/isochrones/refresh")
+async def refresh_store_isochrones(
+    store_ids: List[int] | None = Query(default=None),
+    force: bool = False,
+):
+    """Rebuild isochrones of stores moved since their last calculation (all listed stores with force)"""
+    result = await refresh_isochrones(store_ids, force)
+    await bump_data_version()
+    return result
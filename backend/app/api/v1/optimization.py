@@ -1,15 +1,28 @@
-from fastapi import APIRouter, BackgroundTasks
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
 from typing import List, Dict, Any
+from datetime import datetime
+
+from app.core.cache import cached
+from app.services.facility import ALGORITHMS
+from app.core.config import settings
+from app.services.jobs import (
+    get_job, get_job_candidates, load_warm_start, run_in_worker, submit_job, submit_sweep,
+)
+from app.services.optimization import load_inputs, solve_placement
+from app.services.simulation import simulate_store, simulate_stores
 
 router = APIRouter()
 
 
 class OptimizationRequest(BaseModel):
-    num_stores: int
-    max_delivery_time_minutes: int = 10
+    num_stores: int = Field(gt=0)
+    max_delivery_time_minutes: int = Field(default=10, gt=0)
     use_existing_stores: bool = True
+    algorithm: str = "p-median"  # p-median, max-coverage, k-center
+    lookback_days: int | None = None
     constraints: Dict[str, Any] | None = None
+    warm_start_job_id: int | None = None  # completed job to reuse candidate sites, matrix and solution from
 
 
 class CandidateStore(BaseModel):
@@ -20,6 +33,9 @@ class CandidateStore(BaseModel):
     estimated_orders_covered: int
     avg_delivery_time_minutes: float
     roi_estimate: float | None = None
+    h3_index: str | None = None
+    rank: int | None = None
+    estimated_monthly_revenue: float | None = None
 
 
 class OptimizationResponse(BaseModel):
@@ -27,25 +43,190 @@ class OptimizationResponse(BaseModel):
     total_coverage_percentage: float
     avg_delivery_time: float
     optimization_method: str
+    metrics: Dict[str, Any] | None = None
+
+
+class JobSubmitted(BaseModel):
+    job_id: int
+    status: str
+
+
+class JobStatus(BaseModel):
+    id: int
+    status: str
+    stage: str | None = None
+    progress: float | None = None
+    algorithm: str
+    num_stores: int
+    max_delivery_time_min: int
+    use_existing_stores: bool
+    created_at: datetime
+    started_at: datetime | None = None
+    completed_at: datetime | None = None
+    error_message: str | None = None
+    result_metrics: Dict[str, Any] | None = None
+
+
+class SweepRequest(BaseModel):
+    num_stores: int = Field(gt=0)  # solve for 1..num_stores new sites
+    max_delivery_time_minutes: List[int] = Field(default=[5, 10, 15], min_length=1, max_length=10)
+    use_existing_stores: bool = True
+    algorithm: str = "max-coverage"  # p-median, max-coverage, k-center
+    lookback_days: int | None = None
+    constraints: Dict[str, Any] | None = None
+
+
+class SweepPoint(BaseModel):
+    num_stores: int
+    coverage_percentage: float
+    avg_travel_time: float
+    max_travel_time: float
+    pareto: bool
+    sites: List[str]
+
+
+class SweepCurve(BaseModel):
+    max_delivery_time_minutes: int
+    points: List[SweepPoint]
+
+
+class SweepResponse(BaseModel):
+    job_id: int
+    algorithm: str
+    max_stores: int
+    curves: List[SweepCurve]
+
+
+class SiteLocation(BaseModel):
+    latitude: float = Field(ge=-90, le=90)
+    longitude: float = Field(ge=-180, le=180)
+
+
+class BatchSimulationRequest(BaseModel):
+    sites: List[SiteLocation] = Field(min_length=1, max_length=10_000)
+    max_delivery_time_minutes: float = Field(default=10, gt=0)
+    top_k: int | None = Field(default=None, gt=0)
+
+
+def validate_algorithm(request: OptimizationRequest | SweepRequest):
+    """Reject unknown solver names before any work is done"""
+    if request.algorithm not in ALGORITHMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown algorithm '{request.algorithm}', expected one of {', '.join(ALGORITHMS)}",
+        )
+
+
+async def validate_warm_start(request: OptimizationRequest):
+    if request.warm_start_job_id is None:
+        return
+    job = await get_job(request.warm_start_job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Warm-start optimization job not found")
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Warm-start optimization job is {job['status']}")
 
 
 @router.post("/find-locations", response_model=OptimizationResponse)
-async def optimize_store_locations(
-    request: OptimizationRequest,
-    background_tasks: BackgroundTasks,
-):
+async def optimize_store_locations(request: OptimizationRequest):
     """Find optimal store locations using ML and optimization algorithms"""
-    # TODO: Implement optimization
-    # 1. Load order data and demand heatmap
-    # 2. Apply clustering (KMeans, HDBSCAN)
-    # 3. Run facility location optimization (p-median)
-    # 4. Calculate coverage and metrics
-    # 5. Return ranked candidates
+    validate_algorithm(request)
+    await validate_warm_start(request)
+
+    inputs = await load_inputs(request.use_existing_stores, request.lookback_days)
+    previous, previous_cells = None, None
+    if request.warm_start_job_id is not None:
+        previous, previous_cells = await load_warm_start(request.warm_start_job_id)
+    result, _ = await run_in_worker(
+        solve_placement,
+        inputs,
+        request.num_stores,
+        request.max_delivery_time_minutes,
+        request.algorithm,
+        previous,
+        previous_cells,
+    )
+    return result
+
+
+@router.post("/jobs", response_model=JobSubmitted, status_code=202)
+async def submit_optimization_job(request: OptimizationRequest):
+    """Queue an optimization run and return its job id immediately"""
+    validate_algorithm(request)
+    await validate_warm_start(request)
+
+    job_id = await submit_job(request.model_dump())
+    return {"job_id": job_id, "status": "pending"}
+
+
+@router.post("/sweeps", response_model=JobSubmitted, status_code=202)
+async def submit_optimization_sweep(request: SweepRequest):
+    """
+    Queue a scenario sweep: coverage for 1..num_stores new sites at each threshold
+
+    One cost matrix is shared by every solve; the curves (with Pareto-optimal
+    points flagged) land in the job's result_metrics.
+    """
+    validate_algorithm(request)
+    if request.num_stores > settings.SWEEP_MAX_STORES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"num_stores must be at most {settings.SWEEP_MAX_STORES} for a sweep",
+        )
+    if any(t <= 0 for t in request.max_delivery_time_minutes):
+        raise HTTPException(status_code=400, detail="Delivery time thresholds must be positive")
+
+    params = request.model_dump()
+    params["max_delivery_time_minutes_list"] = sorted(set(params.pop("max_delivery_time_minutes")))
+    job_id = await submit_sweep(params)
+    return {"job_id": job_id, "status": "pending"}
+
+
+@router.get("/jobs/{job_id}/sweep", response_model=SweepResponse)
+async def get_optimization_sweep(job_id: int):
+    """Get the coverage curves of a completed sweep job"""
+    job = await get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Optimization job not found")
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Optimization job is {job['status']}")
+    sweep = (job["result_metrics"] or {}).get("sweep")
+    if sweep is None:
+        raise HTTPException(status_code=404, detail="Optimization job is not a sweep")
+
     return {
-        "candidates": [],
-        "total_coverage_percentage": 0,
-        "avg_delivery_time": 0,
-        "optimization_method": "k-means + p-median",
+        "job_id": job_id,
+        "algorithm": job["algorithm"],
+        "max_stores": sweep["max_stores"],
+        "curves": sweep["curves"],
+    }
+
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_optimization_job(job_id: int):
+    """Get status and progress of an optimization job"""
+    job = await get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Optimization job not found")
+    return job
+
+
+@router.get("/jobs/{job_id}/result", response_model=OptimizationResponse)
+async def get_optimization_job_result(job_id: int):
+    """Get ranked candidates of a completed optimization job"""
+    job = await get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Optimization job not found")
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Optimization job is {job['status']}")
+
+    metrics = job["result_metrics"] or {}
+    return {
+        "candidates": await get_job_candidates(job_id),
+        "total_coverage_percentage": metrics.get("total_coverage_percentage", 0),
+        "avg_delivery_time": metrics.get("avg_delivery_time", 0),
+        "optimization_method": metrics.get("optimization_method", job["algorithm"]),
+        "metrics": metrics,
     }
 
 
@@ -53,16 +234,38 @@ async def optimize_store_locations(
 async def simulate_new_store(
     latitude: float,
     longitude: float,
+    max_delivery_time_minutes: float = 10,
 ):
-    """Simulate impact of opening a store at given location"""
-    # TODO: Implement simulation
-    # - Calculate orders that would be served
-    # - Estimate delivery time improvements
-    # - Calculate ROI
-    return {
-        "location": {"latitude": latitude, "longitude": longitude},
-        "orders_covered": 0,
-        "avg_delivery_time_improvement": 0,
-        "estimated_monthly_revenue": 0,
-        "estimated_roi_months": 0,
-    }
+    """
+    Simulate impact of opening a store at given location
+
+    Order figures are normalized to a 30-day month of the lookback window.
+    `estimated_monthly_revenue` and ROI count only newly covered orders;
+    `captured_monthly_revenue` also includes orders taken from existing stores.
+    """
+    return await cached(
+        "simulate",
+        {
+            "latitude": round(latitude, 6),
+            "longitude": round(longitude, 6),
+            "max_delivery_time_minutes": max_delivery_time_minutes,
+        },
+        lambda: simulate_store(latitude, longitude, max_delivery_time_minutes),
+    )
+
+
+@router.post("/simulate/batch")
+async def simulate_new_stores(request: BatchSimulationRequest):
+    """
+    Simulate many candidate sites in one vectorized pass
+
+    Returns the same metrics as /simulate for each site, ranked by estimated
+    monthly revenue; `input_index` refers back to the request order.
+    """
+    results = await simulate_stores(
+        [site.latitude for site in request.sites],
+        [site.longitude for site in request.sites],
+        request.max_delivery_time_minutes,
+        request.top_k,
+    )
+    return {"results": results, "total": len(request.sites)}
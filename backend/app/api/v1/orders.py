@@ -1,7 +1,24 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from typing import List
 from pydantic import BaseModel
 from datetime import datetime
+import numpy as np
+
+from app.core.cache import bump_data_version
+from app.core.config import settings
+from app.core.database import raw_connection
+from app.services.aggregation import OrderArrays, to_naive_utc
+from app.services.demand_cells import fold_orders
+from app.services.ingest import ingest_rows, iter_csv_rows, iter_ndjson_rows
+from app.services.order_listing import (
+    EXPORT_FORMATS,
+    OrderFilters,
+    export_orders,
+    list_orders,
+    parse_bbox,
+)
+from app.services.partitions import ensure_order_partitions
 
 router = APIRouter()
 
@@ -13,30 +30,124 @@ class OrderLocation(BaseModel):
     longitude: float
     items_count: int | None = None
     order_value: float | None = None
+    status: str | None = None
 
 
 class OrdersResponse(BaseModel):
     orders: List[OrderLocation]
-    total: int
+    total: int | None = None  # Planner estimate, not an exact count
+    next_cursor: str | None = None
+
+
+def order_filters(
+    start_date: datetime | None,
+    end_date: datetime | None,
+    status: str | None,
+    bbox: str | None,
+) -> OrderFilters:
+    try:
+        return OrderFilters(start_date, end_date, status, parse_bbox(bbox))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.get("/", response_model=OrdersResponse)
 async def get_orders(
-    limit: int = 100,
-    offset: int = 0,
+    limit: int = Query(default=100, ge=1, le=settings.ORDERS_PAGE_MAX_LIMIT),
+    cursor: str | None = None,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    status: str | None = None,
+    bbox: str | None = Query(default=None, description="min_lon,min_lat,max_lon,max_lat"),
+    include_total: bool = True,
+):
+    """
+    Get historical order data, oldest first
+
+    Pass the returned `next_cursor` back as `cursor` for the next page; it is
+    null on the last page. `total` is the planner's estimate for the filters.
+    """
+    filters = order_filters(start_date, end_date, status, bbox)
+    try:
+        return await list_orders(filters, limit, cursor, include_total)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/export")
+async def export_orders_stream(
+    format: str = "ndjson",
     start_date: datetime | None = None,
     end_date: datetime | None = None,
+    status: str | None = None,
+    bbox: str | None = Query(default=None, description="min_lon,min_lat,max_lon,max_lat"),
 ):
-    """Get historical order data"""
-    # TODO: Fetch from database with filters
-    return {
-        "orders": [],
-        "total": 0
-    }
+    """Stream every matching order as NDJSON or CSV (re-importable via POST /orders/bulk)"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format '{format}'")
+    filters = order_filters(start_date, end_date, status, bbox)
+    return StreamingResponse(
+        export_orders(filters, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="orders.{format}"'},
+    )
 
 
 @router.post("/", response_model=OrderLocation)
 async def create_order(order: OrderLocation):
     """Create a new order record"""
-    # TODO: Save to database
+    # TIMESTAMP columns hold naive UTC
+    order.timestamp = to_naive_utc(order.timestamp)
+    await ensure_order_partitions(order.timestamp, order.timestamp)
+    async with raw_connection() as conn:
+        async with conn.transaction():
+            row = await conn.fetchrow(
+                """
+                INSERT INTO orders (location, timestamp, items_count, order_value, status, created_at)
+                VALUES (ST_SetSRID(ST_MakePoint($1, $2), 4326), $3, $4, $5, COALESCE($6, 'completed'), NOW())
+                RETURNING id, status
+                """,
+                order.longitude,
+                order.latitude,
+                order.timestamp,
+                order.items_count,
+                order.order_value,
+                order.status,
+            )
+            # Same transaction as the insert, so demand_cells and the cube never miss the order
+            await fold_orders(
+                OrderArrays(
+                    latitude=np.array([order.latitude]),
+                    longitude=np.array([order.longitude]),
+                    timestamp=np.array([order.timestamp], dtype="datetime64[s]"),
+                    order_value=np.array([order.order_value or 0.0]),
+                ),
+                conn,
+            )
+    order.id = row["id"]
+    order.status = row["status"]
+    await bump_data_version()
     return order
+
+
+@router.post("/bulk")
+async def bulk_create_orders(
+    request: Request,
+    format: str | None = None,
+    update_demand: bool = True,
+):
+    """
+    Bulk-load orders from a streamed NDJSON or CSV upload
+
+    The format is taken from `format` (ndjson/csv) or the Content-Type header.
+    Rows are validated and COPYed in batches; the response reports rows/sec.
+    """
+    content_type = request.headers.get("content-type", "")
+    upload_format = format or ("csv" if "csv" in content_type else "ndjson")
+    if upload_format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail=f"Unsupported format '{upload_format}'")
+
+    parser = iter_csv_rows if upload_format == "csv" else iter_ndjson_rows
+    report = await ingest_rows(parser(request.stream()), update_demand=update_demand)
+    await bump_data_version()
+    return {"format": upload_format, **report.to_dict()}
@@ -1,9 +1,19 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query
 from typing import List
 from pydantic import BaseModel
 
+from app.core.cache import bump_data_version
+from app.core.database import execute_spatial_query
+from app.services.isochrones import refresh_isochrones
+from app.services.spatial_index import nearest_stores
+
 router = APIRouter()
 
+STORE_COLUMNS = """
+    id, name, ST_Y(location) AS latitude, ST_X(location) AS longitude,
+    address, city, is_active, capacity, monthly_rent, setup_cost
+"""
+
 
 class StoreLocation(BaseModel):
     id: int | None = None
@@ -11,7 +21,11 @@ class StoreLocation(BaseModel):
     latitude: float
     longitude: float
     address: str | None = None
+    city: str | None = None
     is_active: bool = True
+    capacity: int | None = None
+    monthly_rent: float | None = None
+    setup_cost: float | None = None
 
 
 class StoreResponse(BaseModel):
@@ -19,25 +33,100 @@ class StoreResponse(BaseModel):
     total: int
 
 
+class NearestStore(BaseModel):
+    store_id: int
+    name: str | None = None
+    latitude: float
+    longitude: float
+    distance_meters: float
+
+
+async def store_changed(store: StoreLocation, background_tasks: BackgroundTasks):
+    """Bump the data version every worker's store views follow, then rebuild the store's isochrones"""
+    await bump_data_version()
+    if store.is_active:
+        background_tasks.add_task(refresh_isochrones, [store.id])
+        background_tasks.add_task(bump_data_version)
+
+
 @router.get("/", response_model=StoreResponse)
-async def get_stores():
+async def get_stores(active_only: bool = False):
     """Get all store locations"""
-    # TODO: Fetch from database
+    rows = await execute_spatial_query(
+        f"SELECT {STORE_COLUMNS} FROM stores WHERE ($1 = FALSE OR is_active = TRUE) ORDER BY id",
+        active_only,
+    )
     return {
-        "stores": [],
-        "total": 0
+        "stores": rows,
+        "total": len(rows)
     }
 
 
 @router.post("/", response_model=StoreLocation)
-async def create_store(store: StoreLocation):
+async def create_store(store: StoreLocation, background_tasks: BackgroundTasks):
     """Create a new store location"""
-    # TODO: Save to database
-    return store
+    rows = await execute_spatial_query(
+        f"""
+        INSERT INTO stores (
+            name, location, address, city, is_active, capacity,
+            monthly_rent, setup_cost, created_at, updated_at
+        )
+        VALUES (
+            $1, ST_SetSRID(ST_MakePoint($2, $3), 4326), $4, $5, $6, $7, $8, $9, NOW(), NOW()
+        )
+        RETURNING {STORE_COLUMNS}
+        """,
+        store.name, store.longitude, store.latitude, store.address, store.city,
+        store.is_active, store.capacity, store.monthly_rent, store.setup_cost,
+    )
+    created = StoreLocation(**rows[0])
+    await store_changed(created, background_tasks)
+    return created
+
+
+@router.get("/nearest", response_model=List[NearestStore])
+async def get_nearest_stores(
+    latitude: float = Query(ge=-90, le=90),
+    longitude: float = Query(ge=-180, le=180),
+    k: int = Query(default=1, ge=1, le=100),
+    max_distance_meters: float | None = Query(default=None, gt=0),
+):
+    """Nearest active stores to a point, served from the in-memory spatial index"""
+    return await nearest_stores(latitude, longitude, k, max_distance_meters)
 
 
 @router.get("/{store_id}", response_model=StoreLocation)
 async def get_store(store_id: int):
     """Get a specific store by ID"""
-    # TODO: Fetch from database
-    raise HTTPException(status_code=404, detail="Store not found")
+    rows = await execute_spatial_query(f"SELECT {STORE_COLUMNS} FROM stores WHERE id = $1", store_id)
+    if not rows:
+        raise HTTPException(status_code=404, detail="Store not found")
+    return rows[0]
+
+
+@router.put("/{store_id}", response_model=StoreLocation)
+async def update_store(store_id: int, store: StoreLocation, background_tasks: BackgroundTasks):
+    """Update a store; moving or deactivating it refreshes coverage views"""
+    rows = await execute_spatial_query(
+        f"""
+        UPDATE stores SET
+            name = $2,
+            location = ST_SetSRID(ST_MakePoint($3, $4), 4326),
+            address = $5,
+            city = $6,
+            is_active = $7,
+            capacity = $8,
+            monthly_rent = $9,
+            setup_cost = $10,
+            updated_at = NOW()
+        WHERE id = $1
+        RETURNING {STORE_COLUMNS}
+        """,
+        store_id, store.name, store.longitude, store.latitude, store.address, store.city,
+        store.is_active, store.capacity, store.monthly_rent, store.setup_cost,
+    )
+    if not rows:
+        raise HTTPException(status_code=404, detail="Store not found")
+    updated = StoreLocation(**rows[0])
+    await store_changed(updated, background_tasks)
+    return updated
@@ -0,0 +1,53 @@
+from fastapi import APIRouter, HTTPException, Request, Response
+
+from app.core.cache import cached
+from app.core.compression import compress, negotiate_encoding
+from app.core.config import settings
+from app.services.tiles import MVT_MEDIA_TYPE, build_tile, validate_tile
+
+router = APIRouter()
+
+
+@router.get("/{layer}/{z}/{x}/{y}")
+async def get_tile(
+    request: Request,
+    layer: str,
+    z: int,
+    x: int,
+    y: int,
+    job_id: int | None = None,
+):
+    """
+    Mapbox Vector Tile for demand_cells, stores, candidates or isochrones
+
+    `job_id` narrows the candidates layer to one optimization job. Tiles are
+    cached per (layer, z, x, y, data version) and gzip/brotli compressed
+    when the client accepts it.
+    """
+    try:
+        validate_tile(layer, z, x, y)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+
+    # Always compressed when negotiated so cached bodies match Content-Encoding
+    async def encoded_tile() -> bytes:
+        body, _ = compress(await build_tile(layer, z, x, y, job_id), encoding, min_bytes=0)
+        return body
+
+    body = await cached(
+        "tiles",
+        {"layer": layer, "z": z, "x": x, "y": y, "job_id": job_id, "encoding": encoding},
+        encoded_tile,
+        ttl=settings.TILE_CACHE_TTL_SECONDS,
+        binary=True,
+    )
+
+    headers = {
+        "Vary": "Accept-Encoding",
+        "Cache-Control": f"public, max-age={settings.CACHE_TTL_SECONDS}",
+    }
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=MVT_MEDIA_TYPE, headers=headers)
@@ -0,0 +1,289 @@
+"""
+Response cache backed by Redis with an in-process LRU fallback
+
+Entries are keyed by endpoint namespace, normalized query parameters and a
+data version stamp that order, store and candidate writes bump, so stale
+results are never served after a write and simply age out by TTL (Redis
+evicts by LRU under maxmemory). Concurrent misses for the same key are
+collapsed: one caller computes while the others wait, in-process through a
+shared future and across workers through a short Redis lock.
+"""
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import time
+
+import redis.asyncio as redis
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "cache:data_version"
+
+# How long a worker waits on another worker's computation before doing it itself
+LOCK_POLL_SECONDS = 0.05
+
+
+class LocalLRU:
+    """Bounded in-process LRU with per-entry expiry"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: bytes, ttl: int):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class ResponseCache:
+    """Versioned, single-flight response cache"""
+
+    def __init__(self):
+        self._redis: Optional[redis.Redis] = None
+        self._retired: Optional[redis.Redis] = None  # failed client, closed on the next connect
+        self._redis_down_until = 0.0
+        self._local = LocalLRU(settings.CACHE_LOCAL_MAX_ENTRIES)
+        self._local_version = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def connect(self):
+        """(Re)connect to Redis, closing earlier clients; on failure keep serving from the local LRU"""
+        await self.close()
+        client = redis.from_url(settings.REDIS_URL, socket_timeout=1.0, socket_connect_timeout=1.0)
+        try:
+            await client.ping()
+        except (redis.RedisError, OSError) as e:
+            await _close_quietly(client)
+            self._redis_down_until = time.monotonic() + settings.CACHE_REDIS_RETRY_SECONDS
+            logger.warning(f"⚠️ Redis unavailable, using in-process cache: {e}")
+            return
+        self._redis = client
+        logger.info("🧰 Response cache connected to Redis")
+
+    async def close(self):
+        for client in (self._redis, self._retired):
+            if client is not None:
+                await _close_quietly(client)
+        self._redis = self._retired = None
+
+    async def _client(self) -> Optional[redis.Redis]:
+        if self._redis is None and time.monotonic() >= self._redis_down_until:
+            await self.connect()
+        return self._redis
+
+    def _redis_failed(self, e: Exception):
+        logger.warning(f"⚠️ Redis error, falling back to in-process cache: {e}")
+        if self._redis is not None:
+            self._retired = self._redis
+        self._redis = None
+        self._redis_down_until = time.monotonic() + settings.CACHE_REDIS_RETRY_SECONDS
+
+    async def data_version(self) -> str:
+        client = await self._client()
+        if client is not None:
+            try:
+                return f"r{int(await client.get(VERSION_KEY) or 0)}"
+            except (redis.RedisError, OSError) as e:
+                self._redis_failed(e)
+        return f"l{self._local_version}"
+
+    async def bump_version(self):
+        """Invalidate every cached response (call after order/store/candidate writes)"""
+        self._local_version += 1
+        self._local.clear()
+        client = await self._client()
+        if client is not None:
+            try:
+                await client.incr(VERSION_KEY)
+            except (redis.RedisError, OSError) as e:
+                self._redis_failed(e)
+
+    async def _get(self, key: str) -> Optional[bytes]:
+        client = await self._client()
+        if client is not None:
+            try:
+                return await client.get(key)
+            except (redis.RedisError, OSError) as e:
+                self._redis_failed(e)
+        return self._local.get(key)
+
+    async def _set(self, key: str, value: bytes, ttl: int):
+        client = await self._client()
+        if client is not None:
+            try:
+                await client.set(key, value, ex=ttl)
+                return
+            except (redis.RedisError, OSError) as e:
+                self._redis_failed(e)
+        self._local.set(key, value, ttl)
+
+    async def _compute_with_lock(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        ttl: int,
+        binary: bool = False,
+    ) -> Any:
+        """Compute once across workers: take the Redis lock or wait for its holder's result"""
+        client = await self._client()
+        lock_key = f"lock:{key}"
+        deadline = time.monotonic() + settings.CACHE_LOCK_TIMEOUT_SECONDS
+        locked = False
+        try:
+            while client is not None:
+                try:
+                    locked = bool(await client.set(
+                        lock_key, b"1", nx=True, px=settings.CACHE_LOCK_TIMEOUT_SECONDS * 1000,
+                    ))
+                    # Re-read after locking too: the previous holder may have stored
+                    # the value and released between our last poll and the lock
+                    cached = await client.get(key)
+                    if cached is not None:
+                        return decode(cached, binary)
+                    if locked or time.monotonic() > deadline:
+                        break
+                    await asyncio.sleep(LOCK_POLL_SECONDS)
+                except (redis.RedisError, OSError) as e:
+                    self._redis_failed(e)
+                    client = None
+
+            value = await compute()
+            await self._set(key, encode(value, binary), ttl)
+            return value
+        finally:
+            if locked and client is not None:
+                try:
+                    await client.delete(lock_key)
+                except (redis.RedisError, OSError):
+                    pass
+
+    async def get_or_compute(
+        self,
+        namespace: str,
+        params: Dict[str, Any],
+        compute: Callable[[], Awaitable[Any]],
+        ttl: Optional[int] = None,
+        binary: bool = False,
+    ) -> Any:
+        """
+        Cached result for (namespace, params, data version), computing it at most once
+
+        Values are JSON-encoded unless `binary`, in which case compute must
+        return bytes and they are stored verbatim.
+        """
+        if not settings.ENABLE_ML_CACHE:
+            return await compute()
+
+        ttl = ttl or settings.CACHE_TTL_SECONDS
+        key = cache_key(namespace, params, await self.data_version())
+        cached = await self._get(key)
+        if cached is not None:
+            return decode(cached, binary)
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._compute_with_lock(key, compute, ttl, binary)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else is waiting
+            raise
+        finally:
+            del self._inflight[key]
+
+
+async def _close_quietly(client: redis.Redis):
+    """Release a client's connection pool, ignoring errors from a dead server"""
+    try:
+        await client.aclose()
+    except (redis.RedisError, OSError):
+        pass
+
+
+def encode(value: Any, binary: bool) -> bytes:
+    return value if binary else json.dumps(value, default=str).encode()
+
+
+def decode(value: bytes, binary: bool) -> Any:
+    return value if binary else json.loads(value)
+
+
+def cache_key(namespace: str, params: Dict[str, Any], version: str) -> str:
+    """Stable key from normalized params (sorted, None dropped, lists sorted)"""
+    normalized = {
+        name: sorted(value) if isinstance(value, (list, tuple, set)) else value
+        for name, value in params.items()
+        if value is not None
+    }
+    digest = hashlib.sha1(json.dumps(normalized, sort_keys=True, default=str).encode()).hexdigest()
+    return f"cache:{namespace}:{version}:{digest}"
+
+
+_cache: Optional[ResponseCache] = None
+
+
+def get_cache() -> ResponseCache:
+    global _cache
+    if _cache is None:
+        _cache = ResponseCache()
+    return _cache
+
+
+async def init_cache():
+    """Connect the response cache (called on startup)"""
+    await get_cache().connect()
+
+
+async def close_cache():
+    global _cache
+    if _cache is not None:
+        await _cache.close()
+        _cache = None
+
+
+async def cached(
+    namespace: str,
+    params: Dict[str, Any],
+    compute: Callable[[], Awaitable[Any]],
+    ttl: Optional[int] = None,
+    binary: bool = False,
+) -> Any:
+    """Serve a response from cache or compute it once"""
+    return await get_cache().get_or_compute(namespace, params, compute, ttl, binary)
+
+
+async def data_version() -> str:
+    """Current data version stamp, shared by every worker when Redis is up"""
+    return await get_cache().data_version()
+
+
+async def bump_data_version():
+    """Invalidate cached responses after orders, stores or candidates change"""
+    await get_cache().bump_version()
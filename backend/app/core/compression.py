@@ -0,0 +1,49 @@
+"""
+Response body compression negotiated from Accept-Encoding
+
+Brotli is used when the optional `brotli` package is installed and the
+client accepts it, gzip otherwise. Small bodies are sent uncompressed.
+"""
+from typing import Optional, Tuple
+import gzip
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+# Bodies below this size are not worth the compression overhead
+MIN_COMPRESS_BYTES = 1024
+
+
+def accepted_encodings(accept_encoding: Optional[str]) -> set:
+    """Encodings the client accepts (q=0 entries excluded)"""
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name and params.replace(" ", "") not in ("q=0", "q=0.0"):
+            accepted.add(name.lower())
+    return accepted
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Best supported content coding for a request, or None for identity"""
+    accepted = accepted_encodings(accept_encoding)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(
+    body: bytes,
+    encoding: Optional[str],
+    min_bytes: int = MIN_COMPRESS_BYTES,
+) -> Tuple[bytes, Optional[str]]:
+    """Compress with the negotiated encoding, returning (body, Content-Encoding)"""
+    if encoding is None or len(body) < min_bytes:
+        return body, None
+    if encoding == "br":
+        return brotli.compress(body, quality=5), "br"
+    return gzip.compress(body, compresslevel=6), "gzip"
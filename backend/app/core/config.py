@@ -11,6 +11,13 @@ class Settings(BaseSettings):
     # Database
     DATABASE_URL: str
     
+    # Database pool
+    DB_POOL_MIN_SIZE: int = 2  # asyncpg connections kept open for raw SQL
+    DB_POOL_MAX_SIZE: int = 10
+    DB_PRISMA_CONNECTION_LIMIT: int = 5  # Prisma query engine pool size
+    DB_STATEMENT_TIMEOUT_MS: int = 60_000  # Server-side statement_timeout for pooled connections
+    DB_STATEMENT_CACHE_SIZE: int = 256  # Prepared statements kept per connection (0 behind pgbouncer)
+    
     # Redis
     REDIS_URL: str = "redis://localhost:6379/0"
     
@@ -27,7 +34,74 @@ class Settings(BaseSettings):
     OSRM_URL: str = "http://localhost:5000"
     
     # ML
-    ENABLE_ML_CACHE: bool = True
+    ENABLE_ML_CACHE: bool = True  # Response cache for analytics and optimization endpoints
+    
+    # Demand aggregation
+    DEMAND_CUBE_RESOLUTION: int = 9  # Finest H3 level stored in demand_cube
+    DEMAND_CELLS_RESOLUTION: int = 8  # H3 level of demand_cells rows
+    DEMAND_BUILD_SHARD_RESOLUTION: int = 5  # H3 parent level orders are sharded by for full rebuilds
+    DEMAND_BUILD_WORKERS: int = 0  # Processes for full rebuilds (0 = all cores)
+    
+    # Travel time model (used when OSRM routing is unavailable)
+    DELIVERY_SPEED_KMH: float = 25.0  # Average rider speed in city traffic
+    ROAD_DETOUR_FACTOR: float = 1.2  # Road distance / straight-line distance
+    
+    # Routing (OSRM table service; off falls back to the travel time model)
+    OSRM_ENABLED: bool = False
+    OSRM_TABLE_MAX_COORDINATES: int = 100  # Must not exceed osrm-routed --max-table-size
+    OSRM_MAX_CONCURRENCY: int = 4  # Table requests in flight at once
+    OSRM_TIMEOUT_SECONDS: float = 30.0
+    OSRM_MAX_RETRIES: int = 2  # Retries per tile before falling back to the model
+    OSRM_MAX_SPEED_KMH: float = 90.0  # Fastest road speed in the routing profile, bounds isochrone search
+    
+    # Optimization
+    OPTIMIZATION_RESOLUTION: int = 8  # H3 level of demand points and candidate sites
+    OPTIMIZATION_LOOKBACK_DAYS: int = 90  # Order history used to weight demand
+    MAX_CANDIDATE_SITES: int = 2000  # Cells considered as sites
+    CANDIDATE_SITE_METHOD: str = "top-demand"  # top-demand, or clustering (ml.clustering KMeans + HDBSCAN)
+    OPTIMIZATION_WORKERS: int = 2  # Solver processes in the job runner pool
+    WARM_START_CACHE_SIZE: int = 2  # Recent job instances kept in memory to warm-start re-runs
+    SWEEP_MAX_STORES: int = 100  # Largest store count a scenario sweep may ask for
+    
+    # Cost-matrix store (memory-mapped travel-time matrices shared by solver processes)
+    COST_MATRIX_STORE_ENABLED: bool = True
+    COST_MATRIX_DIR: str = "/tmp/smartblink/cost-matrices"  # Outside the source tree so --reload ignores it
+    COST_MATRIX_MAX_BYTES: int = 4 * 1024 ** 3  # Least recently used entries pruned beyond this
+    
+    # Store economics (defaults when a simulated site has no cost data)
+    DEFAULT_STORE_SETUP_COST: float = 1_000_000.0
+    DEFAULT_STORE_MONTHLY_RENT: float = 100_000.0
+    ORDER_CONTRIBUTION_MARGIN: float = 0.2  # Share of order value kept as margin
+    
+    # Response cache (Redis, falling back to an in-process LRU)
+    CACHE_TTL_SECONDS: int = 300
+    CACHE_LOCAL_MAX_ENTRIES: int = 256  # In-process LRU size when Redis is down
+    CACHE_LOCK_TIMEOUT_SECONDS: int = 30  # Max wait on another worker computing the same key
+    CACHE_REDIS_RETRY_SECONDS: int = 30  # Back-off before reconnecting after a Redis error
+    
+    # Coverage analysis
+    COVERAGE_THRESHOLDS_MINUTES: List[int] = [5, 10, 15]
+    
+    # Isochrones
+    ISOCHRONE_MINUTES: List[int] = [5, 10, 15]  # Drive-time polygons built per store
+    ISOCHRONE_RESOLUTION: int = 9  # H3 level of the cells outlining each polygon
+    
+    # Vector tiles
+    TILE_EXTENT: int = 4096  # MVT coordinate grid per tile
+    TILE_BUFFER: int = 64  # Extra tile units around each tile to avoid clipped edges
+    TILE_MAX_ZOOM: int = 20
+    TILE_CACHE_TTL_SECONDS: int = 3600  # Data-version stamped, so only bounds memory use
+    DEMAND_CELL_POLYGON_MIN_ZOOM: int = 11  # Lower zooms draw demand cells as centroids
+
+    # Orders partitioning (monthly range partitions on timestamp)
+    ORDER_PARTITION_PREMAKE_MONTHS: int = 2  # Future months created ahead at startup
+
+    # Order listing
+    ORDERS_PAGE_MAX_LIMIT: int = 1000
+    ORDER_EXPORT_FETCH_SIZE: int = 5000  # Rows per server-side cursor fetch when exporting
+
+    # Bulk ingestion
+    BULK_INGEST_BATCH_SIZE: int = 50_000  # Rows validated and COPYed per batch
     
     class Config:
         env_file = ".env"
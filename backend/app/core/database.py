@@ -1,42 +1,139 @@
 """
 Database connection and utility functions
+
+Two clients share the database:
+- Prisma for model access and multi-statement transactions
+- an asyncpg pool for raw PostGIS queries, bulk unnest writes and COPY
+
+Both are opened in the app lifespan (init_db) with bounded pool sizes and a
+server-side statement timeout. Lazy getters remain for scripts and are
+guarded by locks so concurrent first calls create exactly one client.
+asyncpg keeps a per-connection prepared-statement cache, so repeated raw
+queries skip parse/plan after their first use on a connection.
 """
 from prisma import Prisma
-from typing import Optional
+from typing import AsyncIterator, List, Optional
+from contextlib import asynccontextmanager
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import asyncio
+import asyncpg
+import json
 import logging
 
+from app.core.config import settings
+
 logger = logging.getLogger(__name__)
 
 # Global Prisma client instance
 _prisma_client: Optional[Prisma] = None
+_prisma_lock = asyncio.Lock()
+
+# Global asyncpg pool for raw SQL
+_pool: Optional[asyncpg.Pool] = None
+_pool_lock = asyncio.Lock()
+
+
+def prisma_datasource_url() -> str:
+    """DATABASE_URL with Prisma's connection pool limit applied (unless already set)"""
+    parts = urlsplit(settings.DATABASE_URL)
+    query = dict(parse_qsl(parts.query))
+    query.setdefault("connection_limit", str(settings.DB_PRISMA_CONNECTION_LIMIT))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+async def _init_connection(conn: asyncpg.Connection):
+    """Decode json/jsonb columns to Python objects (and encode them from Python values)"""
+    for type_name in ("json", "jsonb"):
+        await conn.set_type_codec(
+            type_name, encoder=json.dumps, decoder=json.loads, schema="pg_catalog",
+        )
 
 
 async def get_db() -> Prisma:
     """Get or create Prisma database connection"""
     global _prisma_client
-    
+
     if _prisma_client is None:
-        _prisma_client = Prisma()
-        await _prisma_client.connect()
-        logger.info("📊 Database connected")
-    
+        async with _prisma_lock:
+            if _prisma_client is None:
+                client = Prisma(datasource={"url": prisma_datasource_url()})
+                await client.connect()
+                _prisma_client = client
+                logger.info("📊 Database connected")
+
     return _prisma_client
 
 
+async def get_pool() -> asyncpg.Pool:
+    """Get or create the asyncpg pool used for raw SQL"""
+    global _pool
+
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                _pool = await asyncpg.create_pool(
+                    settings.DATABASE_URL,
+                    min_size=settings.DB_POOL_MIN_SIZE,
+                    max_size=settings.DB_POOL_MAX_SIZE,
+                    statement_cache_size=settings.DB_STATEMENT_CACHE_SIZE,
+                    init=_init_connection,
+                    server_settings={
+                        "statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS),
+                        "application_name": "smartblink-api",
+                    },
+                )
+                logger.info(
+                    f"📊 Connection pool ready ({settings.DB_POOL_MIN_SIZE}-{settings.DB_POOL_MAX_SIZE} connections)"
+                )
+
+    return _pool
+
+
+async def init_db():
+    """Open the Prisma client and the raw SQL pool (called on startup)"""
+    await get_db()
+    await get_pool()
+
+
 async def close_db():
-    """Close database connection"""
-    global _prisma_client
-    
+    """Close database connections"""
+    global _prisma_client, _pool
+
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
     if _prisma_client is not None:
         await _prisma_client.disconnect()
         _prisma_client = None
         logger.info("📊 Database disconnected")
 
 
-async def execute_spatial_query(query: str, *args):
+@asynccontextmanager
+async def raw_connection() -> AsyncIterator[asyncpg.Connection]:
+    """Borrow a pooled asyncpg connection for COPY and other driver-level operations"""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        yield conn
+
+
+def affected_rows(status: str) -> int:
+    """Row count from an asyncpg command status such as 'INSERT 0 42'"""
+    last = status.rsplit(" ", 1)[-1]
+    return int(last) if last.isdigit() else 0
+
+
+async def execute_spatial_query(query: str, *args) -> List[dict]:
     """Execute raw SQL query with PostGIS functions"""
-    db = await get_db()
-    return await db.query_raw(query, *args)
+    pool = await get_pool()
+    rows = await pool.fetch(query, *args)
+    return [dict(row) for row in rows]
+
+
+async def execute_spatial_command(query: str, *args) -> int:
+    """Execute raw SQL statement (INSERT/UPDATE/DELETE) and return affected rows"""
+    pool = await get_pool()
+    return affected_rows(await pool.execute(query, *args))
 
 
 async def create_point_wkt(lat: float, lon: float) -> str:
@@ -52,29 +149,27 @@ async def insert_with_geometry(
     lon_key: str = "longitude"
 ):
     """Helper to insert data with PostGIS geometry"""
-    db = await get_db()
-    
     # Extract lat/lon
     lat = data.pop(lat_key)
     lon = data.pop(lon_key)
-    
+
     # Build column and value strings
     columns = list(data.keys()) + [geometry_field]
     placeholders = []
     values = []
-    
+
     for i, (key, value) in enumerate(data.items(), 1):
         placeholders.append(f"${i}")
         values.append(value)
-    
+
     # Add geometry as WKT
     placeholders.append(f"ST_SetSRID(ST_MakePoint(${len(values) + 1}, ${len(values) + 2}), 4326)")
     values.extend([lon, lat])
-    
+
     query = f"""
         INSERT INTO {table} ({', '.join(columns)})
         VALUES ({', '.join(placeholders)})
         RETURNING *
     """
-    
-    return await db.query_raw(query, *values)
+
+    return await execute_spatial_query(query, *values)
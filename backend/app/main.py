@@ -5,6 +5,11 @@ import logging
 
 from app.core.config import settings
 from app.api.v1 import router as api_router
+from app.core.cache import close_cache, init_cache
+from app.core.database import close_db, init_db
+from app.services.jobs import shutdown_job_runner
+from app.services.partitions import ensure_upcoming_partitions
+from app.services.routing import close_routing
 
 # Configure logging
 logging.basicConfig(
@@ -22,12 +27,19 @@ async def lifespan(app: FastAPI):
     logger.info(f"Database: {settings.DATABASE_URL.split('@')[-1]}")
     
     # Startup: Initialize connections, load models, etc.
-    # TODO: Connect to DB, Redis, load ML models
+    await init_db()
+    await ensure_upcoming_partitions()
+    await init_cache()
+    # TODO: Load ML models
     
     yield
     
     # Shutdown: Clean up resources
     logger.info("👋 Shutting down SmartBlink backend...")
+    shutdown_job_runner()
+    await close_routing()
+    await close_cache()
+    await close_db()
 
 
 app = FastAPI(
@@ -0,0 +1,163 @@
+"""
+Columnar order loading and H3 aggregation kernels
+
+Pulls order coordinates as NumPy arrays, assigns H3 cells in bulk and
+aggregates orders per hexagon with vectorized group-bys.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from itertools import repeat
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+from h3.api import basic_int as h3
+
+from app.core.database import execute_spatial_query
+
+
+HOURS_PER_DAY = 24
+
+
+@dataclass
+class OrderArrays:
+    """Columnar order data used by the aggregation kernels"""
+    latitude: np.ndarray
+    longitude: np.ndarray
+    timestamp: np.ndarray  # datetime64[s]
+    order_value: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.latitude)
+
+    @property
+    def day(self) -> np.ndarray:
+        return self.timestamp.astype("datetime64[D]")
+
+    @property
+    def hour(self) -> np.ndarray:
+        return ((self.timestamp - self.day) // np.timedelta64(1, "h")).astype(np.int64)
+
+
+@dataclass
+class CellAggregates:
+    """Per-hexagon demand aggregates, one row per H3 cell"""
+    h3_index: np.ndarray  # uint64 H3 cell ids
+    orders_count: np.ndarray
+    total_order_value: np.ndarray
+    peak_hour: np.ndarray
+    hourly_counts: np.ndarray  # (N, 24) order histogram by hour of day
+
+    def __len__(self) -> int:
+        return len(self.h3_index)
+
+
+def latlng_to_cells(latitude: np.ndarray, longitude: np.ndarray, resolution: int) -> np.ndarray:
+    """Assign H3 cells to coordinate arrays in one pass, returning uint64 cell ids"""
+    return np.fromiter(
+        map(h3.latlng_to_cell, latitude.tolist(), longitude.tolist(), repeat(resolution)),
+        dtype=np.uint64,
+        count=len(latitude),
+    )
+
+
+def aggregate_by_cell(
+    cells: np.ndarray,
+    order_value: np.ndarray,
+    hour: np.ndarray,
+    orders_count: Optional[np.ndarray] = None,
+) -> CellAggregates:
+    """
+    Group rows by H3 cell and compute count, value sum and peak hour
+
+    `orders_count` lets callers aggregate pre-counted rows (e.g. cube slices);
+    by default each row is a single order.
+    """
+    if len(cells) == 0:
+        empty = np.array([], dtype=np.int64)
+        return CellAggregates(
+            np.array([], dtype=np.uint64), empty, np.array([]), empty,
+            np.zeros((0, HOURS_PER_DAY), dtype=np.int64),
+        )
+
+    weights = np.ones(len(cells), dtype=np.int64) if orders_count is None else orders_count
+    unique_cells, inverse = np.unique(cells, return_inverse=True)
+    n_cells = len(unique_cells)
+
+    counts = np.bincount(inverse, weights=weights, minlength=n_cells).astype(np.int64)
+    values = np.bincount(inverse, weights=order_value, minlength=n_cells)
+
+    # Hour-of-day histogram per cell; argmax picks the earliest hour on ties
+    hourly = np.bincount(
+        inverse * HOURS_PER_DAY + hour.astype(np.int64),
+        weights=weights,
+        minlength=n_cells * HOURS_PER_DAY,
+    ).reshape(n_cells, HOURS_PER_DAY).astype(np.int64)
+
+    return CellAggregates(
+        h3_index=unique_cells,
+        orders_count=counts,
+        total_order_value=values,
+        peak_hour=hourly.argmax(axis=1),
+        hourly_counts=hourly,
+    )
+
+
+def cell_centroids(cells: np.ndarray) -> np.ndarray:
+    """Return an (N, 2) array of lat/lon centroids for H3 cells"""
+    return np.array([h3.cell_to_latlng(int(c)) for c in cells], dtype=np.float64).reshape(-1, 2)
+
+
+def to_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Timezone-aware datetimes -> naive UTC, matching the TIMESTAMP columns"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def build_time_filter(
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    column: str = "timestamp",
+) -> Tuple[str, List[Any]]:
+    """Build a WHERE clause on a timestamp column with positional parameters"""
+    start_date, end_date = to_naive_utc(start_date), to_naive_utc(end_date)
+    clauses = []
+    args: List[Any] = []
+    if start_date is not None:
+        args.append(start_date)
+        clauses.append(f"{column} >= ${len(args)}")
+    if end_date is not None:
+        args.append(end_date)
+        clauses.append(f"{column} <= ${len(args)}")
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return where, args
+
+
+async def load_order_arrays(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+) -> OrderArrays:
+    """Load order coordinates, timestamps and values as NumPy arrays"""
+    where, args = build_time_filter(start_date, end_date)
+    rows = await execute_spatial_query(
+        f"""
+        SELECT
+            ST_Y(location) AS latitude,
+            ST_X(location) AS longitude,
+            EXTRACT(EPOCH FROM timestamp)::FLOAT8 AS epoch,
+            COALESCE(order_value, 0) AS order_value
+        FROM orders
+        {where}
+        """,
+        *args,
+    )
+
+    n = len(rows)
+    return OrderArrays(
+        latitude=np.fromiter((r["latitude"] for r in rows), dtype=np.float64, count=n),
+        longitude=np.fromiter((r["longitude"] for r in rows), dtype=np.float64, count=n),
+        timestamp=np.fromiter((r["epoch"] for r in rows), dtype=np.float64, count=n)
+        .astype(np.int64)
+        .astype("datetime64[s]"),
+        order_value=np.fromiter((r["order_value"] for r in rows), dtype=np.float64, count=n),
+    )
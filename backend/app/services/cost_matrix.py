@@ -0,0 +1,295 @@
+"""
+Memory-mapped cost-matrix store
+
+Cell x candidate travel-time matrices are saved under COST_MATRIX_DIR as
+.npy files and opened read-only with mmap, so every solver process maps the
+same pages instead of unpickling its own copy: a MappedMatrix pickles as its
+file path and is re-mapped on the other side.
+
+Entries are keyed by (demand cell set, resolution, candidate set, speed
+model); the demand cell set stands in for the city, since placement runs
+over whatever cells had orders in the window. Each entry also keeps its row
+and column H3 cells, so a later run (in any process, after restarts) can
+reuse the matrix by key alone for a warm start. Two layouts are kept:
+
+- dense: float16 minutes, (cells, candidates). Half the size of the float32
+  matrix the solvers used to hold, with under 0.05% rounding, and consumed as-is
+  since NumPy upcasts each block to the float32 it is combined with.
+- sparse: CSR over the pairs within a max SLA, travel times as uint16
+  seconds. Pairs beyond the SLA are dropped, which is all coverage-style
+  objectives need.
+
+Entries are written to a temp directory and renamed into place, so
+concurrent builders never see partial files; the oldest entries are pruned
+once the store exceeds COST_MATRIX_MAX_BYTES. Entries used within the last
+PRUNE_GRACE_SECONDS are kept, and a matrix whose file is gone pickles as its
+data, so instances held in memory still reach the solver workers.
+"""
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+DENSE_FILE = "cost.npy"
+CELLS_FILE = "cells.npy"  # H3 cell of each row
+CANDIDATES_FILE = "candidates.npy"  # H3 cell of each column
+META_FILE = "meta.json"
+
+# uint16 seconds saturate here (~18 hours), far beyond any delivery SLA
+MAX_SECONDS = np.iinfo(np.uint16).max
+
+# Cells converted per block when building the sparse layout
+SPARSE_ROW_BLOCK = 4096
+
+# Entries touched this recently are never pruned; covers the hop from
+# pickling a matrix in one process to mapping it in another
+PRUNE_GRACE_SECONDS = 120
+
+
+class MappedMatrix(np.ndarray):
+    """Read-only memory-mapped array that pickles as its file path"""
+    path: Optional[str] = None
+
+    def __array_finalize__(self, obj):
+        # Slices and results are ordinary data, only the mapped file itself travels by path
+        self.path = None
+
+    def __array_wrap__(self, array, context=None, return_scalar=False):
+        array = np.asarray(array)
+        return array[()] if return_scalar else array
+
+    def __reduce__(self):
+        if self.path is not None and os.path.exists(self.path):
+            _touch_entry(self.path)
+            return open_mapped, (self.path,)
+        # Pruned since it was mapped: this process still reads it, others could not
+        return np.asarray(self).__reduce__()
+
+
+def open_mapped(path: str) -> MappedMatrix:
+    """Map a saved .npy file read-only"""
+    array = np.load(path, mmap_mode="r").view(MappedMatrix)
+    array.path = path
+    return array
+
+
+@dataclass
+class SparseCostMatrix:
+    """Cell x candidate pairs within max_minutes, in CSR layout"""
+    indptr: np.ndarray  # (cells + 1,) int64
+    indices: np.ndarray  # candidate per pair, int32
+    seconds: np.ndarray  # travel time per pair, uint16
+    n_candidates: int
+    max_minutes: float
+
+    @property
+    def n_cells(self) -> int:
+        return len(self.indptr) - 1
+
+    @property
+    def nnz(self) -> int:
+        return len(self.indices)
+
+    def row(self, cell: int) -> slice:
+        return slice(int(self.indptr[cell]), int(self.indptr[cell + 1]))
+
+
+def speed_model_tag(routed: bool = False) -> str:
+    """Identifies how travel times were produced, so a new model never reads stale matrices"""
+    if routed:
+        return "osrm"
+    return f"model-{settings.DELIVERY_SPEED_KMH:g}kmh-{settings.ROAD_DETOUR_FACTOR:g}x"
+
+
+def _digest(cells: np.ndarray) -> str:
+    return hashlib.sha1(np.ascontiguousarray(cells, dtype=np.uint64).tobytes()).hexdigest()[:16]
+
+
+def matrix_key(
+    cell_h3: np.ndarray,
+    candidate_h3: np.ndarray,
+    resolution: int,
+    speed_model: str,
+) -> str:
+    """Store key of a (demand cells, resolution, candidate set, speed model) matrix"""
+    return f"r{resolution}-{_digest(cell_h3)}-{_digest(candidate_h3)}-{speed_model}"
+
+
+def _entry_dir(key: str) -> str:
+    return os.path.join(settings.COST_MATRIX_DIR, key)
+
+
+def _touch_entry(path: str):
+    """Mark the store entry holding `path` as recently used"""
+    relative = os.path.relpath(path, settings.COST_MATRIX_DIR)
+    if relative.startswith(os.pardir):
+        return
+    try:
+        os.utime(_entry_dir(relative.split(os.sep)[0]))
+    except OSError:
+        pass
+
+
+def _sparse_dir(key: str, max_minutes: float) -> str:
+    return os.path.join(_entry_dir(key), f"sparse-{max_minutes:g}min")
+
+
+def _publish(build: Callable[[str], None], target: str, marker: str):
+    """
+    Build files in a temp directory next to `target` and rename it into place
+
+    If `target` already exists (another builder won, or a sparse layout
+    created the entry first), the files it lacks are renamed into it one by
+    one, `marker` (the file readers check for) last.
+    """
+    parent = os.path.dirname(target)
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".building-", dir=parent)
+    try:
+        build(staging)
+        try:
+            os.rename(staging, target)
+        except OSError:
+            if not os.path.isdir(target):
+                raise
+            names = sorted(os.listdir(staging), key=lambda name: name == marker)
+            for name in names:
+                if not os.path.exists(os.path.join(target, name)):
+                    os.rename(os.path.join(staging, name), os.path.join(target, name))
+            shutil.rmtree(staging, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+
+def _store_size() -> int:
+    total = 0
+    for root, _, files in os.walk(settings.COST_MATRIX_DIR):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+def prune_store(max_bytes: Optional[int] = None):
+    """Delete least recently used entries until the store fits in max_bytes"""
+    max_bytes = settings.COST_MATRIX_MAX_BYTES if max_bytes is None else max_bytes
+    if not os.path.isdir(settings.COST_MATRIX_DIR) or _store_size() <= max_bytes:
+        return
+    recent = time.time() - PRUNE_GRACE_SECONDS
+    entries = sorted(
+        (os.path.join(settings.COST_MATRIX_DIR, name) for name in os.listdir(settings.COST_MATRIX_DIR)
+         if not name.startswith(".")),
+        key=os.path.getmtime,
+    )
+    # Open mappings keep working after unlink in the processes holding them;
+    # elsewhere they pickle as data (MappedMatrix.__reduce__)
+    for path in entries[:-1]:
+        if os.path.getmtime(path) >= recent:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        logger.info(f"🧹 Pruned cost matrix {os.path.basename(path)}")
+        if _store_size() <= max_bytes:
+            break
+
+
+def load_cost_matrix(
+    key: str,
+    compute: Callable[[], np.ndarray],
+    cell_h3: np.ndarray,
+    candidate_h3: np.ndarray,
+) -> MappedMatrix:
+    """
+    Dense float16 minutes matrix for `key`, computing and saving it on a miss
+
+    `compute` returns the (cells, candidates) matrix in minutes; `cell_h3` and
+    `candidate_h3` label its rows and columns.
+    """
+    path = os.path.join(_entry_dir(key), DENSE_FILE)
+    if os.path.exists(path):
+        os.utime(_entry_dir(key))
+        return open_mapped(path)
+
+    started = time.perf_counter()
+    minutes = np.asarray(compute())
+
+    def build(staging: str):
+        np.save(os.path.join(staging, DENSE_FILE), minutes.astype(np.float16))
+        np.save(os.path.join(staging, CELLS_FILE), np.asarray(cell_h3, dtype=np.uint64))
+        np.save(os.path.join(staging, CANDIDATES_FILE), np.asarray(candidate_h3, dtype=np.uint64))
+        with open(os.path.join(staging, META_FILE), "w") as f:
+            json.dump({"key": key, "shape": list(minutes.shape), "created_at": time.time()}, f)
+
+    _publish(build, _entry_dir(key), DENSE_FILE)
+    logger.info(
+        f"💾 Saved cost matrix {key} {minutes.shape[0]:,} x {minutes.shape[1]:,} "
+        f"in {time.perf_counter() - started:.1f}s"
+    )
+    prune_store()
+    return open_mapped(path)
+
+
+def open_cost_matrix(key: str) -> Optional[Tuple[MappedMatrix, MappedMatrix, MappedMatrix]]:
+    """Stored (matrix, row cells, column cells) for `key`, or None if it is not in the store"""
+    entry = _entry_dir(key)
+    paths = [os.path.join(entry, name) for name in (DENSE_FILE, CELLS_FILE, CANDIDATES_FILE)]
+    if not all(os.path.exists(path) for path in paths):
+        return None
+    os.utime(entry)
+    return tuple(open_mapped(path) for path in paths)
+
+
+def to_sparse(minutes: np.ndarray, max_minutes: float) -> SparseCostMatrix:
+    """CSR of the pairs within max_minutes, built row-block by row-block"""
+    indptr = [np.zeros(1, dtype=np.int64)]
+    indices, seconds = [], []
+    offset = 0
+    for start in range(0, minutes.shape[0], SPARSE_ROW_BLOCK):
+        block = np.asarray(minutes[start:start + SPARSE_ROW_BLOCK], dtype=np.float32)
+        rows, cols = np.nonzero(block <= max_minutes)
+        indices.append(cols.astype(np.int32))
+        seconds.append(np.minimum(np.rint(block[rows, cols] * 60.0), MAX_SECONDS).astype(np.uint16))
+        counts = np.bincount(rows, minlength=len(block))
+        indptr.append(offset + np.cumsum(counts))
+        offset += len(rows)
+    return SparseCostMatrix(
+        indptr=np.concatenate(indptr),
+        indices=np.concatenate(indices) if indices else np.array([], dtype=np.int32),
+        seconds=np.concatenate(seconds) if seconds else np.array([], dtype=np.uint16),
+        n_candidates=minutes.shape[1],
+        max_minutes=max_minutes,
+    )
+
+
+def load_sparse_cost_matrix(key: str, max_minutes: float, dense: np.ndarray) -> SparseCostMatrix:
+    """Sparse variant of a stored matrix for one SLA, built from `dense` on a miss"""
+    target = _sparse_dir(key, max_minutes)
+    if not os.path.exists(os.path.join(target, "indptr.npy")):
+        sparse = to_sparse(dense, max_minutes)
+
+        def build(staging: str):
+            for name in ("indptr", "indices", "seconds"):
+                np.save(os.path.join(staging, f"{name}.npy"), getattr(sparse, name))
+
+        _publish(build, target, "indptr.npy")
+        logger.info(
+            f"💾 Saved sparse cost matrix {key} at {max_minutes:g} min "
+            f"({sparse.nnz:,} of {dense.shape[0] * dense.shape[1]:,} pairs)"
+        )
+
+    return SparseCostMatrix(
+        indptr=open_mapped(os.path.join(target, "indptr.npy")),
+        indices=open_mapped(os.path.join(target, "indices.npy")),
+        seconds=open_mapped(os.path.join(target, "seconds.npy")),
+        n_candidates=dense.shape[1],
+        max_minutes=max_minutes,
+    )
@@ -0,0 +1,188 @@
+"""
+Store coverage analysis
+
+Works on demand-cube cells rather than raw orders: each cell gets the travel
+time to its nearest active store (routed when OSRM is enabled, otherwise the
+speed model), then every threshold is answered from a single sort of those
+times with cumulative order and area sums. Isochrone polygons can replace the
+travel-time test for deciding which cells count as covered.
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from h3.api import basic_int as h3
+
+from app.core.config import settings
+from app.core.database import execute_spatial_query
+from app.services.distance import travel_time_minutes
+from app.services.heatmap import resolve_resolution
+from app.services.optimization import DemandPoints, StorePoints, load_demand_points, load_store_points
+from app.services.routing import cell_store_times
+from app.services.spatial_index import PointIndex
+
+# Cells whose centroid lies inside an active store's isochrone of each requested time
+ISOCHRONE_CELLS_SQL = """
+    SELECT i.time_minutes, array_agg(DISTINCT c.position) AS positions
+    FROM unnest($1::FLOAT8[], $2::FLOAT8[]) WITH ORDINALITY AS c(latitude, longitude, position)
+    JOIN isochrones i
+        ON ST_Contains(i.geometry, ST_SetSRID(ST_MakePoint(c.longitude, c.latitude), 4326))
+    JOIN stores s ON s.id = i.store_id AND s.is_active = TRUE
+    WHERE i.time_minutes = ANY($3::INT[])
+    GROUP BY i.time_minutes
+"""
+
+
+def cell_areas_km2(cells: np.ndarray) -> np.ndarray:
+    """Exact area of each H3 cell"""
+    return np.fromiter((h3.cell_area(int(c), unit="km^2") for c in cells), dtype=np.float64, count=len(cells))
+
+
+async def nearest_store_times(demand: DemandPoints, stores: StorePoints) -> np.ndarray:
+    """Minutes from each cell to its nearest store (inf without stores)"""
+    if not len(stores):
+        return np.full(len(demand), np.inf)
+    if settings.OSRM_ENABLED:
+        seconds = await cell_store_times(demand.h3_index, stores.id, stores.latitude, stores.longitude)
+        return seconds.min(axis=1) / 60.0
+    _, nearest_m = PointIndex(stores.id, stores.latitude, stores.longitude).nearest(
+        demand.latitude, demand.longitude,
+    )
+    return travel_time_minutes(nearest_m[:, 0]).astype(np.float64)
+
+
+def threshold_coverage(
+    best_time: np.ndarray,
+    orders: np.ndarray,
+    area_km2: np.ndarray,
+    thresholds: Sequence[float],
+) -> List[Dict[str, Any]]:
+    """Orders and area within each threshold from one sort of per-cell travel times"""
+    order = np.argsort(best_time, kind="stable")
+    sorted_time = best_time[order]
+    cum_orders = np.concatenate([[0.0], np.cumsum(orders[order])])
+    cum_area = np.concatenate([[0.0], np.cumsum(area_km2[order])])
+    total_orders, total_area = cum_orders[-1], cum_area[-1]
+
+    within = np.searchsorted(sorted_time, np.asarray(thresholds, dtype=np.float64), side="right")
+    return [
+        _threshold_row(minutes, cum_orders[k], cum_area[k], total_orders, total_area)
+        for minutes, k in zip(thresholds, within)
+    ]
+
+
+def mask_coverage(
+    covered: Dict[int, np.ndarray],
+    orders: np.ndarray,
+    area_km2: np.ndarray,
+    thresholds: Sequence[float],
+) -> List[Dict[str, Any]]:
+    """Orders and area within each threshold from explicit covered-cell masks"""
+    total_orders, total_area = float(orders.sum()), float(area_km2.sum())
+    return [
+        _threshold_row(
+            minutes,
+            float(orders @ covered[minutes]) if minutes in covered else 0.0,
+            float(area_km2 @ covered[minutes]) if minutes in covered else 0.0,
+            total_orders,
+            total_area,
+        )
+        for minutes in thresholds
+    ]
+
+
+def _threshold_row(minutes, orders, area, total_orders, total_area) -> Dict[str, Any]:
+    return {
+        "minutes": minutes,
+        "orders_covered": int(round(orders)),
+        "orders_percentage": round(100.0 * orders / total_orders, 2) if total_orders else 0.0,
+        "area_km2": round(float(area), 3),
+        "area_percentage": round(100.0 * area / total_area, 2) if total_area else 0.0,
+    }
+
+
+def weighted_quantiles(values: np.ndarray, weights: np.ndarray, quantiles: Sequence[float]) -> List[float]:
+    """Order-weighted quantiles of per-cell values"""
+    finite = np.isfinite(values) & (weights > 0)
+    if not finite.any():
+        return [0.0 for _ in quantiles]
+    order = np.argsort(values[finite])
+    cumulative = np.cumsum(weights[finite][order])
+    positions = np.searchsorted(cumulative, np.asarray(quantiles) * cumulative[-1], side="left")
+    return [float(values[finite][order][min(p, len(order) - 1)]) for p in positions]
+
+
+async def isochrone_masks(demand: DemandPoints, thresholds: Sequence[int]) -> Dict[int, np.ndarray]:
+    """Covered-cell mask per threshold from stored isochrone polygons"""
+    rows = await execute_spatial_query(
+        ISOCHRONE_CELLS_SQL,
+        demand.latitude.tolist(), demand.longitude.tolist(), [int(t) for t in thresholds],
+    )
+    masks = {}
+    for row in rows:
+        mask = np.zeros(len(demand), dtype=bool)
+        mask[np.asarray(row["positions"], dtype=np.int64) - 1] = True  # ORDINALITY is 1-based
+        masks[row["time_minutes"]] = mask
+    return masks
+
+
+async def analyze_coverage(
+    thresholds: Optional[Sequence[int]] = None,
+    max_delivery_time_minutes: float = 10,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    resolution: str = "medium",
+    use_isochrones: bool = False,
+) -> Dict[str, Any]:
+    """
+    Coverage of historical demand by active stores at several delivery-time thresholds
+
+    With `use_isochrones`, every threshold must be one of ISOCHRONE_MINUTES,
+    since only those have polygons; others raise ValueError.
+    """
+    default = settings.ISOCHRONE_MINUTES if use_isochrones else settings.COVERAGE_THRESHOLDS_MINUTES
+    thresholds = sorted(set(thresholds or default) | {max_delivery_time_minutes})
+    if use_isochrones:
+        missing = sorted(set(thresholds) - set(settings.ISOCHRONE_MINUTES))
+        if missing:
+            raise ValueError(
+                f"No isochrones are built for {missing} minutes; "
+                f"use thresholds from {sorted(settings.ISOCHRONE_MINUTES)} or use_isochrones=false"
+            )
+    demand = await load_demand_points(start_date, end_date, resolve_resolution(resolution))
+    stores = await load_store_points()
+
+    orders = demand.orders_count.astype(np.float64)
+    area = cell_areas_km2(demand.h3_index)
+    best_time = await nearest_store_times(demand, stores)
+
+    if use_isochrones:
+        rows = mask_coverage(await isochrone_masks(demand, thresholds), orders, area, thresholds)
+    else:
+        rows = threshold_coverage(best_time, orders, area, thresholds)
+    headline = next(r for r in rows if r["minutes"] == max_delivery_time_minutes)
+
+    served = np.isfinite(best_time)
+    served_orders = float(orders[served].sum())
+    p50, p90 = weighted_quantiles(best_time, orders, (0.5, 0.9))
+
+    return {
+        "coverage_percentage": headline["orders_percentage"],
+        "area_coverage_percentage": headline["area_percentage"],
+        "avg_delivery_time_minutes": round(float(orders[served] @ best_time[served]) / served_orders, 2)
+        if served_orders else 0,
+        "median_delivery_time_minutes": round(p50, 2),
+        "p90_delivery_time_minutes": round(p90, 2),
+        "stores_count": len(stores),
+        "thresholds": rows,
+        "metadata": {
+            "max_delivery_time_minutes": max_delivery_time_minutes,
+            "total_orders": int(orders.sum()),
+            "demand_cells": len(demand),
+            "demand_area_km2": round(float(area.sum()), 3),
+            "travel_time_source": "osrm" if settings.OSRM_ENABLED else "speed_model",
+            "coverage_source": "isochrones" if use_isochrones else "travel_time",
+            "start_date": start_date.isoformat() if start_date else None,
+            "end_date": end_date.isoformat() if end_date else None,
+        },
+    }
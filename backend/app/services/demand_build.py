@@ -0,0 +1,224 @@
+"""
+Parallel full rebuild of demand_cells
+
+Orders are sharded by their H3 parent cell (DEMAND_BUILD_SHARD_RESOLUTION)
+so every demand cell belongs to exactly one shard and shards can be
+aggregated independently in a process pool with no cross-shard merge:
+
+1. Cell assignment: order coordinates are split into fixed-size chunks and
+   mapped to DEMAND_CELLS_RESOLUTION cells in the workers.
+2. Sharding: cells are grouped by parent; shards holding more than their
+   fair share of orders are split by finer parents so one busy downtown
+   shard does not serialize the build.
+3. Aggregation: each shard becomes a CellDelta in a worker, largest first.
+   As shards complete they are COPYed into a staging table and inserted
+   into demand_cells, overlapping database writes with aggregation.
+
+The rebuild runs in one transaction, so readers keep seeing the previous
+cells until it commits.
+"""
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+
+import numpy as np
+from h3.api import basic_int as h3
+
+from app.core.config import settings
+from app.core.database import affected_rows, raw_connection
+from app.services.aggregation import OrderArrays, latlng_to_cells, load_order_arrays
+from app.services.demand_cells import CellDelta, compute_cell_delta
+
+logger = logging.getLogger(__name__)
+
+# Orders per cell-assignment task
+ASSIGN_CHUNK_SIZE = 250_000
+
+# Shards per worker to aim for when splitting heavy shards
+SHARDS_PER_WORKER = 4
+
+STAGING_COLUMNS = [
+    "h3_index", "wkt", "orders_count", "total_order_value",
+    "peak_hour", "hourly_counts", "period_start", "period_end",
+]
+
+CREATE_STAGING_SQL = """
+    CREATE TEMP TABLE demand_cells_staging (
+        h3_index TEXT,
+        wkt TEXT,
+        orders_count INTEGER,
+        total_order_value DOUBLE PRECISION,
+        peak_hour INTEGER,
+        hourly_counts TEXT,
+        period_start TIMESTAMP(3),
+        period_end TIMESTAMP(3)
+    ) ON COMMIT DROP
+"""
+
+INSERT_FROM_STAGING_SQL = """
+    INSERT INTO demand_cells (
+        h3_index, cell_geometry, demand_score, orders_count,
+        total_order_value, avg_order_value, peak_hour, hourly_counts,
+        period_start, period_end, created_at
+    )
+    SELECT
+        h3_index,
+        ST_SetSRID(ST_GeomFromText(wkt), 4326),
+        LEAST(orders_count / 10.0, 10.0),
+        orders_count,
+        total_order_value,
+        total_order_value / orders_count,
+        peak_hour,
+        hourly_counts::INT[],
+        period_start,
+        period_end,
+        NOW()
+    FROM demand_cells_staging
+"""
+
+
+def take(orders: OrderArrays, index: np.ndarray) -> OrderArrays:
+    return OrderArrays(
+        latitude=orders.latitude[index],
+        longitude=orders.longitude[index],
+        timestamp=orders.timestamp[index],
+        order_value=orders.order_value[index],
+    )
+
+
+def shard_keys(
+    cells: np.ndarray,
+    cell_orders: np.ndarray,
+    shard_resolution: int,
+    max_orders: float,
+) -> np.ndarray:
+    """
+    Shard key (an H3 parent) for each unique cell
+
+    Starts at shard_resolution and refines only the shards above max_orders
+    to finer parents, down to the cells' own resolution.
+    """
+    cell_resolution = h3.get_resolution(int(cells[0]))
+    resolution = min(shard_resolution, cell_resolution)
+    keys = np.fromiter(
+        (h3.cell_to_parent(c, resolution) for c in cells.tolist()), dtype=np.uint64, count=len(cells),
+    )
+    while resolution < cell_resolution:
+        _, inverse = np.unique(keys, return_inverse=True)
+        heavy = np.bincount(inverse, weights=cell_orders)[inverse] > max_orders
+        if not heavy.any():
+            break
+        resolution += 1
+        keys[heavy] = [h3.cell_to_parent(c, resolution) for c in cells[heavy].tolist()]
+    return keys
+
+
+def build_worker_pool(workers: int) -> Optional[Executor]:
+    """Spawned process pool (None runs everything inline)"""
+    if workers <= 1:
+        return None
+    # spawn: workers must not inherit the event loop or DB sockets
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+async def _run(pool: Optional[Executor], fn, *args):
+    if pool is None:
+        return fn(*args)
+    return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+
+
+async def _write_shard(conn, delta: CellDelta) -> int:
+    """COPY one shard's cells into staging and insert them into demand_cells"""
+    records = list(zip(
+        delta.h3_index, delta.wkt, delta.orders_count, delta.total_order_value,
+        delta.peak_hour, delta.hourly_counts, delta.period_start, delta.period_end,
+    ))
+    await conn.copy_records_to_table("demand_cells_staging", records=records, columns=STAGING_COLUMNS)
+    written = affected_rows(await conn.execute(INSERT_FROM_STAGING_SQL))
+    await conn.execute("TRUNCATE demand_cells_staging")
+    return written
+
+
+async def build_demand_cells(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    workers: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Rebuild demand_cells from the orders in [start_date, end_date]
+
+    `workers` defaults to DEMAND_BUILD_WORKERS, or every core when that is 0.
+    distance_to_nearest_store is left empty; run refresh_store_distances()
+    afterwards.
+    """
+    workers = workers or settings.DEMAND_BUILD_WORKERS or os.cpu_count() or 1
+    resolution = settings.DEMAND_CELLS_RESOLUTION
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+
+    orders = await load_order_arrays(start_date, end_date)
+    timings["load_seconds"] = time.perf_counter() - started
+    if len(orders) == 0:
+        logger.warning("⚠️ No orders to build demand cells from")
+        return {"orders": 0, "cells": 0, "shards": 0, "workers": workers}
+
+    pool = build_worker_pool(workers)
+    try:
+        # 1. Cell assignment in chunks
+        step = time.perf_counter()
+        chunks = await asyncio.gather(*(
+            _run(pool, latlng_to_cells, orders.latitude[i:i + ASSIGN_CHUNK_SIZE],
+                 orders.longitude[i:i + ASSIGN_CHUNK_SIZE], resolution)
+            for i in range(0, len(orders), ASSIGN_CHUNK_SIZE)
+        ))
+        cells = np.concatenate(chunks)
+        timings["assign_seconds"] = time.perf_counter() - step
+
+        # 2. Shard by parent cell
+        step = time.perf_counter()
+        unique_cells, inverse, cell_orders = np.unique(cells, return_inverse=True, return_counts=True)
+        keys = shard_keys(
+            unique_cells, cell_orders, settings.DEMAND_BUILD_SHARD_RESOLUTION,
+            max_orders=len(orders) / (workers * SHARDS_PER_WORKER),
+        )[inverse]
+        order = np.argsort(keys, kind="stable")
+        boundaries = np.flatnonzero(np.diff(keys[order])) + 1
+        shards: List[np.ndarray] = sorted(np.split(order, boundaries), key=len, reverse=True)
+        timings["shard_seconds"] = time.perf_counter() - step
+
+        # 3. Aggregate shards in the pool, writing each as it completes
+        step = time.perf_counter()
+        tasks = [
+            asyncio.ensure_future(_run(pool, compute_cell_delta, take(orders, index), resolution, cells[index]))
+            for index in shards
+        ]
+        written = 0
+        async with raw_connection() as conn:
+            async with conn.transaction():
+                await conn.execute(CREATE_STAGING_SQL)
+                await conn.execute("DELETE FROM demand_cells")
+                for completed in asyncio.as_completed(tasks):
+                    written += await _write_shard(conn, await completed)
+        timings["aggregate_write_seconds"] = time.perf_counter() - step
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"🗺️  Built {written:,} demand cells from {len(orders):,} orders in {elapsed:.1f}s "
+        f"({len(shards)} shards, {workers} workers)"
+    )
+    return {
+        "orders": len(orders),
+        "cells": written,
+        "shards": len(shards),
+        "workers": workers,
+        "elapsed_seconds": round(elapsed, 3),
+        **{name: round(value, 3) for name, value in timings.items()},
+    }
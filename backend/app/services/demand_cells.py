@@ -0,0 +1,222 @@
+"""
+Incremental demand_cells maintenance
+
+Folds newly ingested orders into their H3 cell's running counters (count,
+value sum, hourly histogram, peak hour and period bounds) with a single
+upsert per batch, so demand_cells never needs a table-wide rebuild.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+import numpy as np
+from h3.api import basic_int as h3
+
+from app.core.config import settings
+from app.core.database import affected_rows, execute_spatial_query, raw_connection
+from app.services.aggregation import (
+    OrderArrays,
+    aggregate_by_cell,
+    latlng_to_cells,
+)
+from app.services.demand_cube import add_slices, slice_orders
+from app.services.distance import nearest_two
+
+logger = logging.getLogger(__name__)
+
+# Cells per upsert statement
+CELLS_WRITE_BATCH = 10_000
+
+# Counters are added to existing rows; the hourly histogram is merged
+# element-wise and period bounds are widened.
+UPSERT_CELLS_SQL = """
+    INSERT INTO demand_cells (
+        h3_index, cell_geometry, demand_score, orders_count,
+        total_order_value, avg_order_value, peak_hour, hourly_counts,
+        period_start, period_end, created_at
+    )
+    SELECT
+        s.h3_index,
+        ST_SetSRID(ST_GeomFromText(s.wkt), 4326),
+        LEAST(s.orders_count / 10.0, 10.0),
+        s.orders_count,
+        s.total_order_value,
+        s.total_order_value / s.orders_count,
+        s.peak_hour,
+        s.hourly_counts::INT[],
+        s.period_start,
+        s.period_end,
+        NOW()
+    FROM unnest(
+        $1::TEXT[], $2::TEXT[], $3::INT[], $4::FLOAT8[],
+        $5::INT[], $6::TEXT[], $7::TIMESTAMP[], $8::TIMESTAMP[]
+    ) AS s(
+        h3_index, wkt, orders_count, total_order_value,
+        peak_hour, hourly_counts, period_start, period_end
+    )
+    ON CONFLICT (h3_index) DO UPDATE SET
+        orders_count = demand_cells.orders_count + EXCLUDED.orders_count,
+        total_order_value = COALESCE(demand_cells.total_order_value, 0) + EXCLUDED.total_order_value,
+        avg_order_value = (COALESCE(demand_cells.total_order_value, 0) + EXCLUDED.total_order_value)
+            / (demand_cells.orders_count + EXCLUDED.orders_count),
+        demand_score = LEAST((demand_cells.orders_count + EXCLUDED.orders_count) / 10.0, 10.0),
+        hourly_counts = ARRAY(
+            SELECT COALESCE(old, 0) + COALESCE(new, 0)
+            FROM unnest(demand_cells.hourly_counts, EXCLUDED.hourly_counts) AS h(old, new)
+        ),
+        period_start = LEAST(demand_cells.period_start, EXCLUDED.period_start),
+        period_end = GREATEST(demand_cells.period_end, EXCLUDED.period_end)
+"""
+
+# Peak hour has to be derived from the merged histogram, which the upsert
+# above cannot reference in the same SET list.
+UPDATE_PEAK_HOUR_SQL = """
+    UPDATE demand_cells
+    SET peak_hour = (
+        SELECT h.hour - 1
+        FROM unnest(hourly_counts) WITH ORDINALITY AS h(orders, hour)
+        ORDER BY h.orders DESC, h.hour
+        LIMIT 1
+    )
+    WHERE h3_index = ANY($1::TEXT[])
+"""
+
+UPDATE_STORE_DISTANCE_SQL = """
+    UPDATE demand_cells AS d
+    SET distance_to_nearest_store = s.distance
+    FROM unnest($1::TEXT[], $2::FLOAT8[]) AS s(h3_index, distance)
+    WHERE d.h3_index = s.h3_index
+"""
+
+
+@dataclass
+class CellDelta:
+    """Counter increments for a batch of orders, one row per H3 cell"""
+    h3_index: List[str]
+    wkt: List[str]
+    orders_count: List[int]
+    total_order_value: List[float]
+    peak_hour: List[int]
+    hourly_counts: List[str]  # Postgres array literals, e.g. '{0,1,...}'
+    period_start: List[Any]
+    period_end: List[Any]
+
+    def __len__(self) -> int:
+        return len(self.h3_index)
+
+    def batches(self, size: int = CELLS_WRITE_BATCH):
+        """Yield upsert argument lists in `size` chunks"""
+        columns = [
+            self.h3_index, self.wkt, self.orders_count, self.total_order_value,
+            self.peak_hour, self.hourly_counts, self.period_start, self.period_end,
+        ]
+        for start in range(0, len(self), size):
+            yield [column[start:start + size] for column in columns]
+
+
+def cell_wkt(cell: int) -> str:
+    """WKT polygon of an H3 cell boundary (lon/lat order, closed ring)"""
+    ring = [f"{lng} {lat}" for lat, lng in h3.cell_to_boundary(cell)]
+    ring.append(ring[0])
+    return f"POLYGON(({', '.join(ring)}))"
+
+
+def period_bounds(inverse: np.ndarray, timestamp: np.ndarray, n_cells: int):
+    """Per-group min/max timestamp via one lexsort instead of per-cell scans"""
+    order = np.lexsort((timestamp, inverse))
+    sorted_groups = inverse[order]
+    first = np.searchsorted(sorted_groups, np.arange(n_cells), side="left")
+    last = np.searchsorted(sorted_groups, np.arange(n_cells), side="right") - 1
+    sorted_ts = timestamp[order]
+    return sorted_ts[first], sorted_ts[last]
+
+
+def compute_cell_delta(
+    orders: OrderArrays,
+    resolution: int,
+    cells: Optional[np.ndarray] = None,
+) -> CellDelta:
+    """Aggregate a batch of orders into per-cell counter increments (cells may be precomputed)"""
+    if cells is None:
+        cells = latlng_to_cells(orders.latitude, orders.longitude, resolution)
+    aggregates = aggregate_by_cell(cells, orders.order_value, orders.hour)
+
+    inverse = np.searchsorted(aggregates.h3_index, cells)
+    period_start, period_end = period_bounds(inverse, orders.timestamp, len(aggregates))
+
+    return CellDelta(
+        h3_index=[h3.int_to_str(c) for c in aggregates.h3_index.tolist()],
+        wkt=[cell_wkt(c) for c in aggregates.h3_index.tolist()],
+        orders_count=aggregates.orders_count.tolist(),
+        total_order_value=aggregates.total_order_value.tolist(),
+        peak_hour=aggregates.peak_hour.tolist(),
+        hourly_counts=[
+            "{" + ",".join(map(str, row)) + "}" for row in aggregates.hourly_counts.tolist()
+        ],
+        period_start=period_start.astype("datetime64[ms]").tolist(),
+        period_end=period_end.astype("datetime64[ms]").tolist(),
+    )
+
+
+async def fold_into_cells(orders: OrderArrays, conn) -> int:
+    """Add a batch of orders to the demand_cells counters on `conn`, returning cells touched"""
+    if len(orders) == 0:
+        return 0
+
+    delta = compute_cell_delta(orders, settings.DEMAND_CELLS_RESOLUTION)
+    for batch in delta.batches():
+        await conn.execute(UPSERT_CELLS_SQL, *batch)
+        await conn.execute(UPDATE_PEAK_HOUR_SQL, batch[0])
+    return len(delta)
+
+
+async def _fold(orders: OrderArrays, conn) -> Tuple[int, int]:
+    cells = await fold_into_cells(orders, conn)
+    slices = await add_slices(slice_orders(orders), conn)
+    return cells, slices
+
+
+async def fold_orders(orders: OrderArrays, conn=None) -> Dict[str, int]:
+    """
+    Fold newly ingested orders into both demand_cells and the demand cube
+
+    Both upserts run in one transaction, so cells and cube never drift
+    apart. Pass `conn` to fold inside the caller's transaction, e.g. the one
+    that inserted the orders.
+    """
+    if len(orders) == 0:
+        return {"orders": 0, "cells": 0, "cube_slices": 0}
+
+    if conn is not None:
+        cells, slices = await _fold(orders, conn)
+    else:
+        async with raw_connection() as conn:
+            async with conn.transaction():
+                cells, slices = await _fold(orders, conn)
+    logger.info(f"🗺️  Folded {len(orders):,} orders into {cells:,} demand cells")
+    return {"orders": len(orders), "cells": cells, "cube_slices": slices}
+
+
+async def refresh_store_distances() -> int:
+    """Recompute distance_to_nearest_store for every cell against active stores"""
+    # Imported here: optimization pulls in the solver stack, which cell folding on ingest never needs
+    from app.services.optimization import load_store_points
+
+    rows = await execute_spatial_query("SELECT h3_index FROM demand_cells WHERE h3_index IS NOT NULL")
+    stores = await load_store_points()
+    if not rows or not len(stores):
+        return 0
+
+    cells = [r["h3_index"] for r in rows]
+    centroids = np.array([h3.cell_to_latlng(h3.str_to_int(c)) for c in cells])
+    _, distance, _ = nearest_two(centroids[:, 0], centroids[:, 1], stores.latitude, stores.longitude)
+
+    updated = 0
+    async with raw_connection() as conn:
+        async with conn.transaction():
+            for start in range(0, len(cells), CELLS_WRITE_BATCH):
+                end = start + CELLS_WRITE_BATCH
+                updated += affected_rows(await conn.execute(
+                    UPDATE_STORE_DISTANCE_SQL, cells[start:end], distance[start:end].astype(float).tolist()
+                ))
+    return updated
@@ -0,0 +1,234 @@
+"""
+Multi-resolution demand cube
+
+Materializes order counts per (H3 cell, day, hour) at a fine base resolution in
+the demand_cube table. Coarser resolutions are derived by H3 parent roll-up and
+date windows by summing day slices, so reads never rescan the orders table.
+"""
+from dataclasses import dataclass
+from datetime import date, datetime, time
+from typing import Any, Dict, List, Optional
+import logging
+
+import numpy as np
+from h3.api import basic_int as h3
+
+from app.core.config import settings
+from app.core.database import affected_rows, execute_spatial_query, raw_connection
+from app.services.aggregation import (
+    HOURS_PER_DAY,
+    CellAggregates,
+    OrderArrays,
+    aggregate_by_cell,
+    latlng_to_cells,
+    load_order_arrays,
+    to_naive_utc,
+)
+
+logger = logging.getLogger(__name__)
+
+# Rows per INSERT ... SELECT FROM unnest(...) statement
+CUBE_WRITE_BATCH = 50_000
+
+INSERT_SLICES_SQL = """
+    INSERT INTO demand_cube (h3_index, day, hour, orders_count, total_order_value, updated_at)
+    SELECT h3_index, day, hour, orders_count, total_order_value, NOW()
+    FROM unnest($1::TEXT[], $2::DATE[], $3::INT[], $4::INT[], $5::FLOAT8[])
+        AS s(h3_index, day, hour, orders_count, total_order_value)
+"""
+
+ADD_SLICES_SQL = INSERT_SLICES_SQL + """
+    ON CONFLICT (h3_index, day, hour) DO UPDATE SET
+        orders_count = demand_cube.orders_count + EXCLUDED.orders_count,
+        total_order_value = demand_cube.total_order_value + EXCLUDED.total_order_value,
+        updated_at = NOW()
+"""
+
+
+@dataclass
+class CubeSlices:
+    """Order counts per (base-resolution cell, day, hour)"""
+    h3_index: np.ndarray  # uint64 H3 cell ids at DEMAND_CUBE_RESOLUTION
+    day: np.ndarray  # datetime64[D]
+    hour: np.ndarray
+    orders_count: np.ndarray
+    total_order_value: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.h3_index)
+
+
+def slice_orders(orders: OrderArrays, resolution: Optional[int] = None) -> CubeSlices:
+    """Aggregate raw orders into (cell, day, hour) cube slices"""
+    resolution = settings.DEMAND_CUBE_RESOLUTION if resolution is None else resolution
+    if len(orders) == 0:
+        empty = np.array([], dtype=np.int64)
+        return CubeSlices(
+            np.array([], dtype=np.uint64), np.array([], dtype="datetime64[D]"),
+            empty, empty, np.array([]),
+        )
+
+    cells = latlng_to_cells(orders.latitude, orders.longitude, resolution)
+    unique_cells, cell_idx = np.unique(cells, return_inverse=True)
+
+    # Encode (cell, day, hour) into a single integer key for one np.unique pass
+    day = orders.day
+    day_min = day.min()
+    day_idx = (day - day_min).astype(np.int64)
+    n_days = int(day_idx.max()) + 1
+    keys = (cell_idx.astype(np.int64) * n_days + day_idx) * HOURS_PER_DAY + orders.hour
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+
+    counts = np.bincount(inverse, minlength=len(unique_keys))
+    values = np.bincount(inverse, weights=orders.order_value, minlength=len(unique_keys))
+
+    cell_day, hour = np.divmod(unique_keys, HOURS_PER_DAY)
+    cell_pos, day_pos = np.divmod(cell_day, n_days)
+
+    return CubeSlices(
+        h3_index=unique_cells[cell_pos],
+        day=day_min + day_pos.astype("timedelta64[D]"),
+        hour=hour,
+        orders_count=counts,
+        total_order_value=values,
+    )
+
+
+def _slice_batches(slices: CubeSlices):
+    """Yield unnest() argument lists in CUBE_WRITE_BATCH sized chunks"""
+    for start in range(0, len(slices), CUBE_WRITE_BATCH):
+        end = start + CUBE_WRITE_BATCH
+        yield [
+            [h3.int_to_str(c) for c in slices.h3_index[start:end].tolist()],
+            slices.day[start:end].tolist(),
+            slices.hour[start:end].tolist(),
+            slices.orders_count[start:end].tolist(),
+            slices.total_order_value[start:end].tolist(),
+        ]
+
+
+async def _write_slices(conn, sql: str, slices: CubeSlices) -> int:
+    written = 0
+    for batch in _slice_batches(slices):
+        written += affected_rows(await conn.execute(sql, *batch))
+    return written
+
+
+async def add_slices(slices: CubeSlices, conn=None) -> int:
+    """
+    Fold slices into the cube, adding to any existing (cell, day, hour) counters
+
+    Pass `conn` to write inside the caller's transaction; otherwise the
+    batches are written in a transaction of their own.
+    """
+    if conn is not None:
+        return await _write_slices(conn, ADD_SLICES_SQL, slices)
+    async with raw_connection() as conn:
+        async with conn.transaction():
+            return await _write_slices(conn, ADD_SLICES_SQL, slices)
+
+
+async def refresh_cube(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+) -> Dict[str, Any]:
+    """
+    Rebuild cube slices for whole days in [start_date, end_date]
+
+    With no bounds the entire cube is rebuilt. Existing slices in the window
+    are replaced atomically, so readers never see a half-written day.
+    """
+    orders = await load_order_arrays(
+        datetime.combine(start_date, time.min) if start_date else None,
+        datetime.combine(end_date, time.max) if end_date else None,
+    )
+    slices = slice_orders(orders)
+
+    clauses = []
+    args: List[Any] = []
+    if start_date is not None:
+        args.append(start_date)
+        clauses.append(f"day >= ${len(args)}")
+    if end_date is not None:
+        args.append(end_date)
+        clauses.append(f"day <= ${len(args)}")
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    async with raw_connection() as conn:
+        async with conn.transaction():
+            await conn.execute(f"DELETE FROM demand_cube {where}", *args)
+            await _write_slices(conn, INSERT_SLICES_SQL, slices)
+
+    logger.info(f"🧊 Demand cube refreshed: {len(orders):,} orders -> {len(slices):,} slices")
+    return {
+        "orders": len(orders),
+        "slices": len(slices),
+        "start_date": start_date.isoformat() if start_date else None,
+        "end_date": end_date.isoformat() if end_date else None,
+    }
+
+
+def rollup_cells(cells: np.ndarray, resolution: int) -> np.ndarray:
+    """Map base-resolution cells to their parents at a coarser resolution"""
+    if len(cells) == 0 or resolution >= settings.DEMAND_CUBE_RESOLUTION:
+        return cells
+    unique_cells, inverse = np.unique(cells, return_inverse=True)
+    parents = np.fromiter(
+        (h3.cell_to_parent(c, resolution) for c in unique_cells.tolist()),
+        dtype=np.uint64,
+        count=len(unique_cells),
+    )
+    return parents[inverse]
+
+
+async def load_cube_cells(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    resolution: Optional[int] = None,
+) -> CellAggregates:
+    """
+    Read per-cell demand for a date window from the cube
+
+    Day slices are summed in SQL (boundary days are trimmed to the hour), then
+    cells are rolled up to `resolution` through their H3 parents.
+    """
+    resolution = settings.DEMAND_CUBE_RESOLUTION if resolution is None else resolution
+    if resolution > settings.DEMAND_CUBE_RESOLUTION:
+        raise ValueError(
+            f"Demand cube is stored at H3 resolution {settings.DEMAND_CUBE_RESOLUTION}, "
+            f"cannot serve finer resolution {resolution}"
+        )
+
+    start_date, end_date = to_naive_utc(start_date), to_naive_utc(end_date)
+    clauses = []
+    args: List[Any] = []
+    if start_date is not None:
+        args.extend([start_date.date(), start_date.hour])
+        clauses.append(f"day >= ${len(args) - 1} AND (day > ${len(args) - 1} OR hour >= ${len(args)})")
+    if end_date is not None:
+        args.extend([end_date.date(), end_date.hour])
+        clauses.append(f"day <= ${len(args) - 1} AND (day < ${len(args) - 1} OR hour <= ${len(args)})")
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    rows = await execute_spatial_query(
+        f"""
+        SELECT
+            h3_index,
+            hour,
+            SUM(orders_count)::BIGINT AS orders_count,
+            SUM(total_order_value) AS total_order_value
+        FROM demand_cube
+        {where}
+        GROUP BY h3_index, hour
+        """,
+        *args,
+    )
+
+    n = len(rows)
+    cells = np.fromiter((h3.str_to_int(r["h3_index"]) for r in rows), dtype=np.uint64, count=n)
+    return aggregate_by_cell(
+        rollup_cells(cells, resolution),
+        np.fromiter((r["total_order_value"] for r in rows), dtype=np.float64, count=n),
+        np.fromiter((r["hour"] for r in rows), dtype=np.int64, count=n),
+        orders_count=np.fromiter((r["orders_count"] for r in rows), dtype=np.int64, count=n),
+    )
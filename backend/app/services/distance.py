@@ -0,0 +1,147 @@
+"""
+Vectorized distance and travel-time kernels
+
+Haversine is evaluated over whole (N points x M points) grids in float32,
+row-chunked so temporaries stay cache-sized. Sines and cosines of the half
+angles are computed once per point, so each pair only costs multiply/adds:
+
+    a = sin²(Δφ/2) + cos φ1 cos φ2 sin²(Δλ/2)
+    sin(Δφ/2) = sin(φ2/2) cos(φ1/2) - cos(φ2/2) sin(φ1/2)    (same for Δλ)
+
+Unlike the dot-product (chord) form this keeps float32 precision at short range.
+"""
+from typing import Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+EARTH_RADIUS_M = 6_371_000.0
+
+# Rows of the N x M grid evaluated per block
+DISTANCE_CHUNK_ROWS = 256
+
+
+def _half_angle_terms(lat: np.ndarray, lon: np.ndarray) -> Tuple[np.ndarray, ...]:
+    """Per-point factors of the haversine term, computed in float64 and stored as float32"""
+    half_phi = np.radians(np.asarray(lat, dtype=np.float64)) / 2
+    half_lambda = np.radians(np.asarray(lon, dtype=np.float64)) / 2
+    root_cos_phi = np.sqrt(np.cos(2 * half_phi))
+    return tuple(term.astype(np.float32) for term in (
+        np.sin(half_phi),
+        np.cos(half_phi),
+        np.sin(half_lambda) * root_cos_phi,
+        np.cos(half_lambda) * root_cos_phi,
+    ))
+
+
+def _haversine_blocks(
+    lat1: np.ndarray,
+    lon1: np.ndarray,
+    lat2: np.ndarray,
+    lon2: np.ndarray,
+    chunk_rows: Optional[int] = None,
+):
+    """
+    Yield (start, end, a) where `a` holds the haversine term for rows start:end
+
+    `a` is a reused buffer and is only valid until the next block.
+    """
+    chunk_rows = chunk_rows or DISTANCE_CHUNK_ROWS
+    s1, c1, sl1, cl1 = _half_angle_terms(lat1, lon1)
+    s2, c2, sl2, cl2 = _half_angle_terms(lat2, lon2)
+    a_buf = np.empty((chunk_rows, len(s2)), dtype=np.float32)
+    t_buf = np.empty_like(a_buf)
+
+    for start in range(0, len(s1), chunk_rows):
+        end = min(start + chunk_rows, len(s1))
+        a, t = a_buf[:end - start], t_buf[:end - start]
+        rows = slice(start, end)
+
+        np.multiply(c1[rows, None], s2, out=a)
+        np.multiply(s1[rows, None], c2, out=t)
+        a -= t
+        a *= a
+        np.multiply(cl1[rows, None], sl2, out=t)
+        t -= sl1[rows, None] * cl2
+        t *= t
+        a += t
+        yield start, end, a
+
+
+def _term_to_meters(a: np.ndarray) -> np.ndarray:
+    """Haversine term -> great-circle meters, in place"""
+    np.sqrt(a, out=a)
+    np.minimum(a, 1.0, out=a)
+    np.arcsin(a, out=a)
+    a *= np.float32(2 * EARTH_RADIUS_M)
+    return a
+
+
+def haversine_matrix(
+    lat1: np.ndarray,
+    lon1: np.ndarray,
+    lat2: np.ndarray,
+    lon2: np.ndarray,
+    chunk_rows: Optional[int] = None,
+) -> np.ndarray:
+    """Great-circle distance in meters between every pair of points, shape (N, M), float32"""
+    out = np.empty((len(lat1), len(lat2)), dtype=np.float32)
+    for start, end, a in _haversine_blocks(lat1, lon1, lat2, lon2, chunk_rows):
+        out[start:end] = _term_to_meters(a)
+    return out
+
+
+def nearest_two(
+    lat1: np.ndarray,
+    lon1: np.ndarray,
+    lat2: np.ndarray,
+    lon2: np.ndarray,
+    chunk_rows: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Nearest and second-nearest target for every source point, without the full matrix
+
+    Returns (nearest index, nearest meters, second-nearest meters); the second
+    distance is inf with fewer than two targets, and nearest is -1 with none.
+    The haversine term is monotonic in distance, so ranking happens on it and
+    only the two winners per row are converted to meters.
+    """
+    n, m = len(lat1), len(lat2)
+    nearest = np.full(n, -1, dtype=np.int64)
+    d1 = np.full(n, np.inf, dtype=np.float32)
+    d2 = np.full(n, np.inf, dtype=np.float32)
+    if n == 0 or m == 0:
+        return nearest, d1, d2
+
+    for start, end, a in _haversine_blocks(lat1, lon1, lat2, lon2, chunk_rows):
+        rows = np.arange(end - start)
+        closest = a.argmin(axis=1)
+        nearest[start:end] = closest
+        d1[start:end] = a[rows, closest]
+        if m > 1:
+            a[rows, closest] = np.inf
+            d2[start:end] = a.min(axis=1)
+
+    _term_to_meters(d1)
+    if m > 1:
+        _term_to_meters(d2)
+    return nearest, d1, d2
+
+
+def travel_time_minutes(
+    distance_m: np.ndarray,
+    speed_kmh: Optional[float] = None,
+    detour_factor: Optional[float] = None,
+) -> np.ndarray:
+    """Estimate road travel time from straight-line distance using the speed model"""
+    speed_kmh = settings.DELIVERY_SPEED_KMH if speed_kmh is None else speed_kmh
+    detour_factor = settings.ROAD_DETOUR_FACTOR if detour_factor is None else detour_factor
+    meters_per_minute = speed_kmh * 1000.0 / 60.0
+    return distance_m * np.float32(detour_factor / meters_per_minute)
+
+
+def reachable_radius_m(max_time_minutes: float) -> float:
+    """Straight-line radius that can be reached within max_time under the speed model"""
+    meters_per_minute = settings.DELIVERY_SPEED_KMH * 1000.0 / 60.0
+    return max_time_minutes * meters_per_minute / settings.ROAD_DETOUR_FACTOR
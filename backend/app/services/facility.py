@@ -0,0 +1,528 @@
+"""
+Facility-location solvers
+
+All solvers work on a demand-weighted cell x candidate travel-time matrix held
+as NumPy arrays. Existing stores are modelled as fixed facilities through a
+per-cell `fixed_cost` vector (minutes to the nearest fixed facility), so they
+are always open and never swapped out.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+import heapq
+
+import numpy as np
+
+# Candidates evaluated per vectorized block (bounds the n_cells x BLOCK temporaries)
+CANDIDATE_BLOCK = 256
+
+# Relative objective improvement below which a swap is not worth taking
+IMPROVEMENT_TOLERANCE = 1e-6
+
+ALGORITHMS = ("p-median", "max-coverage", "k-center")
+
+
+@dataclass
+class FacilityProblem:
+    """Cell x candidate travel-time matrix with demand weights"""
+    cost: np.ndarray  # (n_cells, n_candidates) minutes, float32 or float16
+    weights: np.ndarray  # (n_cells,) demand weight (orders)
+    fixed_cost: np.ndarray  # (n_cells,) minutes to nearest fixed facility
+
+    @property
+    def n_cells(self) -> int:
+        return self.cost.shape[0]
+
+    @property
+    def n_candidates(self) -> int:
+        return self.cost.shape[1]
+
+
+@dataclass
+class FacilitySolution:
+    """Selected candidate columns and the objective they achieve"""
+    selected: List[int]
+    objective: float
+    algorithm: str
+    iterations: int = 0
+    history: List[float] = field(default_factory=list)
+
+
+def unserved_penalty(cost: np.ndarray) -> float:
+    """Travel time charged to cells with no open facility (worse than any real option)"""
+    return float(cost.max()) * 2.0 + 1.0 if cost.size else 1.0
+
+
+def make_problem(
+    cost: np.ndarray,
+    weights: np.ndarray,
+    fixed_cost: Optional[np.ndarray] = None,
+) -> FacilityProblem:
+    """
+    Build a problem, charging the unserved penalty where there is no fixed facility
+
+    float16 matrices (e.g. memory-mapped from the cost-matrix store) are kept
+    as they are; solvers upcast them block by block.
+    """
+    if cost.dtype != np.float16:
+        cost = np.ascontiguousarray(cost, dtype=np.float32)
+    penalty = unserved_penalty(cost)
+    if fixed_cost is None:
+        fixed_cost = np.full(cost.shape[0], penalty, dtype=np.float32)
+    else:
+        fixed_cost = np.minimum(np.asarray(fixed_cost, dtype=np.float32), penalty)
+    return FacilityProblem(cost, np.asarray(weights, dtype=np.float64), fixed_cost)
+
+
+def _candidate_blocks(n_candidates: int):
+    for start in range(0, n_candidates, CANDIDATE_BLOCK):
+        yield start, min(start + CANDIDATE_BLOCK, n_candidates)
+
+
+def open_costs(
+    problem: FacilityProblem,
+    selected: Sequence[int],
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Best and second-best travel time per cell over open facilities
+
+    Returns (d1, d2, closest) where `closest` indexes into `selected`, with
+    len(selected) meaning the fixed facilities.
+    """
+    open_cost = np.column_stack([problem.cost[:, list(selected)], problem.fixed_cost])
+    closest = open_cost.argmin(axis=1)
+    d1 = open_cost[np.arange(problem.n_cells), closest]
+    if open_cost.shape[1] > 1:
+        d2 = np.partition(open_cost, 1, axis=1)[:, 1]
+    else:
+        d2 = np.full(problem.n_cells, np.inf, dtype=np.float32)
+    return d1, d2, closest
+
+
+def median_objective(problem: FacilityProblem, selected: Sequence[int]) -> float:
+    """Demand-weighted total travel time to the nearest open facility"""
+    d1, _, _ = open_costs(problem, selected)
+    return float(problem.weights @ d1)
+
+
+def _lazy_greedy(
+    initial_gains: np.ndarray,
+    p: int,
+    evaluate,
+    commit,
+) -> Tuple[List[int], List[float]]:
+    """
+    Lazy (CELF) greedy selection for submodular objectives
+
+    Marginal gains only shrink as facilities are added, so a stale gain is an
+    upper bound: a candidate is re-evaluated only when it reaches the top of
+    the heap, and taken if its fresh gain still beats every stale bound.
+    """
+    heap = [(-gain, j) for j, gain in enumerate(initial_gains.tolist())]
+    heapq.heapify(heap)
+    evaluated_at = np.zeros(len(initial_gains), dtype=np.int64)
+
+    selected: List[int] = []
+    gains: List[float] = []
+    while heap and len(selected) < p:
+        neg_gain, j = heapq.heappop(heap)
+        if evaluated_at[j] == len(selected):
+            if -neg_gain <= 0:
+                break
+            selected.append(j)
+            gains.append(-neg_gain)
+            commit(j)
+            continue
+        evaluated_at[j] = len(selected)
+        heapq.heappush(heap, (-evaluate(j), j))
+    return selected, gains
+
+
+@dataclass
+class CoverageSets:
+    """
+    Which candidates cover which cells within one SLA, as CSR both ways
+
+    cell -> covering candidates and candidate -> covered cells, so a greedy
+    step can find the cells a pick newly covers and then every candidate
+    whose gain they were counted in.
+    """
+    cell_indptr: np.ndarray  # (n_cells + 1,) int64
+    cell_sites: np.ndarray  # candidates covering each cell, int32
+    site_indptr: np.ndarray  # (n_candidates + 1,) int64
+    site_cells: np.ndarray  # cells covered by each candidate, int32
+
+    @property
+    def n_cells(self) -> int:
+        return len(self.cell_indptr) - 1
+
+    @property
+    def n_candidates(self) -> int:
+        return len(self.site_indptr) - 1
+
+    @property
+    def nnz(self) -> int:
+        return len(self.site_cells)
+
+
+def _csr(rows: np.ndarray, cols: np.ndarray, n_rows: int) -> Tuple[np.ndarray, np.ndarray]:
+    order = np.argsort(rows, kind="stable")
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+    return indptr, cols[order].astype(np.int32)
+
+
+def coverage_sets(
+    cells: np.ndarray,
+    sites: np.ndarray,
+    n_cells: int,
+    n_candidates: int,
+) -> CoverageSets:
+    """Coverage sets from (cell, candidate) pairs within the SLA"""
+    cells, sites = np.asarray(cells, dtype=np.int64), np.asarray(sites, dtype=np.int64)
+    cell_indptr, cell_sites = _csr(cells, sites, n_cells)
+    site_indptr, site_cells = _csr(sites, cells, n_candidates)
+    return CoverageSets(cell_indptr, cell_sites, site_indptr, site_cells)
+
+
+def csr_coverage_sets(indptr: np.ndarray, indices: np.ndarray, n_candidates: int) -> CoverageSets:
+    """Coverage sets from a cell -> candidates CSR, which only the candidate side is built from"""
+    indptr, indices = np.asarray(indptr, dtype=np.int64), np.asarray(indices, dtype=np.int32)
+    cells = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    site_indptr, site_cells = _csr(indices, cells, n_candidates)
+    return CoverageSets(indptr, indices, site_indptr, site_cells)
+
+
+def matrix_coverage_sets(cost: np.ndarray, max_time: float) -> CoverageSets:
+    """Coverage sets from a dense travel-time matrix, scanned block by block"""
+    cells, sites = [], []
+    for start, end in _candidate_blocks(cost.shape[1]):
+        rows, cols = np.nonzero(cost[:, start:end] <= max_time)
+        cells.append(rows)
+        sites.append(cols + start)
+    return coverage_sets(
+        np.concatenate(cells) if cells else np.array([], dtype=np.int64),
+        np.concatenate(sites) if sites else np.array([], dtype=np.int64),
+        cost.shape[0],
+        cost.shape[1],
+    )
+
+
+def _ranges(indptr: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Flat positions of the CSR entries of `rows`, and each row's entry count"""
+    starts, counts = indptr[rows], indptr[rows + 1] - indptr[rows]
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return offsets + np.arange(int(counts.sum())), counts
+
+
+def sparse_max_coverage(
+    coverage: CoverageSets,
+    weights: np.ndarray,
+    covered: np.ndarray,
+    p: int,
+) -> Tuple[List[int], List[float]]:
+    """
+    Greedy max-coverage on coverage sets with incremental gains
+
+    Gains are exact at every step: opening j only changes the gain of
+    candidates that also cover a cell j newly covers, so only those are
+    updated, and the argmax over gains picks the next site.
+    """
+    covered = covered.copy()
+    uncovered_weight = np.where(covered, 0.0, weights)
+    site_of_pair = np.repeat(np.arange(coverage.n_candidates), np.diff(coverage.site_indptr))
+    gain = np.bincount(site_of_pair, weights=uncovered_weight[coverage.site_cells], minlength=coverage.n_candidates)
+
+    selected: List[int] = []
+    gains: List[float] = []
+    while len(selected) < p and coverage.n_candidates:
+        j = int(np.argmax(gain))
+        if gain[j] <= 0:
+            break
+        cells = coverage.site_cells[coverage.site_indptr[j]:coverage.site_indptr[j + 1]]
+        new = cells[~covered[cells]]
+        # Guards against float residue left by the incremental updates
+        if float(weights[new].sum()) <= 0:
+            break
+        covered[new] = True
+
+        positions, counts = _ranges(coverage.cell_indptr, new)
+        gain -= np.bincount(
+            coverage.cell_sites[positions],
+            weights=np.repeat(weights[new], counts),
+            minlength=coverage.n_candidates,
+        )
+        selected.append(j)
+        gains.append(float(weights[new].sum()))
+        gain[j] = -np.inf
+    return selected, gains
+
+
+def greedy_max_coverage(
+    problem: FacilityProblem,
+    p: int,
+    max_time: float,
+    coverage: Optional[CoverageSets] = None,
+) -> FacilitySolution:
+    """
+    Pick up to p sites maximizing demand within max_time of an open facility
+
+    With `coverage` (sets for the same max_time), the greedy runs on the
+    sparse sets and never scans the cost matrix.
+    """
+    covered = problem.fixed_cost <= max_time
+    if coverage is not None:
+        selected, gains = sparse_max_coverage(coverage, problem.weights, covered, p)
+        covered_demand = float(problem.weights[covered].sum()) + sum(gains)
+        return FacilitySolution(selected, covered_demand, "max-coverage", len(selected), gains)
+
+    uncovered_weight = np.where(covered, 0.0, problem.weights)
+
+    initial = np.empty(problem.n_candidates, dtype=np.float64)
+    for start, end in _candidate_blocks(problem.n_candidates):
+        initial[start:end] = uncovered_weight @ (problem.cost[:, start:end] <= max_time)
+
+    def evaluate(j: int) -> float:
+        return float(uncovered_weight[problem.cost[:, j] <= max_time].sum())
+
+    def commit(j: int):
+        uncovered_weight[problem.cost[:, j] <= max_time] = 0.0
+
+    selected, gains = _lazy_greedy(initial, p, evaluate, commit)
+    covered_demand = float(problem.weights[covered].sum()) + sum(gains)
+    return FacilitySolution(selected, covered_demand, "max-coverage", len(selected), gains)
+
+
+def greedy_median(
+    problem: FacilityProblem,
+    p: int,
+    initial: Sequence[int] = (),
+) -> List[int]:
+    """
+    Lazy greedy construction for p-median (largest travel-time reduction first)
+
+    Facilities in `initial` are kept and the rest are added greedily on top.
+    """
+    initial = list(dict.fromkeys(initial))[:p]
+    d1 = problem.fixed_cost.copy()
+    for j in initial:
+        np.minimum(d1, problem.cost[:, j], out=d1)
+    weights = problem.weights.astype(np.float32)
+
+    gains = np.empty(problem.n_candidates, dtype=np.float64)
+    for start, end in _candidate_blocks(problem.n_candidates):
+        reduction = np.maximum(d1[:, None] - problem.cost[:, start:end], 0.0)
+        gains[start:end] = weights @ reduction
+    gains[initial] = 0.0
+
+    def evaluate(j: int) -> float:
+        return float(weights @ np.maximum(d1 - problem.cost[:, j], 0.0))
+
+    def commit(j: int):
+        np.minimum(d1, problem.cost[:, j], out=d1)
+
+    selected, _ = _lazy_greedy(gains, p - len(initial), evaluate, commit)
+    return initial + selected
+
+
+def p_median(
+    problem: FacilityProblem,
+    p: int,
+    initial: Optional[Sequence[int]] = None,
+    max_passes: int = 20,
+) -> FacilitySolution:
+    """
+    p-median by vertex substitution (Teitz-Bart with Whitaker's fast interchange)
+
+    For every candidate `c` outside the solution, the fast interchange scores
+    all swaps (c in, r out) at once from each cell's best/second-best open
+    facility: cells closer to `c` than to their current facility move to `c`
+    whichever r leaves, the rest only pay extra if their own facility r is
+    the one removed. A pass evaluates candidates block-wise and applies any
+    improving swap immediately; passes repeat until none improves.
+
+    `initial` warm-starts the search (e.g. from a previous run's solution);
+    it is trimmed or greedily topped up to p facilities first.
+    """
+    selected = greedy_median(problem, p, initial if initial is not None else ())
+    weights = problem.weights.astype(np.float32)
+    history = [median_objective(problem, selected)]
+    passes = 0
+
+    def state():
+        d1, d2, closest = open_costs(problem, selected)
+        # (k, n_cells) membership matrix: per-facility sums become one BLAS matmul
+        served_by = (closest[None, :] == np.arange(len(selected))[:, None]).astype(np.float32)
+        return d1, d2, served_by, float(problem.weights @ d1)
+
+    while selected and passes < max_passes:
+        passes += 1
+        improved = False
+        d1, d2, served_by, objective = state()
+
+        for start, end in _candidate_blocks(problem.n_candidates):
+            block = np.arange(start, end)
+            block = block[~np.isin(block, selected)]
+            if len(block) == 0:
+                continue
+
+            cost = problem.cost[:, block]
+            saving = d1[:, None] - cost
+            gain = weights @ np.maximum(saving, 0.0)
+            extra = np.minimum(cost, d2[:, None]) - d1[:, None]
+            extra[saving > 0] = 0.0
+            extra *= weights[:, None]
+
+            # loss[r, c]: extra travel time for cells served by r if r is swapped for c
+            loss = served_by @ extra
+            delta = loss - gain[None, :]
+
+            r, c = np.unravel_index(np.argmin(delta), delta.shape)
+            if delta[r, c] < -IMPROVEMENT_TOLERANCE * max(objective, 1.0):
+                selected[r] = int(block[c])
+                improved = True
+                d1, d2, served_by, objective = state()
+
+        history.append(objective)
+        if not improved:
+            break
+
+    return FacilitySolution(selected, history[-1], "p-median", passes, history)
+
+
+def k_center(problem: FacilityProblem, p: int) -> FacilitySolution:
+    """
+    k-center by farthest-first traversal (Gonzalez)
+
+    Repeatedly opens the candidate nearest to the worst-served demand cell,
+    a 2-approximation of the minimal maximum travel time.
+    """
+    d1 = problem.fixed_cost.copy()
+    active = problem.weights > 0
+    selected: List[int] = []
+    history: List[float] = []
+
+    while len(selected) < min(p, problem.n_candidates) and active.any():
+        worst = int(np.argmax(np.where(active, d1, -np.inf)))
+        options = problem.cost[worst].astype(np.float64)
+        options[selected] = np.inf
+        j = int(np.argmin(options))
+        if options[j] >= d1[worst]:
+            break
+        selected.append(j)
+        np.minimum(d1, problem.cost[:, j], out=d1)
+        history.append(float(d1[active].max()))
+
+    objective = float(d1[active].max()) if active.any() else 0.0
+    return FacilitySolution(selected, objective, "k-center", len(selected), history)
+
+
+def solve(
+    problem: FacilityProblem,
+    p: int,
+    max_time: float,
+    algorithm: str = "p-median",
+    initial: Optional[Sequence[int]] = None,
+    coverage: Optional[CoverageSets] = None,
+) -> FacilitySolution:
+    """Dispatch to a facility-location algorithm (`coverage` is used by max-coverage)"""
+    p = min(p, problem.n_candidates)
+    if algorithm == "p-median":
+        return p_median(problem, p, initial=initial)
+    if algorithm == "max-coverage":
+        return greedy_max_coverage(problem, p, max_time, coverage)
+    if algorithm == "k-center":
+        return k_center(problem, p)
+    raise ValueError(f"Unknown algorithm '{algorithm}', expected one of {', '.join(ALGORITHMS)}")
+
+
+def solution_path(
+    problem: FacilityProblem,
+    max_p: int,
+    max_time: float,
+    algorithm: str = "p-median",
+    coverage: Optional[CoverageSets] = None,
+) -> List[List[int]]:
+    """
+    Solutions for p = 1..max_p, each built from the one before
+
+    The greedy max-coverage and farthest-first k-center solutions are nested,
+    so one run to max_p yields every prefix. p-median re-optimizes each p
+    starting from the p-1 solution plus its best greedy addition, which is
+    far cheaper than max_p cold solves. Stops early once no site helps.
+    """
+    max_p = min(max_p, problem.n_candidates)
+    if algorithm in ("max-coverage", "k-center"):
+        selected = solve(problem, max_p, max_time, algorithm, coverage=coverage).selected
+        return [selected[:p] for p in range(1, len(selected) + 1)]
+    if algorithm != "p-median":
+        raise ValueError(f"Unknown algorithm '{algorithm}', expected one of {', '.join(ALGORITHMS)}")
+
+    path: List[List[int]] = []
+    selected: List[int] = []
+    for p in range(1, max_p + 1):
+        selected = p_median(problem, p, initial=selected).selected
+        if len(selected) < p:
+            break
+        path.append(list(selected))
+    return path
+
+
+def pareto_curve(
+    problem: FacilityProblem,
+    path: Sequence[Sequence[int]],
+    max_time: float,
+) -> List[Dict[str, object]]:
+    """
+    Coverage and travel time at max_time for each solution on a path
+
+    A point is Pareto-optimal when no solution with as few sites covers at
+    least as much demand.
+    """
+    weights = problem.weights
+    total = float(weights.sum())
+    points = []
+    best = -np.inf
+    for selected in path:
+        d1, _, _ = open_costs(problem, selected)
+        coverage = float(weights[d1 <= max_time].sum()) / total if total else 0.0
+        points.append({
+            "num_stores": len(selected),
+            "coverage_fraction": coverage,
+            "avg_travel_time": float(weights @ d1) / total if total else 0.0,
+            "max_travel_time": float(d1[weights > 0].max()) if (weights > 0).any() else 0.0,
+            "pareto": coverage > best,
+            "selected": [int(j) for j in selected],
+        })
+        best = max(best, coverage)
+    return points
+
+
+def solution_metrics(
+    problem: FacilityProblem,
+    selected: Sequence[int],
+    max_time: float,
+) -> Dict[str, object]:
+    """Coverage and travel-time metrics for a solution, overall and per facility"""
+    d1, _, closest = open_costs(problem, selected)
+    weights = problem.weights
+    total = float(weights.sum())
+    within = d1 <= max_time
+
+    per_facility = []
+    for r, j in enumerate(selected):
+        served = closest == r
+        served_weight = float(weights[served].sum())
+        per_facility.append({
+            "candidate": int(j),
+            "orders_served": served_weight,
+            "orders_covered": float(weights[served & within].sum()),
+            "cells_covered": int((served & within).sum()),
+            "avg_travel_time": float(weights[served] @ d1[served]) / served_weight if served_weight else 0.0,
+        })
+
+    return {
+        "coverage_fraction": float(weights[within].sum()) / total if total else 0.0,
+        "avg_travel_time": float(weights @ d1) / total if total else 0.0,
+        "max_travel_time": float(d1[weights > 0].max()) if (weights > 0).any() else 0.0,
+        "facilities": per_facility,
+    }
@@ -0,0 +1,205 @@
+"""
+H3 demand heatmap engine
+
+Serves per-hexagon demand from the demand cube, falling back to a vectorized
+scan of the orders table for resolutions finer than the cube.
+
+Besides JSON points, large grids can be encoded as packed columns:
+- Arrow IPC stream (when pyarrow is installed)
+- a dependency-free little-endian layout (PACKED_MEDIA_TYPE):
+
+    magic "SBHM" | u8 version | 3 pad | u32 n | u32 metadata_len | metadata JSON
+    | zero pad to 8 bytes | u64 h3[n] | f32 intensity[n] | f32 total_order_value[n]
+    | u32 orders_count[n] | u8 peak_hour[n]
+
+Every column starts 8-byte aligned so browsers can view it as a typed array.
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import io
+import json
+import struct
+
+import numpy as np
+from h3.api import basic_int as h3
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional dependency
+    pa = None
+
+from app.core.config import settings
+from app.services.aggregation import (
+    CellAggregates,
+    aggregate_by_cell,
+    cell_centroids,
+    latlng_to_cells,
+    load_order_arrays,
+)
+from app.services.demand_cube import load_cube_cells
+
+JSON_MEDIA_TYPE = "application/json"
+PACKED_MEDIA_TYPE = "application/vnd.smartblink.heatmap"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+PACKED_MAGIC = b"SBHM"
+PACKED_VERSION = 1
+
+# Heatmap resolution names -> H3 resolution
+H3_RESOLUTIONS = {
+    "high": 9,    # ~0.1 km² hexagons
+    "medium": 8,  # ~0.7 km² hexagons (notebook default)
+    "low": 7,     # ~5 km² hexagons
+}
+
+
+def resolve_resolution(resolution: str) -> int:
+    """Map a heatmap resolution name (or explicit H3 level) to an H3 resolution"""
+    if resolution in H3_RESOLUTIONS:
+        return H3_RESOLUTIONS[resolution]
+    if resolution.isdigit() and 0 <= int(resolution) <= 15:
+        return int(resolution)
+    raise ValueError(
+        f"Unknown resolution '{resolution}', expected one of "
+        f"{', '.join(H3_RESOLUTIONS)} or an H3 level 0-15"
+    )
+
+
+def heatmap_points(aggregates: CellAggregates) -> List[Dict[str, Any]]:
+    """Convert cell aggregates into heatmap points with normalized intensity"""
+    if len(aggregates) == 0:
+        return []
+
+    centroids = cell_centroids(aggregates.h3_index)
+    intensity = aggregates.orders_count / aggregates.orders_count.max()
+
+    return [
+        {
+            "latitude": lat,
+            "longitude": lon,
+            "intensity": round(weight, 4),
+            "h3_index": h3.int_to_str(cell),
+            "orders_count": count,
+            "total_order_value": round(value, 2),
+            "peak_hour": peak,
+        }
+        for (lat, lon), weight, cell, count, value, peak in zip(
+            centroids.tolist(),
+            intensity.tolist(),
+            aggregates.h3_index.tolist(),
+            aggregates.orders_count.tolist(),
+            aggregates.total_order_value.tolist(),
+            aggregates.peak_hour.tolist(),
+        )
+    ]
+
+
+async def load_heatmap(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    resolution: str = "high",
+) -> Tuple[CellAggregates, Dict[str, Any]]:
+    """Per-cell demand aggregates in the date window plus response metadata"""
+    h3_resolution = resolve_resolution(resolution)
+
+    if h3_resolution <= settings.DEMAND_CUBE_RESOLUTION:
+        aggregates = await load_cube_cells(start_date, end_date, h3_resolution)
+        source = "demand_cube"
+    else:
+        orders = await load_order_arrays(start_date, end_date)
+        cells = latlng_to_cells(orders.latitude, orders.longitude, h3_resolution)
+        aggregates = aggregate_by_cell(cells, orders.order_value, orders.hour)
+        source = "orders"
+
+    return aggregates, {
+        "resolution": resolution,
+        "h3_resolution": h3_resolution,
+        "total_orders": int(aggregates.orders_count.sum()),
+        "cells": len(aggregates),
+        "source": source,
+        "start_date": start_date.isoformat() if start_date else None,
+        "end_date": end_date.isoformat() if end_date else None,
+    }
+
+
+async def build_heatmap(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    resolution: str = "high",
+) -> Dict[str, Any]:
+    """Aggregate demand in the date window into an H3 heatmap"""
+    aggregates, metadata = await load_heatmap(start_date, end_date, resolution)
+    return {
+        "data": heatmap_points(aggregates),
+        "metadata": metadata,
+    }
+
+
+def heatmap_columns(aggregates: CellAggregates) -> Dict[str, np.ndarray]:
+    """Heatmap fields as compact typed columns"""
+    counts = aggregates.orders_count
+    peak = counts.max() if len(counts) else 0
+    return {
+        "h3_index": aggregates.h3_index.astype("<u8"),
+        "intensity": (counts / peak if peak else np.zeros(len(counts))).astype("<f4"),
+        "total_order_value": aggregates.total_order_value.astype("<f4"),
+        "orders_count": counts.astype("<u4"),
+        "peak_hour": aggregates.peak_hour.astype("u1"),
+    }
+
+
+def encode_packed(aggregates: CellAggregates, metadata: Dict[str, Any]) -> bytes:
+    """Heatmap in the packed little-endian column layout (see module docstring)"""
+    header = json.dumps(metadata).encode()
+    prefix = struct.pack("<4sB3xII", PACKED_MAGIC, PACKED_VERSION, len(aggregates), len(header)) + header
+    prefix += b"\0" * (-len(prefix) % 8)
+    return prefix + b"".join(column.tobytes() for column in heatmap_columns(aggregates).values())
+
+
+def encode_arrow(aggregates: CellAggregates, metadata: Dict[str, Any]) -> bytes:
+    """Heatmap as an Arrow IPC stream, metadata in the schema"""
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed")
+    table = pa.table(heatmap_columns(aggregates)).replace_schema_metadata(
+        {"metadata": json.dumps(metadata)}
+    )
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+HEATMAP_ENCODERS = {
+    PACKED_MEDIA_TYPE: encode_packed,
+    ARROW_MEDIA_TYPE: encode_arrow,
+}
+
+
+def negotiate_format(accept: Optional[str], format: Optional[str] = None) -> str:
+    """Pick the heatmap media type from an explicit format or the Accept header"""
+    if format is not None:
+        media_type = {"json": JSON_MEDIA_TYPE, "packed": PACKED_MEDIA_TYPE, "arrow": ARROW_MEDIA_TYPE}.get(format)
+        if media_type is None:
+            raise ValueError(f"Unknown format '{format}', expected json, packed or arrow")
+        if media_type == ARROW_MEDIA_TYPE and pa is None:
+            raise ValueError("Arrow output requires pyarrow on the server")
+        return media_type
+
+    for part in (accept or "").split(","):
+        media_type = part.split(";")[0].strip().lower()
+        if media_type == ARROW_MEDIA_TYPE and pa is not None:
+            return ARROW_MEDIA_TYPE
+        if media_type in (PACKED_MEDIA_TYPE, "application/octet-stream"):
+            return PACKED_MEDIA_TYPE
+    return JSON_MEDIA_TYPE
+
+
+async def build_heatmap_binary(
+    media_type: str,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    resolution: str = "high",
+) -> bytes:
+    """Encoded heatmap body for a binary media type"""
+    aggregates, metadata = await load_heatmap(start_date, end_date, resolution)
+    return HEATMAP_ENCODERS[media_type](aggregates, metadata)
@@ -0,0 +1,228 @@
+"""
+Store isochrone pipeline
+
+Builds ISOCHRONE_MINUTES drive-time polygons per active store from H3 cells:
+a grid disk around the store is bounded by the fastest possible travel, each
+cell gets a travel time (routed through the travel-time cache when OSRM is
+enabled, otherwise the speed model), and the connected set of reachable
+cells around the store becomes the polygon. Each polygon records the store
+location it was built from, and only stores that have moved since (or lack
+a configured time) are rebuilt; polygons are written in one bulk statement
+and orders_in_zone is filled by a point-in-polygon join.
+"""
+from typing import Any, Dict, List, Optional, Sequence, Set
+import json
+import logging
+import math
+
+import numpy as np
+from h3.api import basic_int as h3
+
+from app.core.config import settings
+from app.core.database import affected_rows, execute_spatial_query, raw_connection
+from app.services.distance import haversine_matrix, travel_time_minutes
+from app.services.routing import cell_store_times
+
+logger = logging.getLogger(__name__)
+
+# Active stores with no isochrones yet, missing a configured time, or moved
+# away from the location their polygons were built from
+STALE_STORES_SQL = """
+    SELECT s.id, ST_Y(s.location) AS latitude, ST_X(s.location) AS longitude
+    FROM stores s
+    LEFT JOIN isochrones i ON i.store_id = s.id AND i.time_minutes = ANY($1::INT[])
+    WHERE s.is_active = TRUE
+    GROUP BY s.id
+    HAVING COUNT(DISTINCT i.time_minutes) < cardinality($1::INT[])
+        OR BOOL_OR(i.origin IS NULL OR NOT ST_Equals(i.origin, s.location))
+        OR $2::BOOLEAN
+    ORDER BY s.id
+"""
+
+DELETE_ISOCHRONES_SQL = "DELETE FROM isochrones WHERE store_id = ANY($1::INT[])"
+
+INSERT_ISOCHRONES_SQL = """
+    INSERT INTO isochrones (store_id, time_minutes, geometry, origin, area_km2, source, calculated_at)
+    SELECT
+        s.store_id,
+        s.time_minutes,
+        g.geometry,
+        ST_SetSRID(ST_MakePoint(s.longitude, s.latitude), 4326),
+        ST_Area(g.geometry::geography) / 1e6,
+        s.source,
+        NOW()
+    FROM unnest($1::INT[], $2::INT[], $3::TEXT[], $4::TEXT[], $5::FLOAT8[], $6::FLOAT8[])
+        AS s(store_id, time_minutes, wkt, source, latitude, longitude)
+    CROSS JOIN LATERAL (SELECT ST_SetSRID(ST_GeomFromText(s.wkt), 4326) AS geometry) g
+"""
+
+# Point-in-polygon on the orders GiST index, one pass for all rebuilt stores
+UPDATE_ORDERS_IN_ZONE_SQL = """
+    UPDATE isochrones AS i
+    SET orders_in_zone = counts.orders
+    FROM (
+        SELECT i2.id, COUNT(o.id) AS orders
+        FROM isochrones i2
+        LEFT JOIN orders o ON ST_Contains(i2.geometry, o.location)
+        WHERE i2.store_id = ANY($1::INT[])
+        GROUP BY i2.id
+    ) counts
+    WHERE i.id = counts.id
+"""
+
+
+def disk_cells(latitude: float, longitude: float, max_minutes: float, resolution: int) -> np.ndarray:
+    """
+    H3 disk around a point covering everything reachable in max_minutes
+
+    Sized by straight-line distance at the fastest possible speed with no
+    detour: DELIVERY_SPEED_KMH under the speed model, OSRM_MAX_SPEED_KMH when
+    routing through OSRM, whose driving profile is faster than the average
+    rider speed.
+    """
+    speed_kmh = settings.OSRM_MAX_SPEED_KMH if settings.OSRM_ENABLED else settings.DELIVERY_SPEED_KMH
+    radius_m = max_minutes * speed_kmh * 1000.0 / 60.0
+    spacing_m = h3.average_hexagon_edge_length(resolution, unit="m") * math.sqrt(3)
+    k = int(math.ceil(radius_m / spacing_m)) + 1
+    center = h3.latlng_to_cell(latitude, longitude, resolution)
+    return np.array(h3.grid_disk(center, k), dtype=np.uint64)
+
+
+def connected_component(cells: Set[int], origin: int) -> List[int]:
+    """Cells reachable from origin through H3 neighbours within `cells`"""
+    if origin not in cells:
+        return []
+    seen = {origin}
+    frontier = [origin]
+    while frontier:
+        cell = frontier.pop()
+        for neighbour in h3.grid_ring(cell, 1):
+            if neighbour in cells and neighbour not in seen:
+                seen.add(neighbour)
+                frontier.append(neighbour)
+    return list(seen)
+
+
+def ring_wkt(ring) -> str:
+    points = [f"{lng} {lat}" for lat, lng in ring]
+    points.append(points[0])
+    return f"({', '.join(points)})"
+
+
+def cells_polygon_wkt(cells: List[int]) -> str:
+    """WKT polygon (with holes) outlining a connected set of H3 cells"""
+    shape = h3.cells_to_h3shape(cells)
+    rings = [shape.outer, *shape.holes]
+    return f"POLYGON({', '.join(ring_wkt(r) for r in rings)})"
+
+
+async def store_isochrones(
+    store_id: int,
+    latitude: float,
+    longitude: float,
+    minutes: Sequence[int],
+    resolution: int,
+) -> List[Dict[str, Any]]:
+    """Isochrone polygons of one store for each time in `minutes`"""
+    cells = disk_cells(latitude, longitude, max(minutes), resolution)
+    if settings.OSRM_ENABLED:
+        times = (await cell_store_times(
+            cells, np.array([store_id]), np.array([latitude]), np.array([longitude]),
+        ))[:, 0] / 60.0
+        source = "osrm"
+    else:
+        centroids = np.array([h3.cell_to_latlng(int(c)) for c in cells])
+        times = travel_time_minutes(haversine_matrix(
+            centroids[:, 0], centroids[:, 1], np.array([latitude]), np.array([longitude]),
+        ))[:, 0]
+        source = "h3_speed_model"
+
+    origin = h3.latlng_to_cell(latitude, longitude, resolution)
+    results = []
+    for limit in minutes:
+        reachable = {int(c) for c in cells[times <= limit]} | {origin}
+        component = connected_component(reachable, origin)
+        results.append({
+            "store_id": store_id,
+            "time_minutes": int(limit),
+            "wkt": cells_polygon_wkt(component),
+            "source": source,
+            "latitude": latitude,
+            "longitude": longitude,
+            "cells": len(component),
+        })
+    return results
+
+
+async def refresh_isochrones(
+    store_ids: Optional[List[int]] = None,
+    force: bool = False,
+) -> Dict[str, Any]:
+    """
+    Rebuild isochrones for stale stores (or all listed stores with force)
+
+    Old polygons of rebuilt stores are replaced atomically together with
+    their orders_in_zone counts.
+    """
+    minutes = sorted(set(settings.ISOCHRONE_MINUTES))
+    stores = await execute_spatial_query(STALE_STORES_SQL, minutes, force)
+    if store_ids is not None:
+        wanted = set(store_ids)
+        stores = [s for s in stores if s["id"] in wanted]
+    if not stores:
+        return {"stores": 0, "isochrones": 0}
+
+    polygons: List[Dict[str, Any]] = []
+    for store in stores:
+        polygons.extend(await store_isochrones(
+            store["id"], store["latitude"], store["longitude"], minutes, settings.ISOCHRONE_RESOLUTION,
+        ))
+
+    ids = [s["id"] for s in stores]
+    async with raw_connection() as conn:
+        async with conn.transaction():
+            await conn.execute(DELETE_ISOCHRONES_SQL, ids)
+            written = affected_rows(await conn.execute(
+                INSERT_ISOCHRONES_SQL,
+                [p["store_id"] for p in polygons],
+                [p["time_minutes"] for p in polygons],
+                [p["wkt"] for p in polygons],
+                [p["source"] for p in polygons],
+                [p["latitude"] for p in polygons],
+                [p["longitude"] for p in polygons],
+            ))
+            await conn.execute(UPDATE_ORDERS_IN_ZONE_SQL, ids)
+
+    logger.info(f"🕒 Rebuilt {written} isochrones for {len(ids)} stores")
+    return {"stores": len(ids), "isochrones": written, "store_ids": ids}
+
+
+async def get_isochrones(
+    store_id: Optional[int] = None,
+    time_minutes: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Cached isochrones of active stores as a GeoJSON FeatureCollection"""
+    rows = await execute_spatial_query(
+        """
+        SELECT i.store_id, i.time_minutes, i.area_km2, i.orders_in_zone, i.source,
+               i.calculated_at, ST_AsGeoJSON(i.geometry, 6) AS geometry
+        FROM isochrones i
+        JOIN stores s ON s.id = i.store_id AND s.is_active = TRUE
+        WHERE ($1::INT IS NULL OR i.store_id = $1)
+          AND ($2::INT IS NULL OR i.time_minutes = $2)
+        ORDER BY i.store_id, i.time_minutes DESC
+        """,
+        store_id,
+        time_minutes,
+    )
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "geometry": json.loads(row["geometry"]),
+                "properties": {key: value for key, value in row.items() if key != "geometry"},
+            }
+            for row in rows
+        ],
+    }
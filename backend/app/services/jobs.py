@@ -0,0 +1,388 @@
+"""
+Asynchronous optimization job runner
+
+Jobs are recorded in optimization_jobs. The API process only loads demand
+and stores; building the travel-time matrix and solving both happen in a
+process pool, so neither blocks the event loop. Ranked results are
+persisted as candidates rows in one bulk insert.
+
+A job can be warm-started from an earlier one (warm_start_job_id): its
+candidate sites and travel-time matrix are reused, so only cells, sites and
+stores that changed since are recomputed and the solver starts from the
+earlier solution. The matrix comes from this process's instance cache or,
+after a restart or on another worker, from the cost-matrix store entry the
+job recorded; result_metrics says whether it was actually reused.
+
+Sweep jobs (submit_sweep) load one instance and solve it for every store
+count up to num_stores under several delivery-time thresholds, storing
+the resulting coverage curves in result_metrics instead of candidates.
+"""
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple
+import asyncio
+import logging
+import multiprocessing
+
+from h3.api import basic_int as h3
+
+from app.core.cache import bump_data_version
+from app.core.config import settings
+from app.core.database import execute_spatial_command, execute_spatial_query
+from app.services.optimization import (
+    PlacementInstance, load_inputs, prepare_instance, run_sweep, solve_placement, stored_instance,
+)
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+# Background tasks are referenced here so they are not garbage collected mid-run
+_running: Set[asyncio.Task] = set()
+
+# Live stage/progress of jobs running in this API process
+_progress: Dict[int, Dict[str, Any]] = {}
+
+# Instances of recent jobs in this API process, oldest first
+_instances: "OrderedDict[int, PlacementInstance]" = OrderedDict()
+
+JOB_STAGES = {
+    "queued": 0.0,
+    "loading": 0.1,
+    "solving": 0.3,
+    "persisting": 0.9,
+    "done": 1.0,
+}
+
+INSERT_CANDIDATES_SQL = """
+    INSERT INTO candidates (
+        location, score, coverage_area_km2, estimated_orders_covered,
+        avg_delivery_time_minutes, monthly_revenue_estimate, rank,
+        optimization_job_id, algorithm, metadata, created_at
+    )
+    SELECT
+        ST_SetSRID(ST_MakePoint(c.longitude, c.latitude), 4326),
+        c.score, c.coverage_area_km2, c.estimated_orders_covered,
+        c.avg_delivery_time_minutes, c.monthly_revenue_estimate, c.rank,
+        $10, $11, jsonb_build_object('h3_index', c.h3_index), NOW()
+    FROM unnest(
+        $1::FLOAT8[], $2::FLOAT8[], $3::FLOAT8[], $4::FLOAT8[], $5::INT[],
+        $6::FLOAT8[], $7::FLOAT8[], $8::INT[], $9::TEXT[]
+    ) AS c(
+        longitude, latitude, score, coverage_area_km2, estimated_orders_covered,
+        avg_delivery_time_minutes, monthly_revenue_estimate, rank, h3_index
+    )
+"""
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Get or create the solver process pool"""
+    global _executor
+
+    if _executor is None:
+        # spawn: workers must not inherit the event loop or DB sockets
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.OPTIMIZATION_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        logger.info(f"⚙️  Optimization worker pool started ({settings.OPTIMIZATION_WORKERS} processes)")
+
+    return _executor
+
+
+def shutdown_job_runner():
+    """Stop the solver process pool"""
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+        logger.info("⚙️  Optimization worker pool stopped")
+
+
+async def run_in_worker(func, *args):
+    """Run a CPU-bound function in the solver process pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), func, *args)
+
+
+def _set_stage(job_id: int, stage: str):
+    _progress[job_id] = {"stage": stage, "progress": JOB_STAGES[stage]}
+
+
+def _remember_instance(job_id: int, instance: PlacementInstance):
+    _instances[job_id] = instance
+    while len(_instances) > settings.WARM_START_CACHE_SIZE:
+        _instances.popitem(last=False)
+
+
+async def load_warm_start(job_id: int) -> Tuple[Optional[PlacementInstance], List[int]]:
+    """
+    Instance (if any) and ranked candidate H3 cells of a previous job
+
+    The instance comes from this process's cache, else from the cost-matrix
+    store entry recorded in the job's result_metrics.
+    """
+    previous = _instances.get(job_id)
+    if previous is not None:
+        _instances.move_to_end(job_id)
+    else:
+        job = await get_job(job_id)
+        key = ((job or {}).get("result_metrics") or {}).get("cost_matrix_key")
+        if key:
+            previous = stored_instance(key)
+    rows = await get_job_candidates(job_id)
+    cells = [h3.str_to_int(row["h3_index"]) for row in rows if row["h3_index"]]
+    return previous, cells
+
+
+async def create_job(params: Dict[str, Any]) -> int:
+    """Record a pending optimization job and return its id"""
+    rows = await execute_spatial_query(
+        """
+        INSERT INTO optimization_jobs (
+            status, algorithm, num_stores, max_delivery_time_min,
+            use_existing_stores, constraints, created_by, created_at
+        )
+        VALUES ('pending', $1, $2, $3, $4, $5, $6, NOW())
+        RETURNING id
+        """,
+        params["algorithm"],
+        params["num_stores"],
+        params["max_delivery_time_minutes"],
+        params["use_existing_stores"],
+        params.get("constraints"),
+        params.get("created_by"),
+    )
+    return rows[0]["id"]
+
+
+async def persist_candidates(job_id: int, algorithm: str, candidates: List[Dict[str, Any]]) -> int:
+    """Bulk insert ranked candidates for a job, then invalidate cached tiles and listings"""
+    if not candidates:
+        return 0
+
+    def column(name: str) -> List[Any]:
+        return [c[name] for c in candidates]
+
+    written = await execute_spatial_command(
+        INSERT_CANDIDATES_SQL,
+        column("longitude"),
+        column("latitude"),
+        column("score"),
+        column("coverage_area_km2"),
+        column("estimated_orders_covered"),
+        column("avg_delivery_time_minutes"),
+        column("estimated_monthly_revenue"),
+        column("rank"),
+        column("h3_index"),
+        job_id,
+        algorithm,
+    )
+    await bump_data_version()
+    return written
+
+
+async def _run_job(job_id: int, params: Dict[str, Any]):
+    """Load, solve and persist one optimization job"""
+    try:
+        _set_stage(job_id, "loading")
+        await execute_spatial_command(
+            "UPDATE optimization_jobs SET status = 'running', started_at = NOW() WHERE id = $1",
+            job_id,
+        )
+        inputs = await load_inputs(params["use_existing_stores"], params.get("lookback_days"))
+        previous, previous_cells = None, None
+        if params.get("warm_start_job_id") is not None:
+            previous, previous_cells = await load_warm_start(params["warm_start_job_id"])
+
+        # The matrix is built in the worker too, keeping the event loop free
+        _set_stage(job_id, "solving")
+        result, instance = await run_in_worker(
+            solve_placement,
+            inputs,
+            params["num_stores"],
+            params["max_delivery_time_minutes"],
+            params["algorithm"],
+            previous,
+            previous_cells,
+        )
+        _remember_instance(job_id, instance)
+
+        _set_stage(job_id, "persisting")
+        await persist_candidates(job_id, params["algorithm"], result["candidates"])
+        metrics = {
+            "total_coverage_percentage": result["total_coverage_percentage"],
+            "avg_delivery_time": result["avg_delivery_time"],
+            "optimization_method": result["optimization_method"],
+            **result["metrics"],
+            "cost_matrix_key": instance.cost_key,
+        }
+        if params.get("warm_start_job_id") is not None:
+            metrics["warm_start_job_id"] = params["warm_start_job_id"]
+            metrics["warm_start_matrix_reused"] = previous is not None
+        await execute_spatial_command(
+            """
+            UPDATE optimization_jobs
+            SET status = 'completed', completed_at = NOW(), result_metrics = $2
+            WHERE id = $1
+            """,
+            job_id,
+            metrics,
+        )
+        _set_stage(job_id, "done")
+        logger.info(f"✅ Optimization job {job_id} completed")
+
+    except Exception as e:
+        await _fail_job(job_id, e)
+    finally:
+        _progress.pop(job_id, None)
+
+
+async def _fail_job(job_id: int, error: Exception):
+    logger.exception(f"❌ Optimization job {job_id} failed")
+    await execute_spatial_command(
+        """
+        UPDATE optimization_jobs
+        SET status = 'failed', completed_at = NOW(), error_message = $2
+        WHERE id = $1
+        """,
+        job_id,
+        f"{type(error).__name__}: {error}",
+    )
+
+
+async def _run_sweep(job_id: int, params: Dict[str, Any]):
+    """Load once and solve every store count and threshold of a sweep job"""
+    try:
+        _set_stage(job_id, "loading")
+        await execute_spatial_command(
+            "UPDATE optimization_jobs SET status = 'running', started_at = NOW() WHERE id = $1",
+            job_id,
+        )
+        inputs = await load_inputs(params["use_existing_stores"], params.get("lookback_days"))
+
+        _set_stage(job_id, "solving")
+        instance = await run_in_worker(prepare_instance, inputs)
+        thresholds = params["max_delivery_time_minutes_list"]
+        if params["algorithm"] == "max-coverage":
+            # One greedy path per threshold, spread over the worker pool
+            results = await asyncio.gather(*(
+                run_in_worker(run_sweep, instance, params["num_stores"], [threshold], params["algorithm"])
+                for threshold in thresholds
+            ))
+            curves = [curve for result in results for curve in result]
+        else:
+            curves = await run_in_worker(run_sweep, instance, params["num_stores"], thresholds, params["algorithm"])
+
+        _set_stage(job_id, "persisting")
+        metrics = {
+            "optimization_method": params["algorithm"],
+            "sweep": {
+                "max_stores": params["num_stores"],
+                "thresholds": thresholds,
+                "curves": curves,
+            },
+            "demand_cells": instance.problem.n_cells,
+            "candidate_sites": instance.problem.n_candidates,
+            "existing_stores": len(instance.stores),
+        }
+        await execute_spatial_command(
+            """
+            UPDATE optimization_jobs
+            SET status = 'completed', completed_at = NOW(), result_metrics = $2
+            WHERE id = $1
+            """,
+            job_id,
+            metrics,
+        )
+        _set_stage(job_id, "done")
+        logger.info(f"✅ Optimization sweep {job_id} completed ({len(thresholds)} thresholds)")
+
+    except Exception as e:
+        await _fail_job(job_id, e)
+    finally:
+        _progress.pop(job_id, None)
+
+
+def _start(job_id: int, runner, params: Dict[str, Any]):
+    _set_stage(job_id, "queued")
+    task = asyncio.create_task(runner(job_id, params))
+    _running.add(task)
+    task.add_done_callback(_running.discard)
+
+
+async def submit_job(params: Dict[str, Any]) -> int:
+    """Create a job and start it in the background, returning immediately"""
+    job_id = await create_job(params)
+    _start(job_id, _run_job, params)
+    return job_id
+
+
+async def submit_sweep(params: Dict[str, Any]) -> int:
+    """
+    Create a sweep job over 1..num_stores and each of max_delivery_time_minutes_list
+
+    The job row records the largest threshold; all of them are kept in
+    constraints and result_metrics.
+    """
+    thresholds = params["max_delivery_time_minutes_list"]
+    job_id = await create_job({
+        **params,
+        "max_delivery_time_minutes": max(thresholds),
+        "constraints": {**(params.get("constraints") or {}), "sweep_thresholds": thresholds},
+    })
+    _start(job_id, _run_sweep, params)
+    return job_id
+
+
+async def get_job(job_id: int) -> Optional[Dict[str, Any]]:
+    """Job status with live progress for jobs running in this process"""
+    rows = await execute_spatial_query(
+        """
+        SELECT
+            id, status, algorithm, num_stores, max_delivery_time_min,
+            use_existing_stores, started_at, completed_at, error_message,
+            result_metrics, created_at
+        FROM optimization_jobs
+        WHERE id = $1
+        """,
+        job_id,
+    )
+    if not rows:
+        return None
+
+    job = rows[0]
+
+    live = _progress.get(job_id)
+    if live is not None:
+        job.update(live)
+    elif job["status"] in ("completed", "failed"):
+        job.update({"stage": "done", "progress": 1.0})
+    else:
+        # Pending/running in another process (or interrupted by a restart)
+        job.update({"stage": job["status"], "progress": None})
+    return job
+
+
+async def get_job_candidates(job_id: int) -> List[Dict[str, Any]]:
+    """Ranked candidates persisted for a job"""
+    return await execute_spatial_query(
+        """
+        SELECT
+            ST_Y(location) AS latitude,
+            ST_X(location) AS longitude,
+            score,
+            coverage_area_km2,
+            estimated_orders_covered,
+            avg_delivery_time_minutes,
+            roi_estimate,
+            monthly_revenue_estimate AS estimated_monthly_revenue,
+            rank,
+            metadata->>'h3_index' AS h3_index
+        FROM candidates
+        WHERE optimization_job_id = $1
+        ORDER BY rank
+        """,
+        job_id,
+    )
@@ -0,0 +1,478 @@
+"""
+Store placement optimization
+
+Loads demand cells from the demand cube and existing stores, builds the
+cell x candidate travel-time matrix and runs the facility-location solvers.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import logging
+
+import numpy as np
+from h3.api import basic_int as h3
+
+from app.core.config import settings
+from app.core.database import execute_spatial_query
+from app.services.aggregation import cell_centroids
+from app.services.cost_matrix import (
+    load_cost_matrix, load_sparse_cost_matrix, matrix_key, open_cost_matrix, speed_model_tag,
+)
+from app.services.demand_cube import load_cube_cells
+from app.services.distance import haversine_matrix, nearest_two, reachable_radius_m, travel_time_minutes
+from app.services.facility import (
+    CoverageSets, FacilityProblem, coverage_sets, csr_coverage_sets, make_problem, pareto_curve,
+    solution_metrics, solution_path, solve,
+)
+from app.services.routing import cell_store_times
+from app.services.spatial_index import PointIndex
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DemandPoints:
+    """Demand cells with centroids, weights and order value"""
+    h3_index: np.ndarray  # uint64
+    latitude: np.ndarray
+    longitude: np.ndarray
+    orders_count: np.ndarray
+    total_order_value: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.h3_index)
+
+
+@dataclass
+class StorePoints:
+    """Active store locations"""
+    id: np.ndarray
+    latitude: np.ndarray
+    longitude: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.id)
+
+
+@dataclass
+class PlacementInstance:
+    """Everything a solver run needs, detached from the database"""
+    demand: DemandPoints
+    stores: StorePoints
+    candidate_cells: np.ndarray  # indices into demand used as candidate sites
+    problem: FacilityProblem
+    lookback_days: int
+    store_times: Optional[np.ndarray] = None  # (cells, stores) minutes, kept for warm starts
+    warm_start: Optional[Dict[str, Any]] = None  # matrix reuse stats when built from a previous run
+    cost_key: Optional[str] = None  # cost-matrix store entry the matrix is mapped from
+
+    @property
+    def candidate_h3(self) -> np.ndarray:
+        return self.demand.h3_index[self.candidate_cells]
+
+    def columns_of(self, h3_cells: Sequence[int]) -> List[int]:
+        """Candidate columns of the given H3 cells, in order, skipping cells no longer candidates"""
+        found, index = match_keys(self.candidate_h3, np.asarray(h3_cells, dtype=np.uint64))
+        return index[found].tolist()
+
+
+def match_keys(previous: np.ndarray, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Whether each of `keys` appears in `previous`, and its position there"""
+    if len(previous) == 0:
+        return np.zeros(len(keys), dtype=bool), np.zeros(len(keys), dtype=np.int64)
+    order = np.argsort(previous, kind="stable")
+    position = np.minimum(np.searchsorted(previous[order], keys), len(previous) - 1)
+    index = order[position]
+    return previous[index] == keys, index
+
+
+def reuse_matrix(
+    previous: np.ndarray,
+    row_found: np.ndarray,
+    row_index: np.ndarray,
+    col_found: np.ndarray,
+    col_index: np.ndarray,
+    compute: Callable[[np.ndarray, np.ndarray], np.ndarray],
+) -> np.ndarray:
+    """
+    Matrix over new rows/columns, copying entries seen before and computing the rest
+
+    Only rows or columns without a previous counterpart reach `compute`.
+    """
+    rows_old, rows_new = np.flatnonzero(row_found), np.flatnonzero(~row_found)
+    cols_old, cols_new = np.flatnonzero(col_found), np.flatnonzero(~col_found)
+    out = np.empty((len(row_found), len(col_found)), dtype=np.float32)
+    out[np.ix_(rows_old, cols_old)] = previous[np.ix_(row_index[rows_old], col_index[cols_old])]
+    if len(rows_new):
+        out[rows_new, :] = compute(rows_new, np.arange(len(col_found)))
+    if len(cols_new) and len(rows_old):
+        out[np.ix_(rows_old, cols_new)] = compute(rows_old, cols_new)
+    return out
+
+
+async def load_demand_points(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    resolution: Optional[int] = None,
+) -> DemandPoints:
+    """Per-cell demand for the window, read from the demand cube"""
+    resolution = settings.OPTIMIZATION_RESOLUTION if resolution is None else resolution
+    aggregates = await load_cube_cells(start_date, end_date, resolution)
+    centroids = cell_centroids(aggregates.h3_index)
+    return DemandPoints(
+        h3_index=aggregates.h3_index,
+        latitude=centroids[:, 0],
+        longitude=centroids[:, 1],
+        orders_count=aggregates.orders_count,
+        total_order_value=aggregates.total_order_value,
+    )
+
+
+async def load_store_points() -> StorePoints:
+    """Active store coordinates as arrays"""
+    rows = await execute_spatial_query(
+        """
+        SELECT id, ST_Y(location) AS latitude, ST_X(location) AS longitude
+        FROM stores
+        WHERE is_active = TRUE
+        ORDER BY id
+        """
+    )
+    n = len(rows)
+    return StorePoints(
+        id=np.fromiter((r["id"] for r in rows), dtype=np.int64, count=n),
+        latitude=np.fromiter((r["latitude"] for r in rows), dtype=np.float64, count=n),
+        longitude=np.fromiter((r["longitude"] for r in rows), dtype=np.float64, count=n),
+    )
+
+
+def select_candidate_cells(demand: DemandPoints, limit: Optional[int] = None) -> np.ndarray:
+    """
+    Cells offered to the solver as candidate store sites
+
+    The highest-demand cells by default; with CANDIDATE_SITE_METHOD
+    "clustering", demand-weighted cluster medoids from ml.clustering, which
+    spread sites over the whole city instead of piling them into one hotspot.
+    """
+    limit = settings.MAX_CANDIDATE_SITES if limit is None else limit
+    if settings.CANDIDATE_SITE_METHOD == "clustering" and len(demand) > limit:
+        try:
+            from ml.clustering import candidate_sites
+        except ImportError as e:
+            logger.warning(f"⚠️ Clustering unavailable, using top-demand candidate sites: {e}")
+        else:
+            return candidate_sites(demand.latitude, demand.longitude, demand.orders_count, limit)
+
+    order = np.argsort(-demand.orders_count, kind="stable")
+    return np.sort(order[:limit])
+
+
+def warm_candidate_cells(demand: DemandPoints, previous: PlacementInstance) -> np.ndarray:
+    """
+    Candidate sites for a warm start: the previous run's sites still in demand,
+    topped up from the usual selection to MAX_CANDIDATE_SITES
+    """
+    found, index = match_keys(demand.h3_index, previous.candidate_h3)
+    kept = index[found]
+    extra = np.setdiff1d(select_candidate_cells(demand), kept)
+    return np.union1d(kept, extra[:max(settings.MAX_CANDIDATE_SITES - len(kept), 0)])
+
+
+def build_instance(
+    demand: DemandPoints,
+    stores: StorePoints,
+    use_existing_stores: bool = True,
+    lookback_days: int = 0,
+    store_times: Optional[np.ndarray] = None,
+    previous: Optional[PlacementInstance] = None,
+) -> PlacementInstance:
+    """
+    Build the travel-time matrix and fixed-facility costs for a placement run
+
+    `store_times` (cells x stores, minutes) overrides the speed model for
+    existing stores, e.g. with routed OSRM times.
+
+    With a `previous` instance (warm start), its candidate sites are kept and
+    travel times are copied for every (cell, site) and (cell, store) pair it
+    already had; only new demand cells (rows), new sites and new or moved
+    stores (columns) are computed. Demand weights are always the current ones.
+    """
+    candidates = select_candidate_cells(demand) if previous is None else warm_candidate_cells(demand, previous)
+    cand_lat, cand_lon = demand.latitude[candidates], demand.longitude[candidates]
+
+    def site_times(rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        return travel_time_minutes(haversine_matrix(
+            demand.latitude[rows], demand.longitude[rows], cand_lat[cols], cand_lon[cols],
+        ))
+
+    def store_model_times(rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        return travel_time_minutes(haversine_matrix(
+            demand.latitude[rows], demand.longitude[rows], stores.latitude[cols], stores.longitude[cols],
+        ))
+
+    all_cells = np.arange(len(demand))
+    if previous is None:
+        def compute_cost() -> np.ndarray:
+            return site_times(all_cells, np.arange(len(candidates)))
+    else:
+        row_found, row_index = match_keys(previous.demand.h3_index, demand.h3_index)
+        col_found, col_index = match_keys(previous.candidate_h3, demand.h3_index[candidates])
+
+        def compute_cost() -> np.ndarray:
+            return reuse_matrix(previous.problem.cost, row_found, row_index, col_found, col_index, site_times)
+
+    key = None
+    if settings.COST_MATRIX_STORE_ENABLED:
+        key = matrix_key(
+            demand.h3_index, demand.h3_index[candidates], settings.OPTIMIZATION_RESOLUTION, speed_model_tag(),
+        )
+        cost = load_cost_matrix(key, compute_cost, demand.h3_index, demand.h3_index[candidates])
+    else:
+        cost = compute_cost()
+
+    fixed_cost = None
+    if use_existing_stores and len(stores):
+        if store_times is None:
+            if previous is not None and previous.store_times is not None:
+                # A store is reusable only if it has not moved since the previous run
+                store_found, store_index = match_keys(previous.stores.id, stores.id)
+                store_found &= (
+                    (previous.stores.latitude[store_index] == stores.latitude)
+                    & (previous.stores.longitude[store_index] == stores.longitude)
+                )
+                store_times = reuse_matrix(
+                    previous.store_times, row_found, row_index, store_found, store_index, store_model_times,
+                )
+            else:
+                store_times = store_model_times(all_cells, np.arange(len(stores)))
+        fixed_cost = store_times.min(axis=1)
+
+    warm_start = None
+    if previous is not None:
+        warm_start = {
+            "reused_cells": int(row_found.sum()),
+            "new_cells": int((~row_found).sum()),
+            "reused_sites": int(col_found.sum()),
+            "new_sites": int((~col_found).sum()),
+        }
+
+    problem = make_problem(cost, demand.orders_count, fixed_cost)
+    return PlacementInstance(demand, stores, candidates, problem, lookback_days, store_times, warm_start, key)
+
+
+def stored_instance(key: str) -> Optional[PlacementInstance]:
+    """
+    Warm-start source rebuilt from a cost-matrix store entry
+
+    Carries only what build_instance reuses from a previous run: its cells,
+    candidate sites and travel-time matrix. Weights, centroids and stores
+    are left empty, so existing-store columns are recomputed. None when the
+    entry is no longer in the store.
+    """
+    stored = open_cost_matrix(key)
+    if stored is None:
+        return None
+    cost, cell_h3, candidate_h3 = stored
+    n = len(cell_h3)
+    _, candidate_cells = match_keys(cell_h3, candidate_h3)
+    empty = np.zeros(n)
+    demand = DemandPoints(cell_h3, empty, empty, empty, empty)
+    stores = StorePoints(np.array([], dtype=np.int64), np.array([]), np.array([]))
+    problem = FacilityProblem(cost, empty, np.zeros(n, dtype=np.float32))
+    return PlacementInstance(demand, stores, candidate_cells, problem, 0, cost_key=key)
+
+
+def candidate_coverage(instance: PlacementInstance, max_time: float) -> CoverageSets:
+    """
+    Cells each candidate site reaches within max_time
+
+    With a stored cost matrix, from its sparse variant for max_time (saved
+    on first use, so later runs and sweeps at the same SLA skip the dense
+    scan) and so exactly the pairs the solution metrics count as covered.
+    Otherwise from a KD-tree range query: candidate travel times come from the
+    speed model, so the cells within max_time are those inside the reachable
+    radius. Either way memory scales with the covered pairs rather than
+    cells x candidates.
+    """
+    if instance.cost_key is not None:
+        sparse = load_sparse_cost_matrix(instance.cost_key, max_time, instance.problem.cost)
+        return csr_coverage_sets(sparse.indptr, sparse.indices, sparse.n_candidates)
+
+    demand = instance.demand
+    index = PointIndex(np.arange(len(demand)), demand.latitude, demand.longitude)
+    hits = index.within(
+        demand.latitude[instance.candidate_cells],
+        demand.longitude[instance.candidate_cells],
+        reachable_radius_m(max_time),
+    )
+    sites = np.repeat(np.arange(len(hits)), [len(h) for h in hits])
+    cells = np.concatenate(hits) if hits else np.array([], dtype=np.int64)
+    return coverage_sets(cells, sites, len(demand), len(hits))
+
+
+def run_placement(
+    instance: PlacementInstance,
+    num_stores: int,
+    max_delivery_time_minutes: float,
+    algorithm: str = "p-median",
+    initial: Optional[Sequence[int]] = None,
+) -> Dict[str, Any]:
+    """
+    Solve a placement instance and format ranked candidates
+
+    `initial` (candidate columns, e.g. a previous job's sites) seeds the
+    p-median local search; the other algorithms ignore it.
+    """
+    coverage = candidate_coverage(instance, max_delivery_time_minutes) if algorithm == "max-coverage" else None
+    solution = solve(instance.problem, num_stores, max_delivery_time_minutes, algorithm, initial, coverage)
+    metrics = solution_metrics(instance.problem, solution.selected, max_delivery_time_minutes)
+
+    demand = instance.demand
+    total_orders = float(demand.orders_count.sum())
+    avg_order_value = float(demand.total_order_value.sum()) / total_orders if total_orders else 0.0
+    cell_area_km2 = h3.average_hexagon_area(settings.OPTIMIZATION_RESOLUTION, unit="km^2")
+
+    candidates = []
+    for facility in metrics["facilities"]:
+        cell = instance.candidate_cells[facility["candidate"]]
+        candidates.append({
+            "latitude": float(demand.latitude[cell]),
+            "longitude": float(demand.longitude[cell]),
+            "h3_index": h3.int_to_str(int(demand.h3_index[cell])),
+            "score": round(facility["orders_covered"] / total_orders, 6) if total_orders else 0.0,
+            "coverage_area_km2": round(facility["cells_covered"] * cell_area_km2, 3),
+            "estimated_orders_covered": int(facility["orders_covered"]),
+            "avg_delivery_time_minutes": round(facility["avg_travel_time"], 2),
+            "estimated_monthly_revenue": round(
+                facility["orders_served"] * avg_order_value * 30 / max(instance.lookback_days, 1), 2
+            ),
+        })
+
+    candidates.sort(key=lambda c: c["score"], reverse=True)
+    for rank, candidate in enumerate(candidates, 1):
+        candidate["rank"] = rank
+
+    return {
+        "candidates": candidates,
+        "total_coverage_percentage": round(metrics["coverage_fraction"] * 100, 2),
+        "avg_delivery_time": round(metrics["avg_travel_time"], 2),
+        "optimization_method": algorithm,
+        "metrics": {
+            "objective": solution.objective,
+            "iterations": solution.iterations,
+            "max_delivery_time": round(metrics["max_travel_time"], 2),
+            "demand_cells": instance.problem.n_cells,
+            "candidate_sites": instance.problem.n_candidates,
+            "existing_stores": len(instance.stores),
+            **({"warm_start": instance.warm_start} if instance.warm_start else {}),
+        },
+    }
+
+
+def run_sweep(
+    instance: PlacementInstance,
+    max_stores: int,
+    thresholds: Sequence[float],
+    algorithm: str = "p-median",
+) -> List[Dict[str, Any]]:
+    """
+    Coverage curves over 1..max_stores new sites, one per delivery-time threshold
+
+    Only max-coverage depends on the threshold; the other algorithms solve
+    the path once and evaluate it at every threshold. With existing stores,
+    each curve starts at 0 (fixed stores only). Sites are H3 cells.
+    """
+    problem = instance.problem
+    if algorithm == "max-coverage":
+        paths = {
+            threshold: solution_path(
+                problem, max_stores, threshold, algorithm, candidate_coverage(instance, threshold),
+            )
+            for threshold in thresholds
+        }
+    else:
+        paths = {thresholds[0]: solution_path(problem, max_stores, thresholds[0], algorithm)}
+    baseline = [[]] if len(instance.stores) else []
+    site_h3 = instance.candidate_h3
+
+    curves = []
+    for threshold in thresholds:
+        path = paths[threshold if algorithm == "max-coverage" else thresholds[0]]
+        points = pareto_curve(problem, baseline + path, threshold)
+        for point in points:
+            point["coverage_percentage"] = round(point.pop("coverage_fraction") * 100, 2)
+            point["avg_travel_time"] = round(point["avg_travel_time"], 2)
+            point["max_travel_time"] = round(point["max_travel_time"], 2)
+            point["sites"] = [h3.int_to_str(int(site_h3[j])) for j in point.pop("selected")]
+        curves.append({"max_delivery_time_minutes": threshold, "points": points})
+    return curves
+
+
+@dataclass
+class PlacementInputs:
+    """Demand, stores and routed store times for a placement run, as loaded from the database"""
+    demand: DemandPoints
+    stores: StorePoints
+    use_existing_stores: bool
+    lookback_days: int
+    store_times: Optional[np.ndarray] = None  # (cells, stores) minutes when OSRM is on
+
+
+async def load_inputs(
+    use_existing_stores: bool = True,
+    lookback_days: Optional[int] = None,
+) -> PlacementInputs:
+    """
+    Load what a placement run needs from the database (and OSRM)
+
+    Only I/O happens here; the travel-time matrix is built by
+    prepare_instance in the solver pool, off the event loop.
+    """
+    lookback_days = settings.OPTIMIZATION_LOOKBACK_DAYS if lookback_days is None else lookback_days
+    end_date = datetime.utcnow()
+    demand = await load_demand_points(end_date - timedelta(days=lookback_days), end_date)
+    stores = await load_store_points() if use_existing_stores else StorePoints(
+        np.array([], dtype=np.int64), np.array([]), np.array([])
+    )
+    store_times = None
+    if settings.OSRM_ENABLED and len(stores):
+        seconds = await cell_store_times(demand.h3_index, stores.id, stores.latitude, stores.longitude)
+        store_times = (seconds / 60.0).astype(np.float32)
+    return PlacementInputs(demand, stores, use_existing_stores, lookback_days, store_times)
+
+
+def prepare_instance(
+    inputs: PlacementInputs,
+    previous: Optional[PlacementInstance] = None,
+) -> PlacementInstance:
+    """Build a placement instance (warm from `previous` if given); CPU-bound, run it in the solver pool"""
+    instance = build_instance(
+        inputs.demand, inputs.stores, inputs.use_existing_stores, inputs.lookback_days,
+        inputs.store_times, previous,
+    )
+    logger.info(
+        f"🧮 Placement instance: {instance.problem.n_cells:,} cells x "
+        f"{instance.problem.n_candidates:,} candidates, {len(inputs.stores)} fixed stores"
+    )
+    return instance
+
+
+def solve_placement(
+    inputs: PlacementInputs,
+    num_stores: int,
+    max_delivery_time_minutes: float,
+    algorithm: str = "p-median",
+    previous: Optional[PlacementInstance] = None,
+    initial_cells: Optional[Sequence[int]] = None,
+) -> Tuple[Dict[str, Any], PlacementInstance]:
+    """
+    Build and solve an instance in one solver-pool call
+
+    `initial_cells` (H3 cells of a previous solution) seed the solver where
+    they are still candidate sites. Returns the result and the instance, which
+    callers keep for warm starts.
+    """
+    instance = prepare_instance(inputs, previous)
+    initial = instance.columns_of(initial_cells)[:num_stores] if initial_cells is not None else None
+    result = run_placement(instance, num_stores, max_delivery_time_minutes, algorithm, initial)
+    return result, instance
@@ -0,0 +1,195 @@
+"""
+Keyset-paginated order listing and streaming export
+
+Pages are addressed by an opaque (timestamp, id) cursor instead of OFFSET,
+so every page is an index range scan on orders.timestamp no matter how deep
+it is. Totals come from the planner's row estimate rather than COUNT(*).
+Exports stream rows from a server-side cursor as NDJSON or CSV, holding one
+fetch batch in memory at a time; the columns match what POST /orders/bulk
+accepts, so an export can be loaded back as is.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import base64
+import csv
+import io
+import json
+
+from app.core.config import settings
+from app.core.database import execute_spatial_query, raw_connection
+from app.services.aggregation import to_naive_utc
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+EXPORT_COLUMNS = [
+    "id", "timestamp", "latitude", "longitude", "items_count", "order_value",
+    "customer_id", "delivered_at", "delivery_time_min", "status", "store_id",
+]
+
+ORDER_COLUMNS = """
+    id, timestamp, ST_Y(location) AS latitude, ST_X(location) AS longitude,
+    items_count, order_value, customer_id, delivered_at, delivery_time_min, status, store_id
+"""
+
+
+@dataclass
+class OrderFilters:
+    """Optional filters shared by listing, counting and export"""
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    status: Optional[str] = None
+    bbox: Optional[Tuple[float, float, float, float]] = None  # min_lon, min_lat, max_lon, max_lat
+
+    def where(self, args: List[Any]) -> List[str]:
+        """SQL conditions, appending their positional parameters to args"""
+        clauses = []
+        if self.start_date is not None:
+            args.append(to_naive_utc(self.start_date))
+            clauses.append(f"timestamp >= ${len(args)}")
+        if self.end_date is not None:
+            args.append(to_naive_utc(self.end_date))
+            clauses.append(f"timestamp <= ${len(args)}")
+        if self.status is not None:
+            args.append(self.status)
+            clauses.append(f"status = ${len(args)}")
+        if self.bbox is not None:
+            args.extend(self.bbox)
+            n = len(args)
+            clauses.append(f"location && ST_MakeEnvelope(${n - 3}, ${n - 2}, ${n - 1}, ${n}, 4326)")
+        return clauses
+
+
+def parse_bbox(value: Optional[str]) -> Optional[Tuple[float, float, float, float]]:
+    """'min_lon,min_lat,max_lon,max_lat' -> tuple"""
+    if value is None:
+        return None
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(part) for part in value.split(","))
+    except ValueError:
+        raise ValueError("bbox must be 'min_lon,min_lat,max_lon,max_lat'")
+    if not (-180 <= min_lon <= max_lon <= 180 and -90 <= min_lat <= max_lat <= 90):
+        raise ValueError("bbox is out of range or has min greater than max")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def encode_cursor(timestamp: datetime, order_id: int) -> str:
+    """Opaque page cursor for the row after (timestamp, id)"""
+    raw = f"{timestamp.isoformat()}|{order_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, order_id = raw.split("|")
+        return datetime.fromisoformat(timestamp), int(order_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def where_sql(clauses: List[str]) -> str:
+    return f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+
+async def approximate_count(filters: OrderFilters) -> int:
+    """Planner row estimate for the filtered orders (no table scan)"""
+    args: List[Any] = []
+    clauses = filters.where(args)
+    rows = await execute_spatial_query(
+        f"EXPLAIN (FORMAT JSON) SELECT 1 FROM orders {where_sql(clauses)}", *args,
+    )
+    plan = rows[0]["QUERY PLAN"]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+async def list_orders(
+    filters: OrderFilters,
+    limit: int,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+) -> Dict[str, Any]:
+    """One page of orders in (timestamp, id) order plus the cursor of the next page"""
+    args: List[Any] = []
+    clauses = filters.where(args)
+    if cursor is not None:
+        after_timestamp, after_id = decode_cursor(cursor)
+        args.extend([after_timestamp, after_id])
+        n = len(args)
+        # The plain range keeps the scan on the timestamp index; the row
+        # comparison breaks ties between orders sharing a timestamp
+        clauses.append(f"timestamp >= ${n - 1} AND (timestamp, id) > (${n - 1}, ${n})")
+    args.append(limit + 1)
+
+    rows = await execute_spatial_query(
+        f"""
+        SELECT {ORDER_COLUMNS}
+        FROM orders
+        {where_sql(clauses)}
+        ORDER BY timestamp, id
+        LIMIT ${len(args)}
+        """,
+        *args,
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["timestamp"], rows[-1]["id"])
+
+    return {
+        "orders": rows,
+        "next_cursor": next_cursor,
+        "total": await approximate_count(filters) if include_total else None,
+    }
+
+
+def _json_value(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def format_rows(rows: List[Any], format: str) -> str:
+    """Serialize a batch of export rows as NDJSON lines or CSV records"""
+    if format == "ndjson":
+        return "".join(
+            json.dumps({column: _json_value(row[column]) for column in EXPORT_COLUMNS}) + "\n"
+            for row in rows
+        )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerows(
+        [_json_value(row[column]) if row[column] is not None else "" for column in EXPORT_COLUMNS]
+        for row in rows
+    )
+    return buffer.getvalue()
+
+
+async def export_orders(filters: OrderFilters, format: str) -> AsyncIterator[bytes]:
+    """
+    Stream filtered orders from a server-side cursor as NDJSON or CSV
+
+    Rows are fetched ORDER_EXPORT_FETCH_SIZE at a time inside one read-only
+    transaction, so memory stays flat however many rows match.
+    """
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format '{format}', expected ndjson or csv")
+
+    args: List[Any] = []
+    clauses = filters.where(args)
+    query = f"SELECT {ORDER_COLUMNS} FROM orders {where_sql(clauses)} ORDER BY timestamp, id"
+
+    if format == "csv":
+        yield (",".join(EXPORT_COLUMNS) + "\n").encode()
+
+    async with raw_connection() as conn:
+        async with conn.transaction(readonly=True):
+            cursor = await conn.cursor(query, *args)
+            while True:
+                rows = await cursor.fetch(settings.ORDER_EXPORT_FETCH_SIZE)
+                if not rows:
+                    break
+                yield format_rows(rows, format).encode()
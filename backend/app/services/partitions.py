@@ -0,0 +1,213 @@
+"""
+Monthly range partitioning of the orders table
+
+orders is partitioned by RANGE (timestamp) into one table per calendar month
+(orders_YYYY_MM) plus orders_default for anything outside them. Indexes are
+declared on the parent, so every partition carries its own GiST and
+timestamp indexes, and date-windowed queries only touch the months they
+overlap (plan-time or executor-startup pruning on the timestamp bounds).
+
+Prisma cannot declare partitioned tables, so `prisma db push` creates a
+plain orders table and partition_orders() converts it in place once. New
+months are created on demand before orders are written (ensure_order_partitions),
+and any rows that already landed in orders_default for that month are moved
+into the new partition as it is attached.
+"""
+from datetime import date, datetime, time
+from typing import Any, Dict, List, Optional, Set
+import logging
+
+from app.core.config import settings
+from app.core.database import affected_rows, raw_connection
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "orders"
+DEFAULT_PARTITION = "orders_default"
+LEGACY_TABLE = "orders_unpartitioned"
+
+# Serializes partition DDL across workers
+PARTITION_LOCK_SQL = "SELECT pg_advisory_xact_lock(hashtext('orders_partitions'))"
+
+IS_PARTITIONED_SQL = """
+    SELECT EXISTS (
+        SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass($1)
+    )
+"""
+
+EXISTING_PARTITIONS_SQL = """
+    SELECT c.relname
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = to_regclass($1)
+"""
+
+# Month partitions known to exist; skips catalog round trips on the write path
+_known_months: Set[date] = set()
+_partitioned: Optional[bool] = None
+
+
+def month_start(value: datetime) -> date:
+    return date(value.year, value.month, 1)
+
+
+def next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def months_between(start: datetime, end: datetime) -> List[date]:
+    """First day of every month overlapping [start, end]"""
+    months = []
+    month = month_start(start)
+    while month <= month_start(end):
+        months.append(month)
+        month = next_month(month)
+    return months
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_{month.year:04d}_{month.month:02d}"
+
+
+async def _attach_month(conn, month: date):
+    """
+    Create and attach one month's partition
+
+    The table is built standalone, filled with any rows for the month sitting
+    in the default partition, then attached; ATTACH adds the parent's
+    indexes to it.
+    """
+    name = partition_name(month)
+    lower, upper = month.isoformat(), next_month(month).isoformat()
+    await conn.execute(
+        f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+    )
+    moved = await conn.execute(
+        f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION}
+            WHERE timestamp >= '{lower}' AND timestamp < '{upper}'
+            RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+        """
+    )
+    await conn.execute(
+        f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')"
+    )
+    logger.info(f"🗂️ Created partition {name} ({affected_rows(moved)} rows moved from default)")
+
+
+async def is_partitioned() -> bool:
+    global _partitioned
+    if _partitioned is None:
+        async with raw_connection() as conn:
+            _partitioned = await conn.fetchval(IS_PARTITIONED_SQL, PARENT_TABLE)
+    return _partitioned
+
+
+async def ensure_order_partitions(start: datetime, end: datetime) -> int:
+    """
+    Make sure monthly partitions exist for every month in [start, end]
+
+    No-op while orders is not partitioned. Returns the number created.
+    """
+    months = [m for m in months_between(start, end) if m not in _known_months]
+    if not months or not await is_partitioned():
+        return 0
+
+    created = 0
+    async with raw_connection() as conn:
+        async with conn.transaction():
+            await conn.execute(PARTITION_LOCK_SQL)
+            existing = {row["relname"] for row in await conn.fetch(EXISTING_PARTITIONS_SQL, PARENT_TABLE)}
+            for month in months:
+                if partition_name(month) not in existing:
+                    await _attach_month(conn, month)
+                    created += 1
+    _known_months.update(months)
+    return created
+
+
+async def ensure_upcoming_partitions() -> int:
+    """Pre-create partitions for this month and the next ORDER_PARTITION_PREMAKE_MONTHS"""
+    now = datetime.utcnow()
+    last = month_start(now)
+    for _ in range(settings.ORDER_PARTITION_PREMAKE_MONTHS):
+        last = next_month(last)
+    return await ensure_order_partitions(now, datetime.combine(last, time.min))
+
+
+async def partition_orders() -> Dict[str, Any]:
+    """
+    Convert a plain orders table into a monthly partitioned one (idempotent)
+
+    Runs in one transaction: the old table is renamed, a partitioned parent
+    is created with the same columns, indexes and foreign keys (the primary
+    key becomes (id, timestamp), as it must include the partition key),
+    partitions are created for every month with data, rows are copied over
+    and the old table is dropped. The id sequence is kept.
+    """
+    global _partitioned
+
+    if await is_partitioned():
+        return {"partitioned": False, "reason": "orders is already partitioned"}
+
+    async with raw_connection() as conn:
+        async with conn.transaction():
+            await conn.execute(PARTITION_LOCK_SQL)
+            await conn.execute(f"LOCK TABLE {PARENT_TABLE} IN ACCESS EXCLUSIVE MODE")
+
+            indexes = await conn.fetch(
+                """
+                SELECT i.indexname, i.indexdef, x.indisprimary
+                FROM pg_indexes i
+                JOIN pg_index x ON x.indexrelid = to_regclass(i.schemaname || '.' || i.indexname)
+                WHERE i.tablename = $1 AND i.schemaname = current_schema()
+                """,
+                PARENT_TABLE,
+            )
+            foreign_keys = await conn.fetch(
+                """
+                SELECT conname, pg_get_constraintdef(oid) AS definition
+                FROM pg_constraint
+                WHERE conrelid = to_regclass($1) AND contype = 'f'
+                """,
+                PARENT_TABLE,
+            )
+            bounds = await conn.fetchrow(
+                f"SELECT MIN(timestamp) AS first, MAX(timestamp) AS last FROM {PARENT_TABLE}"
+            )
+
+            await conn.execute(f"ALTER TABLE {PARENT_TABLE} RENAME TO {LEGACY_TABLE}")
+            for index in indexes:
+                await conn.execute(f"ALTER INDEX {index['indexname']} RENAME TO {index['indexname']}_old")
+
+            await conn.execute(
+                f"""
+                CREATE TABLE {PARENT_TABLE} (LIKE {LEGACY_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+                PARTITION BY RANGE (timestamp)
+                """
+            )
+            await conn.execute(f"ALTER TABLE {PARENT_TABLE} ADD PRIMARY KEY (id, timestamp)")
+            for index in indexes:
+                if not index["indisprimary"]:
+                    await conn.execute(index["indexdef"])
+            for fk in foreign_keys:
+                await conn.execute(
+                    f"ALTER TABLE {PARENT_TABLE} ADD CONSTRAINT {fk['conname']} {fk['definition']}"
+                )
+            await conn.execute(f"ALTER SEQUENCE IF EXISTS orders_id_seq OWNED BY {PARENT_TABLE}.id")
+
+            await conn.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT")
+            months = months_between(bounds["first"], bounds["last"]) if bounds["first"] else []
+            for month in months:
+                await _attach_month(conn, month)
+
+            moved = await conn.execute(f"INSERT INTO {PARENT_TABLE} SELECT * FROM {LEGACY_TABLE}")
+            await conn.execute(f"DROP TABLE {LEGACY_TABLE}")
+
+    _partitioned = True
+    _known_months.update(months)
+    logger.info(f"🗂️ Partitioned orders into {len(months)} monthly partitions")
+    return {"partitioned": True, "partitions": len(months), "rows": affected_rows(moved)}
@@ -0,0 +1,292 @@
+"""
+OSRM routing with a persistent travel-time cache
+
+Cell -> store road travel times come from the OSRM table service. Requests
+share one pooled aiohttp session, coordinate sets are split into tiles that
+stay under the server's --max-table-size, and at most OSRM_MAX_CONCURRENCY
+tiles are in flight. Routed pairs are stored in travel_times so repeated
+coverage and optimization runs never route the same (cell, store) twice;
+pairs OSRM cannot answer fall back to the straight-line speed model.
+"""
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import logging
+
+import aiohttp
+import numpy as np
+from h3.api import basic_int as h3
+
+from app.core.config import settings
+from app.core.database import execute_spatial_command, execute_spatial_query
+from app.services.distance import haversine_matrix, travel_time_minutes
+
+logger = logging.getLogger(__name__)
+
+# Pairs per cache upsert statement
+CACHE_WRITE_BATCH = 50_000
+
+# Cached rows are only trusted if they were routed to the store's current
+# coordinates, so moving a store invalidates its routes without explicit
+# bookkeeping while other store edits keep them.
+SELECT_CACHED_SQL = """
+    SELECT t.h3_index, t.store_id, t.duration_seconds
+    FROM travel_times t
+    JOIN unnest($1::INT[], $3::FLOAT8[], $4::FLOAT8[]) AS s(id, latitude, longitude)
+        ON s.id = t.store_id
+    WHERE t.h3_index = ANY($2::TEXT[])
+      AND ST_Equals(t.destination, ST_SetSRID(ST_MakePoint(s.longitude, s.latitude), 4326))
+"""
+
+UPSERT_CACHED_SQL = """
+    INSERT INTO travel_times (h3_index, store_id, duration_seconds, distance_meters, destination, calculated_at)
+    SELECT
+        s.h3_index, s.store_id, s.duration_seconds, s.distance_meters,
+        ST_SetSRID(ST_MakePoint(s.longitude, s.latitude), 4326), NOW()
+    FROM unnest($1::TEXT[], $2::INT[], $3::FLOAT8[], $4::FLOAT8[], $5::FLOAT8[], $6::FLOAT8[])
+        AS s(h3_index, store_id, duration_seconds, distance_meters, latitude, longitude)
+    ON CONFLICT (h3_index, store_id) DO UPDATE SET
+        duration_seconds = EXCLUDED.duration_seconds,
+        distance_meters = EXCLUDED.distance_meters,
+        destination = EXCLUDED.destination,
+        calculated_at = NOW()
+"""
+
+
+class RoutingError(Exception):
+    """OSRM request failed or returned a non-Ok code"""
+
+
+def table_tiles(n_sources: int, n_destinations: int, max_coordinates: int) -> List[Tuple[slice, slice]]:
+    """Split a sources x destinations table into tiles of at most max_coordinates points"""
+    if max_coordinates < 2:
+        raise ValueError("OSRM table requests need room for at least two coordinates")
+    dest_tile = min(n_destinations, max_coordinates // 2)
+    source_tile = max_coordinates - dest_tile
+    return [
+        (slice(i, min(i + source_tile, n_sources)), slice(j, min(j + dest_tile, n_destinations)))
+        for i in range(0, n_sources, source_tile)
+        for j in range(0, n_destinations, dest_tile)
+    ]
+
+
+class OSRMClient:
+    """Pooled, concurrency-bounded client for the OSRM table service"""
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        max_coordinates: Optional[int] = None,
+        timeout_seconds: Optional[float] = None,
+        max_retries: Optional[int] = None,
+    ):
+        self.base_url = (base_url or settings.OSRM_URL).rstrip("/")
+        self.max_concurrency = max_concurrency or settings.OSRM_MAX_CONCURRENCY
+        self.max_coordinates = max_coordinates or settings.OSRM_TABLE_MAX_COORDINATES
+        self.timeout = aiohttp.ClientTimeout(total=timeout_seconds or settings.OSRM_TIMEOUT_SECONDS)
+        self.max_retries = settings.OSRM_MAX_RETRIES if max_retries is None else max_retries
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def session(self) -> aiohttp.ClientSession:
+        """Shared keep-alive session, created on first use inside the running loop"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _request_tile(
+        self,
+        src_lat: np.ndarray,
+        src_lon: np.ndarray,
+        dst_lat: np.ndarray,
+        dst_lon: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """One table request; returns (durations s, distances m) with NaN for unroutable pairs"""
+        coords = ";".join(
+            f"{lon:.6f},{lat:.6f}"
+            for lat, lon in zip(np.concatenate([src_lat, dst_lat]), np.concatenate([src_lon, dst_lon]))
+        )
+        n = len(src_lat)
+        params = {
+            "sources": ";".join(map(str, range(n))),
+            "destinations": ";".join(map(str, range(n, n + len(dst_lat)))),
+            "annotations": "duration,distance",
+        }
+        url = f"{self.base_url}/table/v1/driving/{coords}"
+        session = await self.session()
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._semaphore:
+                    async with session.get(url, params=params) as response:
+                        payload = await response.json(content_type=None)
+                if payload.get("code") != "Ok":
+                    raise RoutingError(f"OSRM {response.status}: {payload.get('code')} {payload.get('message', '')}")
+                durations = np.array(payload["durations"], dtype=np.float64)
+                distances = np.array(payload.get("distances") or np.full(durations.shape, np.nan), dtype=np.float64)
+                return durations, distances
+            except (aiohttp.ClientError, asyncio.TimeoutError, RoutingError, ValueError) as e:
+                if attempt == self.max_retries:
+                    raise RoutingError(str(e)) from e
+                await asyncio.sleep(0.5 * 2 ** attempt)
+
+    async def table(
+        self,
+        src_lat: np.ndarray,
+        src_lon: np.ndarray,
+        dst_lat: np.ndarray,
+        dst_lon: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Full sources x destinations duration/distance matrices
+
+        Tiles that still fail after retries are left as NaN, so one bad
+        request degrades a few pairs instead of the whole table.
+        """
+        durations = np.full((len(src_lat), len(dst_lat)), np.nan)
+        distances = np.full_like(durations, np.nan)
+
+        async def run(rows: slice, cols: slice):
+            try:
+                d, m = await self._request_tile(src_lat[rows], src_lon[rows], dst_lat[cols], dst_lon[cols])
+                durations[rows, cols] = d
+                distances[rows, cols] = m
+            except RoutingError as e:
+                logger.warning(f"⚠️ OSRM tile failed ({rows.stop - rows.start}x{cols.stop - cols.start}): {e}")
+
+        tiles = table_tiles(len(src_lat), len(dst_lat), self.max_coordinates)
+        await asyncio.gather(*(run(rows, cols) for rows, cols in tiles))
+        return durations, distances
+
+
+_client: Optional[OSRMClient] = None
+
+
+def get_osrm_client() -> OSRMClient:
+    """Process-wide OSRM client (one pooled session per API process)"""
+    global _client
+    if _client is None:
+        _client = OSRMClient()
+    return _client
+
+
+async def close_routing():
+    """Close the pooled OSRM session"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+async def load_cached_times(
+    cells: List[str],
+    store_ids: List[int],
+    store_lat: List[float],
+    store_lon: List[float],
+) -> Dict[Tuple[str, int], float]:
+    """Cached (cell, store) -> seconds entries routed to the given store coordinates"""
+    if not cells or not store_ids:
+        return {}
+    rows = await execute_spatial_query(SELECT_CACHED_SQL, store_ids, cells, store_lat, store_lon)
+    return {(r["h3_index"], r["store_id"]): float(r["duration_seconds"]) for r in rows}
+
+
+async def save_cached_times(
+    cells: List[str],
+    store_ids: List[int],
+    durations: List[float],
+    distances: List[Optional[float]],
+    store_lat: List[float],
+    store_lon: List[float],
+) -> int:
+    """Upsert routed pairs into travel_times with the store coordinates they were routed to"""
+    written = 0
+    for start in range(0, len(cells), CACHE_WRITE_BATCH):
+        end = start + CACHE_WRITE_BATCH
+        written += await execute_spatial_command(
+            UPSERT_CACHED_SQL,
+            cells[start:end], store_ids[start:end], durations[start:end], distances[start:end],
+            store_lat[start:end], store_lon[start:end],
+        )
+    return written
+
+
+async def cell_store_times(
+    cells: np.ndarray,
+    store_ids: np.ndarray,
+    store_lat: np.ndarray,
+    store_lon: np.ndarray,
+) -> np.ndarray:
+    """
+    Travel time in seconds from every cell centroid to every store, shape (cells, stores)
+
+    Served from the travel_times cache where possible; only missing pairs are
+    routed (cells with any missing store are routed against those stores).
+    Without OSRM, or for pairs it cannot route, the speed model is used and
+    nothing is cached.
+    """
+    cell_ids = [h3.int_to_str(int(c)) for c in cells]
+    ids = [int(s) for s in store_ids]
+    centroids = np.array([h3.cell_to_latlng(int(c)) for c in cells], dtype=np.float64).reshape(-1, 2)
+
+    times = np.full((len(cell_ids), len(ids)), np.nan)
+    if settings.OSRM_ENABLED and len(cell_ids) and len(ids):
+        cell_pos = {cell: i for i, cell in enumerate(cell_ids)}
+        store_pos = {store: j for j, store in enumerate(ids)}
+        cached = await load_cached_times(
+            cell_ids, ids, [float(v) for v in store_lat], [float(v) for v in store_lon],
+        )
+        for (cell, store), seconds in cached.items():
+            times[cell_pos[cell], store_pos[store]] = seconds
+        await _route_missing(times, cell_ids, ids, centroids, store_lat, store_lon)
+
+    missing = np.isnan(times)
+    if missing.any():
+        modelled = travel_time_minutes(haversine_matrix(
+            centroids[:, 0], centroids[:, 1], store_lat, store_lon,
+        )).astype(np.float64) * 60.0
+        times[missing] = modelled[missing]
+    return times
+
+
+async def _route_missing(
+    times: np.ndarray,
+    cell_ids: List[str],
+    store_ids: List[int],
+    centroids: np.ndarray,
+    store_lat: np.ndarray,
+    store_lon: np.ndarray,
+):
+    """Route cache misses in place and persist what OSRM answered"""
+    missing = np.isnan(times)
+    rows = np.flatnonzero(missing.any(axis=1))
+    cols = np.flatnonzero(missing.any(axis=0))
+    if len(rows) == 0:
+        return
+
+    logger.info(f"🛣️ Routing {len(rows):,} cells x {len(cols):,} stores via OSRM")
+    durations, distances = await get_osrm_client().table(
+        centroids[rows, 0], centroids[rows, 1], store_lat[cols], store_lon[cols],
+    )
+    block = np.ix_(rows, cols)
+    routed = missing[block] & ~np.isnan(durations)
+    times[block] = np.where(routed, durations, times[block])
+
+    r, c = np.nonzero(routed)
+    if len(r):
+        distance = distances[r, c]
+        await save_cached_times(
+            [cell_ids[i] for i in rows[r]],
+            [store_ids[j] for j in cols[c]],
+            durations[r, c].tolist(),
+            [None if np.isnan(d) else float(d) for d in distance],
+            [float(store_lat[j]) for j in cols[c]],
+            [float(store_lon[j]) for j in cols[c]],
+        )
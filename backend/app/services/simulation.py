@@ -0,0 +1,242 @@
+"""
+What-if evaluation of new store sites
+
+Keeps a cached baseline of every demand cell's best and second-best existing
+store travel time, stamped with the response-cache data version so every
+worker rebuilds it after an order or store write anywhere. Scoring a hypothetical store only touches the cells inside
+its reachable radius, found through the baseline's KD-tree of cell centroids.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+import asyncio
+import logging
+
+import numpy as np
+
+from app.core.cache import data_version
+from app.core.config import settings
+from app.services.distance import haversine_matrix, reachable_radius_m, travel_time_minutes
+from app.services.optimization import load_demand_points, load_store_points
+from app.services.spatial_index import PointIndex
+
+logger = logging.getLogger(__name__)
+
+# Candidate sites scored per (cells x sites) travel-time block
+SITE_BLOCK = 64
+
+
+@dataclass
+class SimulationBaseline:
+    """Demand cells with their current store travel times"""
+    cells: PointIndex  # centroids, ids are uint64 H3 cells
+    orders_count: np.ndarray
+    total_order_value: np.ndarray
+    best_time: np.ndarray  # minutes to nearest existing store (inf if none)
+    second_time: np.ndarray  # minutes to second-nearest existing store
+    nearest_store: np.ndarray  # store id of nearest store (-1 if none)
+    lookback_days: int
+    stores_count: int
+    version: str  # response-cache data version the baseline was built at
+
+    @property
+    def avg_order_value(self) -> float:
+        total = float(self.orders_count.sum())
+        return float(self.total_order_value.sum()) / total if total else 0.0
+
+
+_baseline: Optional[SimulationBaseline] = None
+_baseline_lock = asyncio.Lock()
+
+
+def build_baseline(demand, stores, lookback_days: int, version: str = "") -> SimulationBaseline:
+    """Compute best/second-best store travel times for each demand cell"""
+    n = len(demand)
+    best = np.full(n, np.inf, dtype=np.float32)
+    second = np.full(n, np.inf, dtype=np.float32)
+    nearest = np.full(n, -1, dtype=np.int64)
+    if len(stores):
+        store_index = PointIndex(stores.id, stores.latitude, stores.longitude)
+        closest, meters = store_index.nearest(demand.latitude, demand.longitude, k=2)
+        best, second = travel_time_minutes(meters.astype(np.float32)).T
+        nearest = stores.id[closest[:, 0]]
+
+    return SimulationBaseline(
+        cells=PointIndex(demand.h3_index, demand.latitude, demand.longitude),
+        orders_count=demand.orders_count.astype(np.float64),
+        total_order_value=demand.total_order_value,
+        best_time=best,
+        second_time=second,
+        nearest_store=nearest,
+        lookback_days=lookback_days,
+        stores_count=len(stores),
+        version=version,
+    )
+
+
+async def get_baseline() -> SimulationBaseline:
+    """Get the cached baseline, rebuilding it once the data version has moved"""
+    global _baseline
+
+    async with _baseline_lock:
+        version = await data_version()
+        if _baseline is None or _baseline.version != version:
+            lookback_days = settings.OPTIMIZATION_LOOKBACK_DAYS
+            end_date = datetime.utcnow()
+            demand = await load_demand_points(end_date - timedelta(days=lookback_days), end_date)
+            stores = await load_store_points()
+            _baseline = build_baseline(demand, stores, lookback_days, version)
+            logger.info(
+                f"🧪 Simulation baseline built: {len(demand):,} cells, {len(stores)} stores"
+            )
+        return _baseline
+
+
+def cells_within(
+    baseline: SimulationBaseline,
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+    radius_m: float,
+) -> np.ndarray:
+    """Positions of cells within radius_m of any of the points"""
+    hits = baseline.cells.within(latitude, longitude, radius_m)
+    return np.unique(np.concatenate(hits)) if hits else np.array([], dtype=np.int64)
+
+
+def roi_months(monthly_revenue: float) -> Optional[float]:
+    """Months to recover setup cost from monthly contribution net of rent"""
+    monthly_profit = monthly_revenue * settings.ORDER_CONTRIBUTION_MARGIN - settings.DEFAULT_STORE_MONTHLY_RENT
+    if monthly_profit <= 0:
+        return None
+    return settings.DEFAULT_STORE_SETUP_COST / monthly_profit
+
+
+def score_sites(
+    baseline: SimulationBaseline,
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+    max_delivery_time_minutes: float,
+) -> List[Dict[str, Any]]:
+    """
+    Evaluate hypothetical stores against the cached baseline in one pass
+
+    Travel times are computed for the (cells x sites) block of cells within
+    the sites' reachable radius only; every metric is then a weighted reduction
+    over boolean masks of that block.
+    """
+    latitude = np.atleast_1d(np.asarray(latitude, dtype=np.float64))
+    longitude = np.atleast_1d(np.asarray(longitude, dtype=np.float64))
+    sla = max_delivery_time_minutes
+    radius_m = reachable_radius_m(sla)
+
+    # Blocks of latitude-sorted sites keep each block's cell window tight
+    order = np.argsort(latitude, kind="stable")
+    results: List[Optional[Dict[str, Any]]] = [None] * len(latitude)
+    for start in range(0, len(order), SITE_BLOCK):
+        sites = order[start:start + SITE_BLOCK]
+        lat, lon = latitude[sites], longitude[sites]
+        cells = cells_within(baseline, lat, lon, radius_m)
+        times = travel_time_minutes(haversine_matrix(
+            baseline.cells.latitude[cells], baseline.cells.longitude[cells], lat, lon,
+        ))
+        for site, metrics in zip(sites, _site_metrics(baseline, cells, times, lat, lon, sla)):
+            results[site] = metrics
+    return results
+
+
+def _site_metrics(
+    baseline: SimulationBaseline,
+    cells: np.ndarray,
+    times: np.ndarray,
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+    sla: float,
+) -> List[Dict[str, Any]]:
+    """Per-site metrics from a (cells x sites) travel-time block"""
+    orders = baseline.orders_count[cells]
+    best = baseline.best_time[cells][:, None]
+    in_sla = times <= sla
+    captured = in_sla & (times < best)
+    newly_covered = in_sla & (best > sla)
+    # New store becomes the backup (second-best) option within SLA where there was none
+    gains_backup = in_sla & ~captured & (baseline.second_time[cells] > sla)[:, None]
+
+    covered_orders = orders @ in_sla
+    captured_orders = orders @ captured
+    newly_covered_orders = orders @ newly_covered
+    improvable = captured & np.isfinite(best)
+    improvement_sum = orders @ np.where(improvable, best - times, 0.0)
+    improvable_orders = orders @ improvable
+
+    # Existing stores losing cells to each site: (sites x stores) membership
+    stores = baseline.nearest_store[cells]
+    store_ids = np.unique(stores[stores >= 0])
+    lost = (captured & ~newly_covered).T.astype(np.float32) @ (
+        stores[:, None] == store_ids[None, :]
+    ).astype(np.float32)
+
+    months = 30.0 / max(baseline.lookback_days, 1)
+    results = []
+    for k in range(times.shape[1]):
+        # Orders existing stores already deliver within the SLA only move between
+        # stores; revenue and ROI count the newly covered ones
+        captured_revenue = float(captured_orders[k]) * baseline.avg_order_value * months
+        monthly_revenue = float(newly_covered_orders[k]) * baseline.avg_order_value * months
+        roi = roi_months(monthly_revenue)
+        results.append({
+            "location": {"latitude": float(latitude[k]), "longitude": float(longitude[k])},
+            "orders_covered": int(round(float(covered_orders[k]) * months)),
+            "orders_captured": int(round(float(captured_orders[k]) * months)),
+            "newly_covered_orders": int(round(float(newly_covered_orders[k]) * months)),
+            "backup_coverage_orders": int(round(float(orders @ gains_backup[:, k]) * months)),
+            "cannibalized_stores": store_ids[lost[k] > 0].tolist(),
+            "avg_delivery_time_improvement": round(
+                float(improvement_sum[k] / improvable_orders[k]) if improvable_orders[k] else 0.0, 2
+            ),
+            "captured_monthly_revenue": round(captured_revenue, 2),
+            "estimated_monthly_revenue": round(monthly_revenue, 2),
+            "estimated_roi_months": round(roi, 1) if roi is not None else None,
+            "cells_evaluated": int(in_sla[:, k].sum()),
+        })
+    return results
+
+
+def score_site(
+    baseline: SimulationBaseline,
+    latitude: float,
+    longitude: float,
+    max_delivery_time_minutes: float,
+) -> Dict[str, Any]:
+    """Evaluate a single hypothetical store against the cached baseline"""
+    return score_sites(baseline, [latitude], [longitude], max_delivery_time_minutes)[0]
+
+
+async def simulate_store(
+    latitude: float,
+    longitude: float,
+    max_delivery_time_minutes: float,
+) -> Dict[str, Any]:
+    """Score a hypothetical store at (latitude, longitude)"""
+    baseline = await get_baseline()
+    return score_site(baseline, latitude, longitude, max_delivery_time_minutes)
+
+
+async def simulate_stores(
+    latitude: List[float],
+    longitude: List[float],
+    max_delivery_time_minutes: float,
+    top_k: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Score many hypothetical stores in one pass, ranked by monthly revenue"""
+    baseline = await get_baseline()
+    results = score_sites(baseline, latitude, longitude, max_delivery_time_minutes)
+    ranked = sorted(
+        enumerate(results),
+        key=lambda item: (item[1]["estimated_monthly_revenue"], item[1]["orders_covered"]),
+        reverse=True,
+    )
+    for rank, (index, result) in enumerate(ranked, 1):
+        result["rank"] = rank
+        result["input_index"] = index
+    ranked_results = [result for _, result in ranked]
+    return ranked_results[:top_k] if top_k else ranked_results
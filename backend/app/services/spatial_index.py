@@ -0,0 +1,164 @@
+"""
+In-process spatial index over active stores
+
+Points are embedded on the unit sphere (x, y, z) and held in KD-trees, so
+k-nearest and within-radius lookups are exact great-circle queries answered
+from memory: a chord of length c spans an arc of 2R·asin(c/2). PointIndex is
+also what simulation and candidate coverage use over demand cells.
+
+The store tree is stamped with the response-cache data version, which every
+store write bumps, so each worker reloads it on the first lookup after a
+change anywhere in the deployment.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import logging
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from app.core.cache import data_version
+from app.core.database import execute_spatial_query
+from app.services.distance import EARTH_RADIUS_M
+
+logger = logging.getLogger(__name__)
+
+
+def unit_xyz(latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+    """Lat/lon degrees to (N, 3) points on the unit sphere"""
+    phi = np.radians(np.asarray(latitude, dtype=np.float64))
+    lam = np.radians(np.asarray(longitude, dtype=np.float64))
+    cos_phi = np.cos(phi)
+    return np.column_stack([cos_phi * np.cos(lam), cos_phi * np.sin(lam), np.sin(phi)])
+
+
+def meters_to_chord(distance_m: float) -> float:
+    return 2.0 * np.sin(min(distance_m / EARTH_RADIUS_M, np.pi) / 2.0)
+
+
+def chord_to_meters(chord: np.ndarray) -> np.ndarray:
+    return 2.0 * EARTH_RADIUS_M * np.arcsin(np.clip(np.asarray(chord) / 2.0, 0.0, 1.0))
+
+
+@dataclass
+class PointIndex:
+    """KD-tree over points keyed by id, with optional per-point weights"""
+    ids: np.ndarray
+    latitude: np.ndarray
+    longitude: np.ndarray
+    weights: Optional[np.ndarray] = None
+    tree: Optional[cKDTree] = field(default=None, repr=False)
+
+    def __post_init__(self):
+        if self.tree is None and len(self.ids):
+            self.tree = cKDTree(unit_xyz(self.latitude, self.longitude))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def nearest(
+        self,
+        latitude: np.ndarray,
+        longitude: np.ndarray,
+        k: int = 1,
+        max_distance_m: Optional[float] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        k nearest points for each query, shape (Q, k)
+
+        Returns (positions, meters); missing neighbours (fewer than k points or
+        beyond max_distance_m) have position -1 and distance inf.
+        """
+        latitude = np.atleast_1d(latitude)
+        positions = np.full((len(latitude), k), -1, dtype=np.int64)
+        distances = np.full((len(latitude), k), np.inf)
+        if not len(self):
+            return positions, distances
+
+        upper = meters_to_chord(max_distance_m) if max_distance_m is not None else np.inf
+        chord, found = self.tree.query(
+            unit_xyz(latitude, np.atleast_1d(longitude)), k=k, distance_upper_bound=upper,
+        )
+        chord, found = chord.reshape(len(latitude), k), found.reshape(len(latitude), k)
+        hit = found < len(self)
+        positions[hit] = found[hit]
+        distances[hit] = chord_to_meters(chord[hit])
+        return positions, distances
+
+    def within(self, latitude: np.ndarray, longitude: np.ndarray, radius_m: float) -> List[np.ndarray]:
+        """Positions of points within radius_m of each query"""
+        latitude = np.atleast_1d(latitude)
+        if not len(self):
+            return [np.array([], dtype=np.int64) for _ in latitude]
+        hits = self.tree.query_ball_point(
+            unit_xyz(latitude, np.atleast_1d(longitude)), meters_to_chord(radius_m),
+        )
+        return [np.asarray(h, dtype=np.int64) for h in hits]
+
+
+@dataclass
+class SpatialIndex:
+    """Active stores as of one data version"""
+    stores: PointIndex
+    store_names: Dict[int, str]
+    version: str
+
+
+_index: Optional[SpatialIndex] = None
+_index_lock = asyncio.Lock()
+
+
+async def load_store_index() -> Tuple[PointIndex, Dict[int, str]]:
+    """Active stores from the database"""
+    rows = await execute_spatial_query(
+        """
+        SELECT id, name, ST_Y(location) AS latitude, ST_X(location) AS longitude
+        FROM stores
+        WHERE is_active = TRUE
+        ORDER BY id
+        """
+    )
+    points = PointIndex(
+        ids=np.array([r["id"] for r in rows], dtype=np.int64),
+        latitude=np.array([r["latitude"] for r in rows], dtype=np.float64),
+        longitude=np.array([r["longitude"] for r in rows], dtype=np.float64),
+    )
+    return points, {r["id"]: r["name"] for r in rows}
+
+
+async def get_spatial_index() -> SpatialIndex:
+    """Get the process-wide index, reloading it when the data version has moved"""
+    global _index
+
+    async with _index_lock:
+        version = await data_version()
+        if _index is None or _index.version != version:
+            stores, names = await load_store_index()
+            _index = SpatialIndex(stores, names, version)
+            logger.info(f"🧭 Spatial index: {len(stores)} stores at data version {version}")
+        return _index
+
+
+async def nearest_stores(
+    latitude: float,
+    longitude: float,
+    k: int = 1,
+    max_distance_m: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """Up to k nearest active stores to a point, closest first"""
+    index = await get_spatial_index()
+    positions, distances = index.stores.nearest(latitude, longitude, k, max_distance_m)
+    results = []
+    for position, distance in zip(positions[0], distances[0]):
+        if position < 0:
+            break
+        store_id = int(index.stores.ids[position])
+        results.append({
+            "store_id": store_id,
+            "name": index.store_names.get(store_id),
+            "latitude": float(index.stores.latitude[position]),
+            "longitude": float(index.stores.longitude[position]),
+            "distance_meters": round(float(distance), 1),
+        })
+    return results
@@ -0,0 +1,120 @@
+"""
+Mapbox Vector Tiles for the map layers
+
+Tiles are encoded in PostGIS with ST_AsMVT, so a request only touches the
+rows intersecting its (buffered) tile envelope through the GiST indexes.
+Geometry is simplified to about one tile pixel at the requested zoom, and
+demand cells collapse to centroids below DEMAND_CELL_POLYGON_MIN_ZOOM where
+individual hexagons are smaller than a pixel anyway.
+"""
+from dataclasses import dataclass
+from typing import Optional
+import math
+
+from app.core.config import settings
+from app.core.database import execute_spatial_query
+
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+
+# Web Mercator world width in meters
+WORLD_SIZE_M = 2 * math.pi * 6378137.0
+
+
+@dataclass(frozen=True)
+class TileLayer:
+    """One MVT layer: its source rows and the properties encoded per feature"""
+    table: str
+    columns: str
+    geometry: str = "t.location"
+    bbox_column: Optional[str] = None  # Indexed column for the envelope test (defaults to geometry)
+    where: str = "TRUE"
+    job_filter: bool = False  # Accepts an optimization job id as $6
+
+
+TILE_LAYERS = {
+    "demand_cells": TileLayer(
+        table="demand_cells t",
+        columns="t.h3_index, t.demand_score, t.orders_count, t.total_order_value, t.peak_hour",
+        geometry=f"""CASE WHEN $1 < {settings.DEMAND_CELL_POLYGON_MIN_ZOOM}
+            THEN ST_Centroid(t.cell_geometry) ELSE t.cell_geometry END""",
+        bbox_column="t.cell_geometry",
+    ),
+    "stores": TileLayer(
+        table="stores t",
+        columns="t.id, t.name, t.is_active, t.capacity",
+    ),
+    "candidates": TileLayer(
+        table="candidates t",
+        columns="""t.id, t.optimization_job_id, t.rank, t.score, t.estimated_orders_covered,
+            t.avg_delivery_time_minutes, t.algorithm""",
+        where="($6::INT IS NULL OR t.optimization_job_id = $6)",
+        job_filter=True,
+    ),
+    "isochrones": TileLayer(
+        table="isochrones t JOIN stores s ON s.id = t.store_id AND s.is_active = TRUE",
+        columns="t.store_id, t.time_minutes, t.area_km2, t.orders_in_zone, t.source",
+        geometry="t.geometry",
+    ),
+}
+
+
+def tile_sql(name: str, layer: TileLayer) -> str:
+    """
+    ST_AsMVT query for a layer
+
+    $1-$3 are z/x/y, $4 the simplification tolerance in meters and $5 the
+    envelope margin as a fraction of the tile.
+    """
+    bbox_column = layer.bbox_column or layer.geometry
+    return f"""
+        WITH bounds AS (
+            SELECT
+                ST_TileEnvelope($1, $2, $3) AS envelope,
+                ST_Transform(ST_TileEnvelope($1, $2, $3, margin => $5), 4326) AS search
+        ),
+        features AS (
+            SELECT
+                {layer.columns},
+                ST_AsMVTGeom(
+                    ST_Simplify(ST_Transform({layer.geometry}, 3857), $4, TRUE),
+                    bounds.envelope,
+                    {settings.TILE_EXTENT},
+                    {settings.TILE_BUFFER},
+                    TRUE
+                ) AS geom
+            FROM {layer.table}, bounds
+            WHERE {bbox_column} && bounds.search
+              AND {layer.where}
+        )
+        SELECT ST_AsMVT(features, '{name}', {settings.TILE_EXTENT}, 'geom') AS tile
+        FROM features
+        WHERE geom IS NOT NULL
+    """
+
+
+TILE_SQL = {name: tile_sql(name, layer) for name, layer in TILE_LAYERS.items()}
+
+
+def validate_tile(layer: str, z: int, x: int, y: int):
+    """Reject unknown layers and coordinates outside the zoom level's grid"""
+    if layer not in TILE_LAYERS:
+        raise ValueError(f"Unknown layer '{layer}', expected one of {', '.join(TILE_LAYERS)}")
+    if not 0 <= z <= settings.TILE_MAX_ZOOM:
+        raise ValueError(f"Zoom must be between 0 and {settings.TILE_MAX_ZOOM}")
+    if not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise ValueError(f"Tile {x}/{y} is outside zoom level {z}")
+
+
+def simplify_tolerance(z: int) -> float:
+    """Size of one tile pixel in Web Mercator meters at zoom z"""
+    return WORLD_SIZE_M / (2 ** z) / settings.TILE_EXTENT
+
+
+async def build_tile(layer: str, z: int, x: int, y: int, job_id: Optional[int] = None) -> bytes:
+    """Encoded MVT for one layer tile (empty bytes when nothing is inside)"""
+    validate_tile(layer, z, x, y)
+    args = [z, x, y, simplify_tolerance(z), settings.TILE_BUFFER / settings.TILE_EXTENT]
+    if TILE_LAYERS[layer].job_filter:
+        args.append(job_id)
+    rows = await execute_spatial_query(TILE_SQL[layer], *args)
+    return bytes(rows[0]["tile"] or b"") if rows else b""
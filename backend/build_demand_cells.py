@@ -0,0 +1,42 @@
+"""
+Rebuild demand_cells from order history in parallel
+Shards orders by H3 parent cell and aggregates the shards across CPU cores
+"""
+import argparse
+import asyncio
+from datetime import datetime
+import os
+import sys
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.cache import bump_data_version, close_cache
+from app.core.database import close_db
+from app.services.demand_build import build_demand_cells
+from app.services.demand_cells import refresh_store_distances
+
+
+async def main(args: argparse.Namespace):
+    """Rebuild demand cells, then their nearest-store distances"""
+    print("🗺️  Rebuilding demand cells...")
+    try:
+        result = await build_demand_cells(args.start_date, args.end_date, args.workers)
+        print(
+            f"✅ {result['cells']} cells from {result['orders']} orders "
+            f"({result['shards']} shards, {result['workers']} workers, {result.get('elapsed_seconds', 0)}s)"
+        )
+        await refresh_store_distances()
+        await bump_data_version()
+        print("✅ Store distances refreshed")
+    finally:
+        await close_cache()
+        await close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--start-date", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--end-date", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--workers", type=int, default=None, help="Processes (default: all cores)")
+    asyncio.run(main(parser.parse_args()))
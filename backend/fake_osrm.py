@@ -0,0 +1,96 @@
+"""
+Local fake OSRM server for development and tests
+Answers /table/v1/driving requests with straight-line times from the speed model,
+enforcing a max table size like osrm-routed so tiling and failures can be exercised
+
+Usage:
+    python fake_osrm.py --port 5000 --max-table-size 100 --fail-rate 0.1
+    OSRM_ENABLED=true OSRM_URL=http://localhost:5000 uvicorn app.main:app
+"""
+import argparse
+import random
+
+import numpy as np
+from aiohttp import web
+
+EARTH_RADIUS_M = 6_371_000.0
+
+
+def parse_indices(value: str, default: range) -> list:
+    if not value or value == "all":
+        return list(default)
+    return [int(i) for i in value.split(";")]
+
+
+def build_app(
+    max_table_size: int = 100,
+    speed_kmh: float = 25.0,
+    detour_factor: float = 1.2,
+    fail_rate: float = 0.0,
+) -> web.Application:
+    """aiohttp app exposing a minimal OSRM table service"""
+    stats = {"requests": 0, "failures": 0}
+
+    async def table(request: web.Request) -> web.Response:
+        stats["requests"] += 1
+        if fail_rate and random.random() < fail_rate:
+            stats["failures"] += 1
+            return web.json_response({"code": "InternalError", "message": "injected failure"}, status=500)
+
+        try:
+            coords = np.array(
+                [[float(v) for v in pair.split(",")] for pair in request.match_info["coords"].split(";")]
+            )
+            sources = parse_indices(request.query.get("sources"), range(len(coords)))
+            destinations = parse_indices(request.query.get("destinations"), range(len(coords)))
+        except ValueError:
+            return web.json_response({"code": "InvalidQuery", "message": "bad coordinates"}, status=400)
+
+        if len(coords) > max_table_size:
+            return web.json_response(
+                {"code": "TooBig", "message": f"{len(coords)} coordinates exceed max-table-size {max_table_size}"},
+                status=400,
+            )
+
+        lon, lat = np.radians(coords[:, 0]), np.radians(coords[:, 1])
+        phi1, phi2 = lat[sources][:, None], lat[destinations][None, :]
+        dlambda = lon[destinations][None, :] - lon[sources][:, None]
+        a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+        distance = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0))) * detour_factor
+        duration = distance / (speed_kmh / 3.6)
+
+        annotations = request.query.get("annotations", "duration").split(",")
+        payload = {"code": "Ok"}
+        if "duration" in annotations:
+            payload["durations"] = np.round(duration, 1).tolist()
+        if "distance" in annotations:
+            payload["distances"] = np.round(distance, 1).tolist()
+        return web.json_response(payload)
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response(stats)
+
+    app = web.Application()
+    app["stats"] = stats
+    app.router.add_get("/table/v1/driving/{coords}", table)
+    app.router.add_get("/health", health)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OSRM table service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--max-table-size", type=int, default=100)
+    parser.add_argument("--speed-kmh", type=float, default=25.0)
+    parser.add_argument("--detour-factor", type=float, default=1.2)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of requests answered with HTTP 500")
+    args = parser.parse_args()
+
+    print(f"🛣️  Fake OSRM on http://{args.host}:{args.port} (max table size {args.max_table_size})")
+    web.run_app(
+        build_app(args.max_table_size, args.speed_kmh, args.detour_factor, args.fail_rate),
+        host=args.host,
+        port=args.port,
+        print=None,
+    )
@@ -0,0 +1,34 @@
+"""
+Convert the orders table to monthly range partitions
+Run once after the first `prisma db push`; safe to re-run (no-op when already partitioned)
+Do not `prisma db push` again afterwards: it would try to recreate the partitioned
+orders table. setup_db.sh skips the push once orders is partitioned; see db/README.md
+"""
+import asyncio
+import os
+import sys
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.database import close_db
+from app.services.partitions import ensure_upcoming_partitions, partition_orders
+
+
+async def main():
+    """Partition orders and pre-create upcoming months"""
+    print("🗂️  Partitioning orders by month...")
+    try:
+        result = await partition_orders()
+        if result["partitioned"]:
+            print(f"✅ Moved {result['rows']} orders into {result['partitions']} monthly partitions")
+        else:
+            print(f"✅ Nothing to do: {result['reason']}")
+        created = await ensure_upcoming_partitions()
+        print(f"✅ Created {created} upcoming monthly partitions")
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -14,6 +14,12 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from prisma import Prisma
 
+from app.core.database import close_db
+from app.services.demand_build import build_demand_cells
+from app.services.demand_cells import refresh_store_distances
+from app.services.demand_cube import refresh_cube
+from app.services.ingest import ingest_rows
+
 
 # Delhi NCR bounding box
 DELHI_LAT_MIN = 28.4
@@ -109,107 +115,62 @@ async def seed_stores(db: Prisma, count: int = 5):
     print(f"✅ Created {count} stores")
 
 
-async def seed_orders(db: Prisma, count: int = 10000):
+def generate_order() -> dict:
+    """Generate a single random order row"""
+    lat, lon = generate_location()
+    timestamp = generate_timestamp()
+    delivery_time = random.randint(5, 45)
+    
+    return {
+        "latitude": lat,
+        "longitude": lon,
+        "timestamp": timestamp,
+        "items_count": random.randint(1, 15),
+        "order_value": round(random.uniform(200, 3000), 2),
+        "customer_id": f"CUST{random.randint(1000, 9999)}",
+        "delivered_at": timestamp + timedelta(minutes=delivery_time),
+        "delivery_time_min": delivery_time,
+        "status": "completed",
+    }
+
+
+async def seed_orders(count: int = 10000):
     """Create historical order data"""
     print(f"📦 Seeding {count} orders...")
     
-    batch_size = 1000
-    for batch_start in range(0, count, batch_size):
-        batch_count = min(batch_size, count - batch_start)
-        values = []
-        
-        for _ in range(batch_count):
-            lat, lon = generate_location()
-            timestamp = generate_timestamp()
-            items_count = random.randint(1, 15)
-            order_value = round(random.uniform(200, 3000), 2)
-            delivery_time = random.randint(5, 45)
-            
-            values.append(
-                f"(ST_SetSRID(ST_MakePoint({lon}, {lat}), 4326), "
-                f"'{timestamp.isoformat()}', {items_count}, {order_value}, "
-                f"'CUST{random.randint(1000, 9999)}', "
-                f"'{(timestamp + timedelta(minutes=delivery_time)).isoformat()}', "
-                f"{delivery_time}, NULL, 'completed', NOW())"
-            )
-        
-        # Batch insert
-        await db.execute_raw(
-            f"""
-            INSERT INTO orders (location, timestamp, items_count, order_value, customer_id, delivered_at, delivery_time_min, store_id, status, created_at)
-            VALUES {', '.join(values)}
-            """
-        )
-        
-        print(f"  ✓ Inserted {batch_start + batch_count}/{count} orders")
+    async def rows():
+        for _ in range(count):
+            yield generate_order()
     
-    print(f"✅ Created {count} orders")
+    # Stream through the COPY-based bulk loader; demand tables are built afterwards
+    report = await ingest_rows(rows(), update_demand=False)
+    
+    print(f"✅ Created {report.rows_inserted} orders ({report.rows_per_second:,.0f} rows/s)")
 
 
-async def seed_demand_cells(db: Prisma):
-    """Generate demand cells from order data"""
+async def seed_demand_cells():
+    """Generate H3 demand cells from order data"""
     print("🗺️  Generating demand cells...")
     
-    # Create a grid of hexagons covering Delhi NCR
-    # Using 0.05 degree cells (~5km)
-    cell_size = 0.05
-    
-    lat_steps = int((DELHI_LAT_MAX - DELHI_LAT_MIN) / cell_size) + 1
-    lon_steps = int((DELHI_LON_MAX - DELHI_LON_MIN) / cell_size) + 1
+    # Shard orders by H3 parent and aggregate the shards in parallel
+    result = await build_demand_cells()
+    total_cells = result["cells"]
     
-    total_cells = 0
-    for i in range(lat_steps):
-        for j in range(lon_steps):
-            lat_min = DELHI_LAT_MIN + i * cell_size
-            lat_max = lat_min + cell_size
-            lon_min = DELHI_LON_MIN + j * cell_size
-            lon_max = lon_min + cell_size
-            
-            # Create polygon for this cell
-            polygon_wkt = f"POLYGON(({lon_min} {lat_min}, {lon_max} {lat_min}, {lon_max} {lat_max}, {lon_min} {lat_max}, {lon_min} {lat_min}))"
-            
-            # Count orders in this cell
-            result = await db.query_raw(
-                f"""
-                SELECT 
-                    COUNT(*) as orders_count,
-                    COALESCE(SUM(order_value), 0) as total_value,
-                    COALESCE(AVG(order_value), 0) as avg_value,
-                    EXTRACT(HOUR FROM timestamp)::INT as peak_hour
-                FROM orders
-                WHERE ST_Within(location, ST_SetSRID(ST_GeomFromText('{polygon_wkt}'), 4326))
-                GROUP BY EXTRACT(HOUR FROM timestamp)
-                ORDER BY COUNT(*) DESC
-                LIMIT 1
-                """
-            )
-            
-            if result and result[0]['orders_count'] > 0:
-                orders_count = result[0]['orders_count']
-                total_value = float(result[0]['total_value'])
-                avg_value = float(result[0]['avg_value'])
-                peak_hour = result[0]['peak_hour']
-                demand_score = min(orders_count / 10.0, 10.0)  # Normalize to 0-10
-                
-                await db.execute_raw(
-                    f"""
-                    INSERT INTO demand_cells (
-                        cell_geometry, demand_score, orders_count, 
-                        total_order_value, avg_order_value, peak_hour,
-                        period_start, period_end, created_at
-                    )
-                    VALUES (
-                        ST_SetSRID(ST_GeomFromText('{polygon_wkt}'), 4326),
-                        {demand_score}, {orders_count}, {total_value}, {avg_value}, {peak_hour},
-                        NOW() - INTERVAL '90 days', NOW(), NOW()
-                    )
-                    """
-                )
-                total_cells += 1
+    # Nearest-store distance for every cell in one vectorized pass
+    await refresh_store_distances()
     
     print(f"✅ Created {total_cells} demand cells with order data")
 
 
+async def seed_demand_cube():
+    """Build the (H3 cell, day, hour) demand cube from order data"""
+    print("🧊 Building demand cube...")
+    
+    result = await refresh_cube()
+    
+    print(f"✅ Aggregated {result['orders']} orders into {result['slices']} cube slices")
+
+
 async def main():
     """Main seeding function"""
     print("🌱 Starting database seeding...\n")
@@ -229,22 +190,25 @@ async def main():
             
             # Clear existing data
             print("🧹 Clearing existing data...")
-            await db.execute_raw("TRUNCATE stores, orders, demand_cells, candidates, optimization_jobs, isochrones CASCADE")
+            await db.execute_raw("TRUNCATE stores, orders, demand_cells, demand_cube, candidates, optimization_jobs, isochrones CASCADE")
         
         # Seed data
         await seed_stores(db, count=5)
-        await seed_orders(db, count=10000)
-        await seed_demand_cells(db)
+        await seed_orders(count=10000)
+        await seed_demand_cells()
+        await seed_demand_cube()
         
         # Print summary
         print("\n📊 Database Summary:")
         stores = await db.query_raw("SELECT COUNT(*) as count FROM stores")
         orders = await db.query_raw("SELECT COUNT(*) as count FROM orders")
         cells = await db.query_raw("SELECT COUNT(*) as count FROM demand_cells")
+        cube = await db.query_raw("SELECT COUNT(*) as count FROM demand_cube")
         
         print(f"  Stores: {stores[0]['count']}")
         print(f"  Orders: {orders[0]['count']}")
         print(f"  Demand Cells: {cells[0]['count']}")
+        print(f"  Demand Cube Slices: {cube[0]['count']}")
         
         print("\n✅ Seeding completed successfully!")
         
@@ -253,6 +217,7 @@ async def main():
         raise
     finally:
         await db.disconnect()
+        await close_db()
 
 
 if __name__ == "__main__":
@@ -58,9 +58,27 @@ prisma generate
 echo -e "${GREEN}✅ Prisma client generated${NC}"
 
 # Step 4: Run migrations
+# Never db push against a partitioned orders table: Prisma cannot model
+# partitioning and would try to recreate or alter it (see db/README.md)
 echo -e "\n${YELLOW}📝 Running database migrations...${NC}"
-prisma db push --skip-generate
-echo -e "${GREEN}✅ Migrations completed${NC}"
+if [ "$IN_DOCKER" = true ]; then
+    ORDERS_KIND=$(PGPASSWORD=smartblink123 psql -h postgres -U smartblink -d smartblink -t -A -c "SELECT relkind FROM pg_class WHERE oid = to_regclass('orders');")
+else
+    ORDERS_KIND=$(PGPASSWORD=smartblink123 psql -h localhost -U smartblink -d smartblink -t -A -c "SELECT relkind FROM pg_class WHERE oid = to_regclass('orders');")
+fi
+
+if [ "$ORDERS_KIND" = "p" ]; then
+    echo -e "${YELLOW}⚠️  orders is partitioned, skipping prisma db push${NC}"
+    echo "  Apply schema changes with a reviewed 'prisma migrate diff' script instead (see db/README.md)"
+else
+    prisma db push --skip-generate
+    echo -e "${GREEN}✅ Migrations completed${NC}"
+fi
+
+# Step 4b: Partition orders by month (Prisma cannot declare partitioned tables)
+echo -e "\n${YELLOW}🗂️  Partitioning orders table...${NC}"
+python partition_orders.py
+echo -e "${GREEN}✅ Orders partitioned${NC}"
 
 # Step 5: Verify tables
 echo -e "\n${YELLOW}🔍 Verifying tables...${NC}"
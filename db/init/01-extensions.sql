@@ -61,6 +61,8 @@ END;
 $$ LANGUAGE plpgsql IMMUTABLE;
 
 -- Helper function: Find nearest store to a given point
+-- KNN (<->) on the geometry GiST index shortlists stores; geodesic distance
+-- is only computed for the shortlist. Hot paths use the API's in-memory index.
 CREATE OR REPLACE FUNCTION find_nearest_store(
     target_lat DOUBLE PRECISION,
     target_lon DOUBLE PRECISION,
@@ -70,28 +72,29 @@ CREATE OR REPLACE FUNCTION find_nearest_store(
     store_name TEXT,
     distance_meters DOUBLE PRECISION
 ) AS $$
+DECLARE
+    target geometry := ST_SetSRID(ST_MakePoint(target_lon, target_lat), 4326);
 BEGIN
     RETURN QUERY
-    SELECT 
-        s.id,
-        s.name,
-        ST_Distance(
-            s.location::geography,
-            ST_SetSRID(ST_MakePoint(target_lon, target_lat), 4326)::geography
-        ) as distance
-    FROM stores s
-    WHERE s.is_active = TRUE
-        AND ST_DWithin(
-            s.location::geography,
-            ST_SetSRID(ST_MakePoint(target_lon, target_lat), 4326)::geography,
-            max_distance_meters
-        )
-    ORDER BY distance
+    SELECT shortlist.id, shortlist.name, shortlist.distance
+    FROM (
+        SELECT 
+            s.id,
+            s.name,
+            ST_Distance(s.location::geography, target::geography) as distance
+        FROM stores s
+        WHERE s.is_active = TRUE
+        ORDER BY s.location <-> target
+        LIMIT 16
+    ) shortlist
+    WHERE shortlist.distance <= max_distance_meters
+    ORDER BY shortlist.distance
     LIMIT 1;
 END;
 $$ LANGUAGE plpgsql STABLE;
 
 -- Helper function: Count orders within radius of a point
+-- The degree bounding box (&&) hits the GiST index before the geodesic check
 CREATE OR REPLACE FUNCTION count_orders_in_radius(
     center_lat DOUBLE PRECISION,
     center_lon DOUBLE PRECISION,
@@ -101,16 +104,20 @@ CREATE OR REPLACE FUNCTION count_orders_in_radius(
 ) RETURNS INTEGER AS $$
 DECLARE
     order_count INTEGER;
+    center geometry := ST_SetSRID(ST_MakePoint(center_lon, center_lat), 4326);
+    box_degrees DOUBLE PRECISION := radius_meters / (111320.0 * GREATEST(cos(radians(center_lat)), 0.01));
 BEGIN
     SELECT COUNT(*) INTO order_count
     FROM orders o
-    WHERE ST_DWithin(
+    WHERE o.location && ST_Expand(center, box_degrees)
+    AND ST_DWithin(
         o.location::geography,
-        ST_SetSRID(ST_MakePoint(center_lon, center_lat), 4326)::geography,
+        center::geography,
         radius_meters
     )
-    AND (start_date IS NULL OR o.timestamp >= start_date)
-    AND (end_date IS NULL OR o.timestamp <= end_date);
+    -- Plain range bounds (not "IS NULL OR") so monthly partitions get pruned
+    AND o.timestamp >= COALESCE(start_date, '-infinity'::TIMESTAMP)
+    AND o.timestamp <= COALESCE(end_date, 'infinity'::TIMESTAMP);
     
     RETURN order_count;
 END;
@@ -130,15 +137,16 @@ DECLARE
     covered_count BIGINT;
 BEGIN
     -- Get total orders in date range
+    -- (LOCALTIMESTAMP matches the TIMESTAMP column type, keeping partition pruning)
     SELECT COUNT(*) INTO total_count
     FROM orders
-    WHERE timestamp >= CURRENT_TIMESTAMP - (date_range_days || ' days')::INTERVAL;
+    WHERE timestamp >= LOCALTIMESTAMP - (date_range_days || ' days')::INTERVAL;
     
     -- Get orders covered by active stores within time threshold
     -- (Simplified: using 833 meters per minute as approximate delivery speed)
     SELECT COUNT(*) INTO covered_count
     FROM orders o
-    WHERE timestamp >= CURRENT_TIMESTAMP - (date_range_days || ' days')::INTERVAL
+    WHERE timestamp >= LOCALTIMESTAMP - (date_range_days || ' days')::INTERVAL
         AND EXISTS (
             SELECT 1 FROM stores s
             WHERE s.is_active = TRUE
@@ -0,0 +1,19 @@
+"""
+Demand clustering on H3-aggregated cells
+
+    from ml.clustering import kmeans_cluster, candidate_sites
+
+    clusters = kmeans_cluster(lat, lon, n_clusters=10, weights=orders_count)
+    sites = candidate_sites(lat, lon, orders_count, n_sites=2000)
+"""
+from ml.clustering.candidates import candidate_sites
+from ml.clustering.hdbscan import HDBSCAN_AVAILABLE, hdbscan_cluster
+from ml.clustering.kmeans import ClusterResult, kmeans_cluster
+
+__all__ = [
+    "ClusterResult",
+    "HDBSCAN_AVAILABLE",
+    "candidate_sites",
+    "hdbscan_cluster",
+    "kmeans_cluster",
+]
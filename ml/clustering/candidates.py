@@ -0,0 +1,50 @@
+"""
+Candidate store sites from demand clustering
+
+Mini-batch KMeans on demand-weighted cells spreads sites across the city in
+proportion to demand; HDBSCAN hotspots then add a site at the core of every
+dense area. Sites are always real demand cells (cluster medoids), so they
+plug straight into the optimizer's candidate set.
+"""
+from typing import Optional
+import logging
+
+import numpy as np
+
+from ml.clustering.hdbscan import HDBSCAN_AVAILABLE, hdbscan_cluster
+from ml.clustering.kmeans import kmeans_cluster
+
+logger = logging.getLogger(__name__)
+
+
+def candidate_sites(
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+    weights: np.ndarray,
+    n_sites: int,
+    refine: bool = True,
+    min_cluster_size: int = 5,
+    random_state: int = 0,
+) -> np.ndarray:
+    """
+    Indices of at most n_sites cells to offer the optimizer as store sites
+
+    When hotspot medoids push the set over n_sites, the KMeans sites with
+    the least demand behind them are dropped first.
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    seeds = kmeans_cluster(latitude, longitude, n_sites, weights, random_state=random_state)
+    sites = seeds.medoids
+    priority = seeds.weights
+
+    if refine and HDBSCAN_AVAILABLE:
+        hotspots = hdbscan_cluster(latitude, longitude, weights, min_cluster_size=min_cluster_size)
+        extra = np.setdiff1d(hotspots.medoids, sites)
+        # Hotspot cores outrank every KMeans site
+        sites = np.concatenate([sites, extra])
+        priority = np.concatenate([priority, np.full(len(extra), np.inf)])
+    elif refine:
+        logger.warning("HDBSCAN unavailable, using KMeans sites only")
+
+    keep = np.argsort(-priority, kind="stable")[:n_sites]
+    return np.unique(sites[keep])
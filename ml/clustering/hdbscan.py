@@ -0,0 +1,70 @@
+"""
+HDBSCAN density refinement of demand cells
+
+HDBSCAN has no sample weights, so density is taken from where demand is:
+cells below `min_cell_orders` are left out and the remaining hot cells are
+clustered by position. Each resulting cluster is a contiguous high-demand
+area of arbitrary shape (a market street, a campus) that KMeans may split
+or straddle. Uses the `hdbscan` package, falling back to
+sklearn.cluster.HDBSCAN (scikit-learn >= 1.3).
+"""
+from typing import Optional
+
+import numpy as np
+
+from ml.clustering.kmeans import ClusterResult
+from ml.clustering.projection import nearest_members, project_meters, unproject
+
+try:
+    from hdbscan import HDBSCAN
+except ImportError:  # optional dependency
+    try:
+        from sklearn.cluster import HDBSCAN
+    except ImportError:
+        HDBSCAN = None
+
+HDBSCAN_AVAILABLE = HDBSCAN is not None
+
+
+def hdbscan_cluster(
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+    weights: Optional[np.ndarray] = None,
+    min_cluster_size: int = 5,
+    min_samples: Optional[int] = None,
+    min_cell_orders: Optional[float] = None,
+) -> ClusterResult:
+    """
+    Density clusters of high-demand cells (-1 labels are noise or cold cells)
+
+    `min_cell_orders` defaults to the median cell weight. Cluster centres are
+    demand-weighted means of their members.
+    """
+    if HDBSCAN is None:
+        raise ImportError("hdbscan or scikit-learn>=1.3 is required for density refinement")
+
+    latitude, longitude = np.asarray(latitude), np.asarray(longitude)
+    weights = np.ones(len(latitude)) if weights is None else np.asarray(weights, dtype=np.float64)
+    threshold = float(np.median(weights)) if min_cell_orders is None else min_cell_orders
+
+    labels = np.full(len(latitude), -1, dtype=np.int64)
+    hot = np.flatnonzero(weights >= threshold)
+    xy, origin = project_meters(latitude, longitude)
+    if len(hot) >= max(min_cluster_size, 2):
+        model = HDBSCAN(min_cluster_size=min_cluster_size, min_samples=min_samples)
+        labels[hot] = model.fit_predict(xy[hot])
+
+    n_clusters = int(labels.max()) + 1
+    clustered = labels >= 0
+    mass = np.bincount(labels[clustered], weights=weights[clustered], minlength=n_clusters)
+    centers = np.column_stack([
+        np.bincount(labels[clustered], weights=weights[clustered] * xy[clustered, axis], minlength=n_clusters)
+        for axis in range(2)
+    ]) / np.maximum(mass, 1e-12)[:, None]
+
+    return ClusterResult(
+        labels=labels,
+        centers=unproject(centers, origin),
+        weights=mass,
+        medoids=nearest_members(xy, labels, centers),
+    )
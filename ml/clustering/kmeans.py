@@ -0,0 +1,121 @@
+"""
+Demand-weighted mini-batch KMeans
+
+Clusters H3-aggregated demand cells rather than raw orders: each cell is one
+point weighted by its order count, so 50k cells stand in for millions of
+orders at the same spatial resolution. Uses scikit-learn's MiniBatchKMeans
+when installed, else a weighted Lloyd's iteration in NumPy.
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from ml.clustering.projection import nearest_members, project_meters, unproject
+
+try:
+    from sklearn.cluster import MiniBatchKMeans
+except ImportError:  # optional dependency
+    MiniBatchKMeans = None
+
+# Points per distance block in the NumPy fallback
+ASSIGN_BLOCK = 4096
+
+
+@dataclass
+class ClusterResult:
+    """Cluster assignment of weighted points"""
+    labels: np.ndarray  # cluster per point, -1 for noise
+    centers: np.ndarray  # (K, 2) weighted centres as lat/lon
+    weights: np.ndarray  # total point weight per cluster
+    medoids: np.ndarray  # index of the point nearest each centre
+
+    @property
+    def n_clusters(self) -> int:
+        return len(self.centers)
+
+
+def _assign(xy: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    labels = np.empty(len(xy), dtype=np.int64)
+    center_sq = np.sum(centers ** 2, axis=1)
+    for start in range(0, len(xy), ASSIGN_BLOCK):
+        block = xy[start:start + ASSIGN_BLOCK]
+        labels[start:start + ASSIGN_BLOCK] = np.argmin(center_sq - 2 * block @ centers.T, axis=1)
+    return labels
+
+
+def _weighted_lloyd(
+    xy: np.ndarray,
+    weights: np.ndarray,
+    n_clusters: int,
+    max_iter: int,
+    rng: np.random.Generator,
+) -> np.ndarray:
+    """Weighted KMeans centres; seeds sampled proportionally to weight"""
+    seeds = rng.choice(len(xy), size=n_clusters, replace=False, p=weights / weights.sum())
+    centers = xy[seeds].copy()
+    for _ in range(max_iter):
+        labels = _assign(xy, centers)
+        mass = np.bincount(labels, weights=weights, minlength=n_clusters)
+        moved = np.column_stack([
+            np.bincount(labels, weights=weights * xy[:, axis], minlength=n_clusters)
+            for axis in range(2)
+        ])
+        filled = mass > 0
+        updated = centers.copy()
+        updated[filled] = moved[filled] / mass[filled, None]
+        if np.allclose(updated, centers, atol=1.0):
+            return updated
+        centers = updated
+    return centers
+
+
+def kmeans_cluster(
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+    n_clusters: int,
+    weights: Optional[np.ndarray] = None,
+    batch_size: int = 4096,
+    max_iter: int = 50,
+    random_state: int = 0,
+) -> ClusterResult:
+    """
+    Cluster points (e.g. demand cell centroids) weighted by demand
+
+    Centres are pulled toward heavy cells, so busy areas get more, tighter
+    clusters. Empty clusters are dropped.
+    """
+    weights = np.ones(len(latitude)) if weights is None else np.asarray(weights, dtype=np.float64)
+    n_clusters = min(n_clusters, int(np.count_nonzero(weights > 0)))
+    if n_clusters <= 0:
+        empty = np.array([], dtype=np.int64)
+        return ClusterResult(np.full(len(latitude), -1), np.zeros((0, 2)), np.array([]), empty)
+
+    xy, origin = project_meters(np.asarray(latitude), np.asarray(longitude))
+    if MiniBatchKMeans is not None:
+        model = MiniBatchKMeans(
+            n_clusters=n_clusters,
+            batch_size=batch_size,
+            max_iter=max_iter,
+            n_init=1,
+            random_state=random_state,
+        )
+        model.fit(xy, sample_weight=weights)
+        centers = model.cluster_centers_
+    else:
+        centers = _weighted_lloyd(xy, weights, n_clusters, max_iter, np.random.default_rng(random_state))
+
+    labels = _assign(xy, centers)
+    mass = np.bincount(labels, weights=weights, minlength=len(centers))
+
+    # Drop empty clusters and renumber the rest densely
+    keep = mass > 0
+    remap = np.cumsum(keep) - 1
+    labels, centers, mass = remap[labels], centers[keep], mass[keep]
+
+    return ClusterResult(
+        labels=labels,
+        centers=unproject(centers, origin),
+        weights=mass,
+        medoids=nearest_members(xy, labels, centers),
+    )
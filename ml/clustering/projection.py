@@ -0,0 +1,45 @@
+"""
+Local planar projection for clustering
+
+Clustering runs on city-scale extents, where an equirectangular projection
+around the data's mean latitude keeps Euclidean distances within a fraction
+of a percent of the geodesic ones.
+"""
+from typing import Tuple
+
+import numpy as np
+
+EARTH_RADIUS_M = 6_371_008.8
+
+
+def project_meters(latitude: np.ndarray, longitude: np.ndarray) -> Tuple[np.ndarray, Tuple[float, float]]:
+    """(N, 2) x/y meters around the mean point, plus that origin (lat, lon)"""
+    lat0, lon0 = float(np.mean(latitude)), float(np.mean(longitude))
+    x = np.radians(longitude - lon0) * np.cos(np.radians(lat0)) * EARTH_RADIUS_M
+    y = np.radians(latitude - lat0) * EARTH_RADIUS_M
+    return np.column_stack([x, y]), (lat0, lon0)
+
+
+def unproject(xy: np.ndarray, origin: Tuple[float, float]) -> np.ndarray:
+    """Inverse of project_meters: (N, 2) x/y meters -> (N, 2) lat/lon"""
+    lat0, lon0 = origin
+    latitude = lat0 + np.degrees(xy[:, 1] / EARTH_RADIUS_M)
+    longitude = lon0 + np.degrees(xy[:, 0] / (EARTH_RADIUS_M * np.cos(np.radians(lat0))))
+    return np.column_stack([latitude, longitude])
+
+
+def nearest_members(xy: np.ndarray, labels: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    """
+    For each cluster label 0..K-1, the index of its member closest to targets[label]
+
+    Used to snap weighted cluster centres back onto real demand cells.
+    """
+    members = np.flatnonzero(labels >= 0)
+    d2 = np.sum((xy[members] - targets[labels[members]]) ** 2, axis=1)
+    # Sort by (label, distance); the first row of each label is its closest member
+    order = np.lexsort((d2, labels[members]))
+    sorted_labels = labels[members][order]
+    first = np.flatnonzero(np.r_[True, np.diff(sorted_labels) != 0])
+    result = np.full(len(targets), -1, dtype=np.int64)
+    result[sorted_labels[first]] = members[order][first]
+    return result